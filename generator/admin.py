@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Faculty, Subject, Room, Division, TimeSlot, TimetableEntry
+from .models import Faculty, Subject, Room, Division, TimeSlot, TimetableEntry, SubjectRequirement, ExportJob
 
 admin.site.register(Faculty)
 admin.site.register(Subject)
@@ -11,3 +11,14 @@ admin.site.register(TimeSlot)
 class TimetableEntryAdmin(admin.ModelAdmin):
     list_display = ('day', 'timeslot', 'division', 'subject', 'faculty', 'room')
     list_filter = ('day', 'division', 'faculty', 'room')
+
+@admin.register(SubjectRequirement)
+class SubjectRequirementAdmin(admin.ModelAdmin):
+    list_display = ('division', 'subject', 'faculty', 'hours_per_week')
+    list_filter = ('division__timetable', 'faculty')
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'timetable', 'status', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
\ No newline at end of file
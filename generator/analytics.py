@@ -0,0 +1,217 @@
+"""
+Utilisation, idle gap, load balance and coverage reports on NumPy arrays.
+
+``TimetableArrays`` reads a timetable's entries with one query into flat
+arrays (day, lecture position, division, subject, faculty, room, hours) and
+a day × lecture × division grid of faculty and room ids. Every report is
+then a handful of vectorised operations (bincount over combined keys,
+boolean occupancy cubes) instead of a query or a Python loop per faculty
+member, room or division.
+
+Lecture positions number the teaching slots of a day in lecture order, so
+breaks never count as idle gaps.
+"""
+import numpy as np
+
+from .models import Division, SubjectRequirement, TimeSlot, TimetableEntry, day_timeslots
+
+DAY_CODES = [code for code, _ in TimeSlot.DAY_CHOICES]
+
+
+def _hours(timeslot):
+    start = timeslot.start_time.hour * 60 + timeslot.start_time.minute
+    end = timeslot.end_time.hour * 60 + timeslot.end_time.minute
+    return max(end - start, 0) / 60
+
+
+def _compact(ids):
+    """Dense 0..n-1 codes for ``ids``, with the distinct ids in order."""
+    unique, codes = np.unique(ids, return_inverse=True)
+    return unique, codes.reshape(-1)
+
+
+def _stats(values):
+    if not len(values):
+        return {'mean': 0, 'std': 0, 'min': 0, 'max': 0, 'cv': 0}
+    mean = float(values.mean())
+    std = float(values.std())
+    return {
+        'mean': round(mean, 2), 'std': round(std, 2),
+        'min': round(float(values.min()), 2), 'max': round(float(values.max()), 2),
+        'cv': round(std / mean, 3) if mean else 0,
+    }
+
+
+class TimetableArrays:
+    def __init__(self, timetable):
+        self.timetable = timetable
+        timeslots = list(TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number'))
+        self.divisions = list(Division.objects.filter(timetable=timetable).order_by('id').values_list('id', 'name'))
+
+        # Position of each teaching slot within its day, and its length in hours
+        position, hours = {}, {}
+        self.slots_per_day = np.zeros(len(DAY_CODES), dtype=np.int32)
+        for d, day in enumerate(DAY_CODES):
+            teaching = [ts for ts in day_timeslots(timeslots, day) if not ts.is_break]
+            self.slots_per_day[d] = len(teaching)
+            for i, ts in enumerate(teaching):
+                position[(day, ts.id)] = i
+                hours[ts.id] = _hours(ts)
+        self.width = int(self.slots_per_day.max())
+
+        division_index = {pk: i for i, (pk, _) in enumerate(self.divisions)}
+        rows = [
+            row for row in TimetableEntry.objects.filter(timetable=timetable).values_list(
+                'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id',
+                'subject__code', 'faculty__initials', 'room__number',
+            )
+            if (row[0], row[1]) in position and row[2] in division_index
+        ]
+        self.labels = {'subject': {}, 'faculty': {}, 'room': {}}
+        for row in rows:
+            for kind, pk, label in zip(('subject', 'faculty', 'room'), row[3:6], row[6:]):
+                if pk is not None:
+                    self.labels[kind][pk] = label
+
+        count = len(rows)
+        self.day = np.fromiter((DAY_CODES.index(row[0]) for row in rows), dtype=np.int32, count=count)
+        self.slot = np.fromiter((position[(row[0], row[1])] for row in rows), dtype=np.int32, count=count)
+        self.division = np.fromiter((division_index[row[2]] for row in rows), dtype=np.int32, count=count)
+        # 0 stands for an empty subject, faculty or room
+        self.subject = np.fromiter((row[3] or 0 for row in rows), dtype=np.int64, count=count)
+        self.faculty = np.fromiter((row[4] or 0 for row in rows), dtype=np.int64, count=count)
+        self.room = np.fromiter((row[5] or 0 for row in rows), dtype=np.int64, count=count)
+        self.hours = np.fromiter((hours[row[1]] for row in rows), dtype=np.float64, count=count)
+
+    @property
+    def teaching_slots(self):
+        return int(self.slots_per_day.sum())
+
+    def grid(self, kind):
+        """day × lecture position × division array of ``kind`` ids, 0 where the cell is empty."""
+        grid = np.zeros((len(DAY_CODES), self.width, len(self.divisions)), dtype=np.int64)
+        grid[self.day, self.slot, self.division] = getattr(self, kind)
+        return grid
+
+    def _occupancy(self, kind):
+        """Distinct ``kind`` ids, their codes per entry, and a resource × day × position busy cube."""
+        booked = getattr(self, kind) != 0
+        ids, codes = _compact(getattr(self, kind)[booked])
+        # At least one position, so argmax works on timetables without timeslots
+        busy = np.zeros((len(ids), len(DAY_CODES), max(self.width, 1)), dtype=bool)
+        busy[codes, self.day[booked], self.slot[booked]] = True
+        return ids, codes, booked, busy
+
+    def room_utilisation(self):
+        """Share of each day's teaching slots every room is booked, busiest rooms first."""
+        ids, codes, booked, busy = self._occupancy('room')
+        per_day = busy.sum(axis=2)
+        slots = np.maximum(self.slots_per_day, 1)
+        daily = per_day / slots
+        week = per_day.sum(axis=1) / max(self.teaching_slots, 1)
+        order = np.lexsort((ids, -week))
+        return [
+            {
+                'id': int(ids[i]), 'label': self.labels['room'].get(int(ids[i]), ''),
+                'lectures': int(per_day[i].sum()),
+                'per_day': [round(float(value) * 100, 1) for value in daily[i]],
+                'week': round(float(week[i]) * 100, 1),
+            }
+            for i in order
+        ]
+
+    def faculty_load(self):
+        """Weekly lectures, hours, teaching days and idle gaps of each faculty member, busiest first."""
+        ids, codes, booked, busy = self._occupancy('faculty')
+        hours = np.bincount(codes, weights=self.hours[booked], minlength=len(ids))
+        lectures = busy.sum(axis=2)
+        teaching = lectures > 0
+        # Free positions between the first and last lecture of each day
+        first = busy.argmax(axis=2)
+        last = busy.shape[2] - 1 - busy[:, :, ::-1].argmax(axis=2)
+        gaps = np.where(teaching, last - first + 1 - lectures, 0)
+        order = np.lexsort((ids, -hours))
+        return [
+            {
+                'id': int(ids[i]), 'label': self.labels['faculty'].get(int(ids[i]), ''),
+                'lectures': int(lectures[i].sum()), 'hours': round(float(hours[i]), 2),
+                'days': int(teaching[i].sum()), 'max_per_day': int(lectures[i].max()),
+                'gaps': int(gaps[i].sum()), 'gaps_per_day': [int(value) for value in gaps[i]],
+            }
+            for i in order
+        ]
+
+    def coverage(self):
+        """Scheduled against required lectures of each division's subjects, from SubjectRequirement."""
+        division_index = {pk: i for i, (pk, _) in enumerate(self.divisions)}
+        requirements = [
+            (division_index[division_id], subject_id, required, code)
+            for division_id, subject_id, required, code in SubjectRequirement.objects.filter(
+                division__timetable=self.timetable).values_list(
+                'division_id', 'subject_id', 'hours_per_week', 'subject__code')
+        ]
+        for _, subject_id, _, code in requirements:
+            self.labels['subject'].setdefault(subject_id, code)
+
+        booked = self.subject != 0
+        required_subjects = np.fromiter((row[1] for row in requirements), dtype=np.int64, count=len(requirements))
+        subjects, codes = _compact(np.concatenate([self.subject[booked], required_subjects]))
+        width = len(subjects)
+        scheduled = np.bincount(self.division[booked] * width + codes[:booked.sum()],
+                                minlength=len(self.divisions) * width).reshape(len(self.divisions), width)
+        required = np.zeros_like(scheduled)
+        if requirements:
+            division_codes = np.fromiter((row[0] for row in requirements), dtype=np.int64, count=len(requirements))
+            np.add.at(required, (division_codes, codes[booked.sum():]),
+                      np.fromiter((row[2] for row in requirements), dtype=np.int64, count=len(requirements)))
+
+        report = []
+        for i, (division_id, name) in enumerate(self.divisions):
+            listed = np.flatnonzero((scheduled[i] > 0) | (required[i] > 0))
+            total_required = int(required[i].sum())
+            # Lectures beyond a subject's requirement do not make up for another's shortfall
+            covered = int(np.minimum(scheduled[i], required[i]).sum())
+            report.append({
+                'id': division_id, 'label': name,
+                'required': total_required, 'scheduled': int(scheduled[i].sum()),
+                'percent': round(covered / total_required * 100, 1) if total_required else None,
+                'subjects': [
+                    {
+                        'id': int(subjects[j]), 'label': self.labels['subject'].get(int(subjects[j]), ''),
+                        'required': int(required[i, j]), 'scheduled': int(scheduled[i, j]),
+                    }
+                    for j in listed
+                ],
+            })
+        return report
+
+    def balance(self, faculty=None):
+        """Spread of faculty hours, and of lectures per day across each division's week."""
+        faculty = self.faculty_load() if faculty is None else faculty
+        per_day = np.zeros((len(self.divisions), len(DAY_CODES)), dtype=np.int64)
+        np.add.at(per_day, (self.division, self.day), 1)
+        open_days = self.slots_per_day > 0
+        return {
+            'faculty_hours': _stats(np.array([row['hours'] for row in faculty], dtype=np.float64)),
+            'faculty_gaps': _stats(np.array([row['gaps'] for row in faculty], dtype=np.float64)),
+            'division_lectures_per_day': _stats(per_day[:, open_days].ravel().astype(np.float64)),
+        }
+
+    def report(self):
+        faculty = self.faculty_load()
+        cells = self.teaching_slots * len(self.divisions)
+        return {
+            'timetable': self.timetable.id,
+            'version': self.timetable.version,
+            'days': DAY_CODES,
+            'summary': {
+                'divisions': len(self.divisions),
+                'teaching_slots': self.teaching_slots,
+                'entries': int(len(self.day)),
+                'fill': round(len(self.day) / cells * 100, 1) if cells else 0,
+            },
+            'rooms': self.room_utilisation(),
+            'faculty': faculty,
+            'coverage': self.coverage(),
+            'balance': self.balance(faculty),
+        }
@@ -0,0 +1,219 @@
+"""
+Read-only JSON API.
+
+The grid is encoded column-wise: every table (divisions, timeslots, entries,
+and the subjects, faculty and rooms the entries use) is an object of equal
+length arrays rather than a list of per-row objects. Grid and entry responses
+carry an ETag and Last-Modified taken from the timetable's version, so a
+client polling an unchanged timetable gets a 304 after a single query.
+
+Lists use keyset pagination: ``?after=<id>&limit=<n>`` and a ``next`` link,
+so deep pages cost the same as the first one.
+
+``available/`` lists the faculty and rooms free in one slot of a timetable,
+for the entry form to grey out the busy ones.
+"""
+import json
+
+from django.core.exceptions import BadRequest
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from . import cache as render_cache
+from .models import Division, Faculty, Room, TimeSlot, Timetable, TimetableEntry, availability_bit
+from .occupancy import OccupancyIndex
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _int_param(request, name, default=None):
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number.")
+
+
+def keyset_page(request, queryset, serialize, descending=False):
+    """One page of ``queryset`` ordered by id, starting after ``?after=``."""
+    limit = min(max(_int_param(request, 'limit', DEFAULT_LIMIT), 1), MAX_LIMIT)
+    after = _int_param(request, 'after')
+    if after is not None:
+        queryset = queryset.filter(id__lt=after) if descending else queryset.filter(id__gt=after)
+    rows = list(queryset.order_by('-id' if descending else 'id')[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1]['id'] if isinstance(rows[-1], dict) else rows[-1].id
+        next_url = f"{request.path}?{params.urlencode()}"
+    return JsonResponse({'results': [serialize(row) for row in rows], 'next': next_url})
+
+
+def columns(rows, fields):
+    return {field: [row[i] for row in rows] for i, field in enumerate(fields)}
+
+
+def _timetable_dict(timetable):
+    return {
+        'id': timetable.id,
+        'name': timetable.name,
+        'is_active': timetable.is_active,
+        'version': timetable.version,
+        'created_at': timetable.created_at.isoformat(),
+        'modified_at': timetable.modified_at.isoformat(),
+    }
+
+
+def _version(request, timetable_id):
+    # Shared by the ETag and Last-Modified checks, so a 304 costs one query
+    if not hasattr(request, '_timetable_version'):
+        request._timetable_version = Timetable.objects.filter(id=timetable_id).values_list(
+            'version', 'modified_at').first()
+    return request._timetable_version
+
+
+def _etag(kind):
+    def etag(request, timetable_id):
+        version = _version(request, timetable_id)
+        return f"{timetable_id}-{version[0]}-{kind}" if version else None
+    return etag
+
+
+def _last_modified(request, timetable_id):
+    version = _version(request, timetable_id)
+    return version[1] if version else None
+
+
+def _revalidate(view):
+    # Let clients keep responses but check the ETag before every reuse
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, no_cache=True)
+        return response
+    return wrapper
+
+
+@require_GET
+def timetables(request):
+    queryset = Timetable.objects.only('id', 'name', 'is_active', 'version', 'created_at', 'modified_at')
+    return keyset_page(request, queryset, _timetable_dict, descending=True)
+
+
+@require_GET
+def timetable_detail(request, timetable_id):
+    return JsonResponse(_timetable_dict(get_object_or_404(Timetable, id=timetable_id)))
+
+
+def grid_data(timetable):
+    divisions = list(Division.objects.filter(timetable=timetable).order_by('id').values_list('id', 'name'))
+    timeslots = [
+        (pk, day, number, start.strftime('%H:%M'), end.strftime('%H:%M'), is_break)
+        for pk, day, number, start, end, is_break in TimeSlot.objects.filter(timetable=timetable)
+        .order_by('lecture_number', 'id')
+        .values_list('id', 'day', 'lecture_number', 'start_time', 'end_time', 'is_break')
+    ]
+    entries = list(
+        TimetableEntry.objects.filter(timetable=timetable).order_by('id').values_list(
+            'id', 'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id',
+            'subject__code', 'faculty__initials', 'room__number',
+        )
+    )
+    # Labels of the subjects, faculty and rooms in use, taken from the entry rows
+    subjects, faculty, rooms = {}, {}, {}
+    for row in entries:
+        for table, pk, label in ((subjects, row[4], row[7]), (faculty, row[5], row[8]), (rooms, row[6], row[9])):
+            if pk is not None:
+                table[pk] = label
+    return {
+        'timetable': timetable.id,
+        'version': timetable.version,
+        'days': [code for code, _ in TimeSlot.DAY_CHOICES],
+        'divisions': columns(divisions, ('id', 'name')),
+        'timeslots': columns(timeslots, ('id', 'day', 'lecture_number', 'start', 'end', 'is_break')),
+        'entries': columns(entries, ('id', 'day', 'timeslot', 'division', 'subject', 'faculty', 'room')),
+        'subjects': columns(sorted(subjects.items()), ('id', 'code')),
+        'faculty': columns(sorted(faculty.items()), ('id', 'initials')),
+        'rooms': columns(sorted(rooms.items()), ('id', 'number')),
+    }
+
+
+@require_GET
+@_revalidate
+@condition(etag_func=_etag('grid'), last_modified_func=_last_modified)
+def timetable_grid(request, timetable_id):
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    # Cached already encoded, so repeat requests skip serialisation too
+    body = render_cache.get_or_render(timetable, 'grid.json', lambda: json.dumps(grid_data(timetable)))
+    return HttpResponse(body, content_type='application/json')
+
+
+@require_GET
+@_revalidate
+@condition(etag_func=_etag('entries'), last_modified_func=_last_modified)
+def timetable_entries(request, timetable_id):
+    get_object_or_404(Timetable, id=timetable_id)
+    queryset = TimetableEntry.objects.filter(timetable_id=timetable_id).values(
+        'id', 'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id')
+    return keyset_page(request, queryset, lambda row: row)
+
+
+@require_GET
+def available_resources(request, timetable_id):
+    """
+    Faculty and rooms free in ``?day=&timeslot=`` of the timetable, from its
+    cached occupancy bitmaps and the faculty's unavailable_slots. With
+    ``?entry=``, that entry's own faculty member and room count as free.
+    """
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    day = request.GET.get('day')
+    if day not in dict(TimeSlot.DAY_CHOICES):
+        raise BadRequest("Unknown day.")
+    timeslot = TimeSlot.objects.filter(timetable=timetable, id=_int_param(request, 'timeslot')).first()
+    if timeslot is None or timeslot.is_break or timeslot.day not in (None, day):
+        raise BadRequest("No lecture at that timeslot on that day.")
+    index = OccupancyIndex.for_timetable(timetable)
+    own = {}
+    entry_id = _int_param(request, 'entry')
+    if entry_id is not None:
+        own = TimetableEntry.objects.filter(timetable=timetable, id=entry_id, day=day, timeslot=timeslot).values(
+            'faculty_id', 'room_id').first() or {}
+    busy = {kind: index.busy_ids(kind, day, timeslot.id) - {own.get(f'{kind}_id')} for kind in ('faculty', 'room')}
+
+    bit = availability_bit(day, timeslot.lecture_number)
+    faculty = [
+        {'id': pk, 'label': initials}
+        for pk, initials, unavailable in Faculty.objects.order_by('initials', 'id').values_list(
+            'id', 'initials', 'unavailable_slots')
+        if pk not in busy['faculty'] and (bit is None or not (unavailable >> bit) & 1)
+    ]
+    rooms = [
+        {'id': pk, 'label': number}
+        for pk, number in Room.objects.order_by('number', 'id').values_list('id', 'number')
+        if pk not in busy['room']
+    ]
+    return JsonResponse({'day': day, 'timeslot': timeslot.id, 'faculty': faculty, 'rooms': rooms})
+
+
+@require_GET
+def faculty_list(request):
+    return keyset_page(request, Faculty.objects.values('id', 'name', 'initials'), lambda row: row)
+
+
+@require_GET
+def room_list(request):
+    return keyset_page(request, Room.objects.values('id', 'number', 'capacity'), lambda row: row)
+
+
+@require_GET
+def division_list(request):
+    queryset = Division.objects.values('id', 'timetable_id', 'name', 'strength')
+    timetable_id = _int_param(request, 'timetable')
+    if timetable_id is not None:
+        queryset = queryset.filter(timetable_id=timetable_id)
+    return keyset_page(request, queryset, lambda row: row)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class GeneratorConfig(AppConfig):
     name = "generator"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,165 @@
+"""
+Saving many grid cells in one request.
+
+A changeset is a list of cells, each a (day, timeslot, division) with the
+subject, faculty and room it should hold; a cell with none of them is
+emptied. The whole changeset is checked in one pass, with the checks
+``TimetableEntryForm`` makes for a single entry, against an occupancy index
+of the entries it leaves untouched, so edits may also clash with each other.
+It is then written with one delete and one bulk_create in a transaction, or
+not at all if any cell is invalid.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+
+from .models import Division, Faculty, Room, Subject, TimeSlot, TimetableEntry, day_timeslots
+from .occupancy import OccupancyIndex
+from .signals import batched_writes
+
+DAY_CODES = [code for code, _ in TimeSlot.DAY_CHOICES]
+MAX_CHANGES = 5000
+
+ChangesetResult = namedtuple('ChangesetResult', ['created', 'updated', 'deleted', 'errors'])
+
+_Change = namedtuple('_Change', ['index', 'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id'])
+
+
+def _parse(index, change):
+    """The change as a _Change, or None if it is not a cell."""
+    if not isinstance(change, dict) or change.get('day') not in DAY_CODES:
+        return None
+    values = []
+    for field in ('timeslot', 'division', 'subject', 'faculty', 'room'):
+        value = change.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return None
+        values.append(value)
+    if values[0] is None or values[1] is None:
+        return None
+    return _Change(index, change['day'], *values)
+
+
+class _Changeset:
+    def __init__(self, timetable, changes):
+        self.timetable = timetable
+        self.errors = []
+        self.changes = []
+        for index, change in enumerate(changes):
+            parsed = _parse(index, change)
+            if parsed is None:
+                self.error(index, None, "Not a cell: give day, timeslot and division, and ids or null.")
+            else:
+                self.changes.append(parsed)
+
+        timeslots = list(TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number'))
+        self.timeslot_ids = [ts.id for ts in timeslots]
+        self.lectures = {
+            (day, ts.id): ts.lecture_number
+            for day in DAY_CODES for ts in day_timeslots(timeslots, day) if not ts.is_break
+        }
+        self.divisions = dict(Division.objects.filter(timetable=timetable).values_list('id', 'name'))
+        self.entries = {
+            (row[1], row[2], row[3]): row
+            for row in TimetableEntry.objects.filter(timetable=timetable).values_list(
+                'id', 'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id')
+        }
+
+        def wanted(field):
+            return {getattr(change, field) for change in self.changes} - {None}
+
+        self.subjects = set(Subject.objects.filter(id__in=wanted('subject_id')).values_list('id', flat=True))
+        self.faculty = {
+            faculty.id: faculty
+            for faculty in Faculty.objects.filter(id__in=wanted('faculty_id')).only('initials', 'unavailable_slots')
+        }
+        self.rooms = dict(Room.objects.filter(id__in=wanted('room_id')).values_list('id', 'number'))
+
+    def error(self, index, field, message):
+        self.errors.append({'cell': index, 'field': field, 'message': message})
+
+    def check(self):
+        """Validate every change; returns the changes that alter a cell."""
+        keys = set()
+        for change in self.changes:
+            key = (change.day, change.timeslot_id, change.division_id)
+            if key in keys:
+                self.error(change.index, None, "This cell is changed twice.")
+            keys.add(key)
+
+        # Entries the changeset does not touch, as they are after saving
+        untouched = [
+            (row[0], row[1], row[2], row[3], row[5], row[6])
+            for key, row in self.entries.items() if key not in keys
+        ]
+        index = OccupancyIndex(self.timetable, timeslots=self.timeslot_ids, entries=untouched)
+        altered = []
+        for change in self.changes:
+            where = (change.day, change.timeslot_id)
+            lecture = self.lectures.get(where)
+            if lecture is None:
+                self.error(change.index, 'timeslot', "There is no lecture at this time on this day.")
+                continue
+            if change.division_id not in self.divisions:
+                self.error(change.index, 'division', "No such division in this timetable.")
+                continue
+            if change.subject_id is not None and change.subject_id not in self.subjects:
+                self.error(change.index, 'subject', "No such subject.")
+            faculty = self.faculty.get(change.faculty_id)
+            if change.faculty_id is not None and faculty is None:
+                self.error(change.index, 'faculty', "No such faculty member.")
+            if change.room_id is not None and change.room_id not in self.rooms:
+                self.error(change.index, 'room', "No such room.")
+
+            at = f"on {change.day}, lecture {lecture}"
+            if faculty and not faculty.is_available(change.day, lecture):
+                self.error(change.index, 'faculty', f"{faculty.initials} is not available {at}.")
+            busy = index.conflicts(*where, None, change.faculty_id, change.room_id)
+            if 'faculty' in busy:
+                self.error(change.index, 'faculty', f"{faculty.initials} is already teaching {at}.")
+            if 'room' in busy:
+                self.error(change.index, 'room', f"Room {self.rooms[change.room_id]} is already booked {at}.")
+            index.book(*where, None, change.faculty_id, change.room_id)
+
+            row = self.entries.get((change.day, change.timeslot_id, change.division_id))
+            if (row[4:] if row else (None, None, None)) != change[4:]:
+                altered.append(change)
+        return altered
+
+
+def apply_changeset(timetable, changes, dry_run=False):
+    """
+    Validate ``changes`` (dicts of day, timeslot, division, subject, faculty
+    and room ids) and, unless there are errors or ``dry_run``, save them.
+    Errors are dicts of the cell's position in ``changes``, the field at
+    fault (or None) and a message.
+    """
+    with transaction.atomic():
+        changeset = _Changeset(timetable, changes)
+        altered = changeset.check()
+        if changeset.errors:
+            return ChangesetResult(0, 0, 0, sorted(changeset.errors, key=lambda error: error['cell']))
+
+        removed, saved = [], []
+        for change in altered:
+            row = changeset.entries.get((change.day, change.timeslot_id, change.division_id))
+            if row:
+                removed.append(row[0])
+            if change.subject_id is not None or change.faculty_id is not None or change.room_id is not None:
+                saved.append(TimetableEntry(
+                    id=row[0] if row else None, timetable=timetable,
+                    day=change.day, timeslot_id=change.timeslot_id, division_id=change.division_id,
+                    subject_id=change.subject_id, faculty_id=change.faculty_id, room_id=change.room_id,
+                ))
+        updated = sum(1 for entry in saved if entry.id is not None)
+        result = ChangesetResult(len(saved) - updated, updated, len(removed) - updated, [])
+        if dry_run or not altered:
+            return result
+        # Edited rows are deleted and inserted again with the same ids: the
+        # unique constraints would reject updates that trade a faculty member
+        # or room between two cells of a slot partway through
+        with batched_writes(timetable.id):
+            if removed:
+                TimetableEntry.objects.filter(id__in=removed).delete()
+            TimetableEntry.objects.bulk_create(saved)
+    return result
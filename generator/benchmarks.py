@@ -0,0 +1,288 @@
+"""
+Benchmarks of the main pages on synthetic departments.
+
+``build_department`` creates a timetable of any size with bulk inserts, and
+``run_benchmarks`` times the grid view, the exports, adding an entry through
+the validating form and creating a timetable through setup. Each case is run
+through the test client and reports SQL queries, wall time and peak Python
+memory. Peak memory is measured on a separate run, as tracemalloc slows the
+code it watches.
+"""
+import datetime
+import multiprocessing
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from . import cache as render_cache
+from .instrumentation import percentile
+from .forms import TimetableEntryForm
+from .grid import TimetableGrid
+from .models import Division, Faculty, Room, Subject, TimeSlot, Timetable, TimetableEntry
+from .services import create_timetable_structure, default_pattern
+from .signals import bump_version
+
+DAY_CODES = [code for code, _ in TimeSlot.DAY_CHOICES]
+
+
+def build_department(divisions=50, lectures=10, faculty=200, rooms=None, subjects=20, fill=0.9, seed=0):
+    """
+    Create an active timetable with ``divisions`` divisions and ``lectures``
+    lectures a day, and book about ``fill`` of its cells without clashes.
+    """
+    rooms = rooms or divisions * 2
+    if faculty < divisions or rooms < divisions:
+        raise ValueError("Need at least as many faculty members and rooms as divisions.")
+    rnd = random.Random(seed)
+
+    before = lectures // 2
+    timetable = create_timetable_structure(
+        [f"D{i + 1}" for i in range(divisions)],
+        datetime.time(8, 0), 60, default_pattern(before, lectures - before, 30),
+        name=f"Benchmark {divisions}x{lectures}",
+    )
+    faculty_ids = [f.id for f in Faculty.objects.bulk_create(
+        [Faculty(name=f"Benchmark Faculty {i}", initials=f"BF{i}") for i in range(faculty)])]
+    room_ids = [r.id for r in Room.objects.bulk_create([Room(number=f"BR{i}") for i in range(rooms)])]
+    subject_ids = [s.id for s in Subject.objects.bulk_create(
+        [Subject(name=f"Benchmark Subject {i}", code=f"BS{i}") for i in range(subjects)])]
+
+    division_ids = list(Division.objects.filter(timetable=timetable).values_list('id', flat=True))
+    slot_ids = list(TimeSlot.objects.filter(timetable=timetable, is_break=False).values_list('id', flat=True))
+    entries = []
+    for day in DAY_CODES:
+        for slot_id in slot_ids:
+            # Distinct faculty and rooms within a slot keep the grid clash-free
+            teachers = rnd.sample(faculty_ids, divisions)
+            places = rnd.sample(room_ids, divisions)
+            for i, division_id in enumerate(division_ids):
+                if rnd.random() < fill:
+                    entries.append(TimetableEntry(
+                        timetable=timetable, day=day, timeslot_id=slot_id, division_id=division_id,
+                        subject_id=rnd.choice(subject_ids), faculty_id=teachers[i], room_id=places[i],
+                    ))
+    TimetableEntry.objects.bulk_create(entries, batch_size=2000)
+    bump_version(timetable.id)
+    timetable.refresh_from_db()
+    return timetable
+
+
+def free_cells(timetable):
+    """(day, timeslot_id, division_id, faculty_id, room_id) for empty cells with a free faculty member and room."""
+    used = {}
+    taken = set()
+    for day, slot_id, division_id, faculty_id, room_id in TimetableEntry.objects.filter(
+            timetable=timetable).values_list('day', 'timeslot_id', 'division_id', 'faculty_id', 'room_id'):
+        taken.add((day, slot_id, division_id))
+        used.setdefault((day, slot_id), set()).update((('f', faculty_id), ('r', room_id)))
+    faculty_ids = list(Faculty.objects.values_list('id', flat=True))
+    room_ids = list(Room.objects.values_list('id', flat=True))
+    division_ids = list(Division.objects.filter(timetable=timetable).values_list('id', flat=True))
+    slot_ids = list(TimeSlot.objects.filter(timetable=timetable, is_break=False).values_list('id', flat=True))
+    for day in DAY_CODES:
+        for slot_id in slot_ids:
+            busy = used.setdefault((day, slot_id), set())
+            for division_id in division_ids:
+                if (day, slot_id, division_id) in taken:
+                    continue
+                faculty_id = next((f for f in faculty_ids if ('f', f) not in busy), None)
+                room_id = next((r for r in room_ids if ('r', r) not in busy), None)
+                if faculty_id and room_id:
+                    busy.update((('f', faculty_id), ('r', room_id)))
+                    yield day, slot_id, division_id, faculty_id, room_id
+
+
+def measure(action, runs=5, setup=None):
+    """Run ``action`` ``runs`` times, plus once under tracemalloc, and summarise."""
+    times, queries = [], []
+    for _ in range(runs):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            action()
+            times.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        action()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'runs': runs,
+        'wall_ms': {
+            'min': round(min(times), 2),
+            'median': round(statistics.median(times), 2),
+            'max': round(max(times), 2),
+        },
+        'queries': max(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise AssertionError(f"GET {url} returned {response.status_code}")
+    if response.streaming:
+        b''.join(response.streaming_content)
+
+
+def run_benchmarks(timetable, runs=5):
+    client = Client()
+    clear_cache = render_cache.get_render_cache().clear
+    results = {}
+
+    page = f"/timetable/{timetable.id}/"
+    results['timetable_view'] = measure(lambda: _get(client, page), runs, setup=clear_cache)
+    results['timetable_view_cached'] = measure(lambda: _get(client, page), runs)
+    results['export_excel'] = measure(lambda: _get(client, f"/export/excel/{timetable.id}/"), runs, setup=clear_cache)
+    results['export_excel_divisions'] = measure(
+        lambda: _get(client, f"/export/excel/{timetable.id}/?layout=divisions"), runs)
+    results['export_pdf'] = measure(lambda: _get(client, f"/export/pdf/{timetable.id}/"), runs, setup=clear_cache)
+
+    cells = free_cells(timetable)
+
+    def add_entry():
+        day, slot_id, division_id, faculty_id, room_id = next(cells)
+        response = client.post('/add/', {
+            'day': day, 'timeslot': slot_id, 'division': division_id,
+            'subject': Subject.objects.values_list('id', flat=True).first(),
+            'faculty': faculty_id, 'room': room_id,
+        })
+        if response.status_code != 302:
+            raise AssertionError("Adding an entry to a free cell was rejected.")
+    results['add_entry'] = measure(add_entry, runs)
+
+    names = ', '.join(Division.objects.filter(timetable=timetable).values_list('name', flat=True))
+    lectures = TimeSlot.objects.filter(timetable=timetable, is_break=False).count()
+
+    def setup():
+        response = client.post('/setup/', {
+            'divisions': names, 'start_time': '08:00', 'slot_duration': 60, 'break_duration': 30,
+            'slots_before_break': lectures // 2, 'slots_after_break': lectures - lectures // 2,
+        })
+        if response.status_code != 302:
+            raise AssertionError("Setup was rejected.")
+    results['setup'] = measure(setup, runs)
+    Timetable.objects.filter(is_active=True).update(is_active=False)
+    Timetable.objects.filter(id=timetable.id).update(is_active=True)
+    return results
+
+
+def _load_worker(kind, timetable_id, cells, subject_id, duration, start, queue):
+    def read():
+        TimetableGrid(Timetable.objects.get(id=timetable_id))
+
+    def write(cell):
+        day, slot_id, division_id, faculty_id, room_id = cell
+        active = Timetable.objects.get(id=timetable_id)
+        form = TimetableEntryForm({
+            'day': day, 'timeslot': slot_id, 'division': division_id,
+            'subject': subject_id, 'faculty': faculty_id, 'room': room_id,
+        }, timetable=active)
+        if not form.is_valid():
+            raise AssertionError(f"Free cell rejected: {form.errors.as_text()}")
+        entry = form.save(commit=False)
+        entry.timetable = active
+        entry.save()
+        entry.delete()
+
+    times, errors = [], 0
+    try:
+        start.wait()
+        deadline = time.perf_counter() + duration
+        i = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if kind == 'read':
+                    read()
+                else:
+                    write(cells[i % len(cells)])
+            except OperationalError:
+                # "database is locked" and the like
+                errors += 1
+            else:
+                times.append((time.perf_counter() - started) * 1000)
+            i += 1
+    finally:
+        connections.close_all()
+        queue.put((kind, times, errors))
+
+
+def _summary(times, errors, duration):
+    times.sort()
+    return {
+        'ops': len(times),
+        'ops_per_s': round(len(times) / duration, 1),
+        'p50_ms': round(percentile(times, 50), 2) if times else None,
+        'p99_ms': round(percentile(times, 99), 2) if times else None,
+        'max_ms': round(times[-1], 2) if times else None,
+        'errors': errors,
+    }
+
+
+def run_load_test(timetable, readers=8, writers=2, duration=5.0):
+    """
+    Load the grid in ``readers`` processes while ``writers`` processes add and
+    remove entries the way ``add_entry`` does, for ``duration`` seconds.
+
+    Workers are forked processes, like the workers of an application server;
+    threads would share one interpreter lock and hide the database's own
+    locking. Each opens its own connection with the current settings.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise ValueError("The load test needs the fork start method.")
+    cells = list(free_cells(timetable))
+    if len(cells) < writers:
+        raise ValueError("Not enough free cells for the writers.")
+    subject_id = Subject.objects.values_list('id', flat=True).first()
+
+    context = multiprocessing.get_context('fork')
+    start = context.Barrier(readers + writers)
+    queue = context.Queue()
+    # Writers get disjoint cells, so their adds never clash with each other
+    jobs = [('read', []) for _ in range(readers)] + [('write', cells[w::writers]) for w in range(writers)]
+    connections.close_all()
+    processes = [
+        context.Process(target=_load_worker, args=(kind, timetable.id, own, subject_id, duration, start, queue))
+        for kind, own in jobs
+    ]
+    for process in processes:
+        process.start()
+    results = {'read': ([], 0), 'write': ([], 0)}
+    for _ in processes:
+        kind, times, errors = queue.get()
+        results[kind] = (results[kind][0] + times, results[kind][1] + errors)
+    for process in processes:
+        process.join()
+    return {kind: _summary(times, errors, duration) for kind, (times, errors) in results.items()}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
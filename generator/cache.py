@@ -0,0 +1,130 @@
+"""
+Render cache for timetable pages and exports.
+
+Rendered output is keyed by timetable id plus ``Timetable.version``. The
+version is bumped by the signal handlers in ``generator.signals`` whenever
+anything that shows up in the grid changes, so stale output is never looked
+up again and simply ages out of the backend.
+
+Configured through the ``TIMETABLE_RENDER_CACHE`` setting::
+
+    # bounded in-process LRU (default)
+    TIMETABLE_RENDER_CACHE = {'BACKEND': 'lru', 'MAX_ENTRIES': 128}
+
+    # any cache from settings.CACHES (locmem, file, ...)
+    TIMETABLE_RENDER_CACHE = {'BACKEND': 'django', 'ALIAS': 'default', 'TIMEOUT': None}
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class LRUCache:
+    """Thread-safe, size-bounded in-process cache."""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+
+class DjangoCache:
+    """Adapter over one of the caches configured in settings.CACHES."""
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, value):
+        caches[self.alias].set(key, value, self.timeout)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+    async def aget(self, key):
+        return await caches[self.alias].aget(key)
+
+    async def aset(self, key, value):
+        await caches[self.alias].aset(key, value, self.timeout)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_render_cache():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'TIMETABLE_RENDER_CACHE', {})
+                if config.get('BACKEND', 'lru') == 'django':
+                    _backend = DjangoCache(config.get('ALIAS', 'default'), config.get('TIMEOUT'))
+                else:
+                    _backend = LRUCache(config.get('MAX_ENTRIES', 128))
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_render_cache(setting, **kwargs):
+    global _backend
+    if setting == 'TIMETABLE_RENDER_CACHE':
+        _backend = None
+
+
+def render_key(timetable, kind):
+    return f'timetable:{timetable.pk}:v{timetable.version}:{kind}'
+
+
+def get_or_render(timetable, kind, render):
+    """Return the cached output of ``render()`` for this timetable version."""
+    cache = get_render_cache()
+    key = render_key(timetable, kind)
+    value = cache.get(key)
+    if value is None:
+        value = render()
+        cache.set(key, value)
+    return value
+
+
+async def aget_or_render(timetable, kind, render):
+    """Async get_or_render(); ``render`` is a coroutine function."""
+    cache = get_render_cache()
+    key = render_key(timetable, kind)
+    value = await cache.aget(key)
+    if value is None:
+        value = await render()
+        await cache.aset(key, value)
+    return value
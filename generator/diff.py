@@ -0,0 +1,93 @@
+"""
+Cell-by-cell comparison of two timetables.
+
+Cells are matched by (day, lecture number, division name), since the two
+timetables have their own timeslot and division rows. One timetable's
+entries are indexed in a dict and the other's are matched against it as they
+stream in, so each entry set is read once, by one query.
+"""
+from collections import namedtuple
+
+from .models import Division, TimeSlot, TimetableEntry
+
+DAY_ORDER = {code: i for i, (code, _) in enumerate(TimeSlot.DAY_CHOICES)}
+
+CellChange = namedtuple('CellChange', ['status', 'day', 'lecture_number', 'division', 'old', 'new'])
+
+
+class CellValue(namedtuple('CellValue', [
+    'subject_id', 'faculty_id', 'room_id', 'subject_code', 'faculty_initials', 'room_number',
+])):
+    __slots__ = ()
+
+    @property
+    def label(self):
+        return ' / '.join(part for part in (self.subject_code, self.faculty_initials, self.room_number) if part)
+
+
+def _cells(timetable):
+    rows = TimetableEntry.objects.filter(timetable=timetable).order_by('id').values_list(
+        'day', 'timeslot__lecture_number', 'division__name',
+        'subject_id', 'faculty_id', 'room_id', 'subject__code', 'faculty__initials', 'room__number',
+    )
+    for day, lecture_number, division, *value in rows.iterator():
+        yield (day, lecture_number, division), CellValue(*value[:3], *(label or '' for label in value[3:]))
+
+
+class TimetableDiff:
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+
+        before = {}
+        for key, value in _cells(old):
+            before.setdefault(key, value)
+
+        self.changes = []
+        seen = set()
+        for key, value in _cells(new):
+            if key in seen:
+                continue
+            seen.add(key)
+            previous = before.pop(key, None)
+            if previous is None:
+                self.changes.append(CellChange('added', *key, None, value))
+            elif previous[:3] != value[:3]:
+                self.changes.append(CellChange('changed', *key, previous, value))
+        self.changes.extend(CellChange('removed', *key, value, None) for key, value in before.items())
+        self.changes.sort(key=lambda c: (DAY_ORDER.get(c.day, 99), c.lecture_number, c.division))
+
+        old_divisions = set(Division.objects.filter(timetable=old).values_list('name', flat=True))
+        new_divisions = set(Division.objects.filter(timetable=new).values_list('name', flat=True))
+        self.divisions_added = sorted(new_divisions - old_divisions)
+        self.divisions_removed = sorted(old_divisions - new_divisions)
+
+    def counts(self):
+        counts = {'added': 0, 'removed': 0, 'changed': 0}
+        for change in self.changes:
+            counts[change.status] += 1
+        return counts
+
+    def as_dict(self):
+        def cell(value):
+            if value is None:
+                return None
+            return {
+                'subject': value.subject_code, 'faculty': value.faculty_initials, 'room': value.room_number,
+                'subject_id': value.subject_id, 'faculty_id': value.faculty_id, 'room_id': value.room_id,
+            }
+
+        return {
+            'old': {'id': self.old.id, 'name': self.old.name, 'version': self.old.version},
+            'new': {'id': self.new.id, 'name': self.new.name, 'version': self.new.version},
+            'counts': self.counts(),
+            'divisions_added': self.divisions_added,
+            'divisions_removed': self.divisions_removed,
+            'changes': [
+                {
+                    'status': c.status, 'day': c.day, 'lecture_number': c.lecture_number, 'division': c.division,
+                    'old': cell(c.old), 'new': cell(c.new),
+                }
+                for c in self.changes
+            ],
+        }
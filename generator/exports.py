@@ -0,0 +1,144 @@
+import io
+
+import openpyxl
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+
+from .grid import TimetableGrid
+
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PDF_CONTENT_TYPE = 'application/pdf'
+
+
+def _slot_label(slot):
+    return f"{slot.start_time.strftime('%H:%M')} - {slot.end_time.strftime('%H:%M')}"
+
+
+def safe_title(title):
+    """``title`` with the characters Excel forbids in sheet titles replaced, cut to its 31 characters."""
+    return ''.join('_' if ch in '[]:*?/\\' else ch for ch in title)[:31]
+
+
+def sheet_title(timetable):
+    """Worksheet title '<id> <name>'; the id keeps it unique within Excel's 31 characters."""
+    return safe_title(f"{timetable.id} {timetable.name}")
+
+
+def append_grid_sheet(wb, grid, title="Timetable"):
+    """Add the department grid of one timetable as a sheet of a write-only workbook."""
+    ws = wb.create_sheet(safe_title(title))
+
+    # Headers
+    ws.append(["Day", "Slot"] + [d.name for d in grid.divisions])
+
+    # Data
+    for day, slot, cells in grid.rows():
+        row = [day, _slot_label(slot)]
+        if slot.is_break:
+            row.append("BREAK")
+        else:
+            row.extend(cell.label() if cell else "" for cell in cells)
+        ws.append(row)
+    # Finish the sheet now so its XML writer is released before the next one
+    ws.close()
+
+
+def write_excel(grid, fileobj):
+    """Write the grid as a single-sheet workbook into fileobj."""
+    # Write-only workbooks stream rows to disk instead of keeping cell objects
+    wb = openpyxl.Workbook(write_only=True)
+    append_grid_sheet(wb, grid)
+    wb.save(fileobj)
+
+
+def write_division_excel(grid, fileobj):
+    """Write one sheet per division, each listing its lectures for the week."""
+    wb = openpyxl.Workbook(write_only=True)
+    for i, division in enumerate(grid.divisions):
+        ws = wb.create_sheet(safe_title(f"{i + 1} {division.name}"))
+        ws.append(["Day", "Slot", "Subject", "Faculty", "Room"])
+        for day, slot, cells in grid.rows():
+            if slot.is_break:
+                ws.append([day, _slot_label(slot), "BREAK"])
+            elif cells[i]:
+                ws.append([day, _slot_label(slot), cells[i].subject_code, cells[i].faculty_initials, cells[i].room_number])
+            else:
+                ws.append([day, _slot_label(slot)])
+        ws.close()
+    wb.save(fileobj)
+
+
+def write_schedule_excel(schedule, fileobj, title="Timetable"):
+    """Write the week of one faculty member, room or division (a ResourceSchedule)."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(safe_title(title))
+    ws.append(["Day", "Slot", "Subject", "Faculty", "Room", "Division"])
+    for day, _, slots in schedule.rows():
+        for slot, cell in slots:
+            if slot.is_break:
+                ws.append([day, _slot_label(slot), "BREAK"])
+            elif cell:
+                ws.append([day, _slot_label(slot), cell.subject_code, cell.faculty_initials, cell.room_number,
+                           cell.division_name])
+            else:
+                ws.append([day, _slot_label(slot)])
+    wb.save(fileobj)
+
+
+def write_timetables_excel(timetables, fileobj):
+    """
+    Write one sheet per timetable.
+
+    Only one grid is held in memory at a time and the write-only workbook
+    spools finished sheets to disk, so memory stays flat as the count grows.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    for timetable in timetables:
+        append_grid_sheet(wb, TimetableGrid(timetable), sheet_title(timetable))
+    if not wb.worksheets:
+        wb.create_sheet("Timetable").append(["Day", "Slot"])
+    wb.save(fileobj)
+
+
+def write_pdf(grid, fileobj):
+    """Write the grid as a landscape PDF table into fileobj."""
+    doc = SimpleDocTemplate(fileobj, pagesize=landscape(letter))
+
+    # Headers
+    data = [["Day", "Time"] + [d.name for d in grid.divisions]]
+
+    # Data
+    for day, slot, cells in grid.rows():
+        row = [day, f"{slot.start_time.strftime('%H:%M')}-{slot.end_time.strftime('%H:%M')}"]
+        if slot.is_break:
+            row.extend(["BREAK"] * len(cells))
+        else:
+            row.extend(cell.label() if cell else "-" for cell in cells)
+        data.append(row)
+
+    # Table Styling
+    t = Table(data)
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.grey),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0,0), (-1,0), 12),
+        ('BACKGROUND', (0,1), (-1,-1), colors.beige),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+        ('FONTSIZE', (0,0), (-1,-1), 8),
+    ]))
+    doc.build([t])
+
+
+def render_excel(grid):
+    buffer = io.BytesIO()
+    write_excel(grid, buffer)
+    return buffer.getvalue()
+
+
+def render_pdf(grid):
+    buffer = io.BytesIO()
+    write_pdf(grid, buffer)
+    return buffer.getvalue()
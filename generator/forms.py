@@ -1,10 +1,13 @@
 from django import forms
-from .models import TimetableEntry, TimeSlot, Division, Subject, Faculty, Room
+from .models import TimetableEntry, TimeSlot, Division, Subject, Faculty, Room, Timetable
+from .occupancy import OccupancyIndex
+from .services import default_pattern, parse_day_patterns, parse_pattern
 
 class TimetableEntryForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         timetable = kwargs.pop('timetable', None)
         super().__init__(*args, **kwargs)
+        self.timetable = timetable
         if timetable:
             self.fields['timeslot'].queryset = TimeSlot.objects.filter(timetable=timetable)
             self.fields['division'].queryset = Division.objects.filter(timetable=timetable)
@@ -12,6 +15,44 @@ class TimetableEntryForm(forms.ModelForm):
             self.fields['timeslot'].queryset = TimeSlot.objects.none()
             self.fields['division'].queryset = Division.objects.none()
 
+    def clean(self):
+        cleaned_data = super().clean()
+        day = cleaned_data.get('day')
+        timeslot = cleaned_data.get('timeslot')
+        if not self.timetable or not day or not timeslot:
+            return cleaned_data
+
+        if timeslot.is_break:
+            raise forms.ValidationError("Entries cannot be placed in a break slot.")
+        if timeslot.day and timeslot.day != day:
+            self.add_error('timeslot', f"This lecture only exists on {timeslot.get_day_display()}.")
+
+        faculty = cleaned_data.get('faculty')
+        if faculty and not faculty.is_available(day, timeslot.lecture_number):
+            self.add_error('faculty', f"{faculty} is not available at this time.")
+
+        exclude = None
+        if self.instance.pk:
+            exclude = (self.instance.day, self.instance.timeslot_id, self.instance.division_id,
+                       self.instance.faculty_id, self.instance.room_id)
+        division = cleaned_data.get('division')
+        room = cleaned_data.get('room')
+        index = OccupancyIndex.for_timetable(self.timetable)
+        busy = index.conflicts(
+            day, timeslot.id,
+            division_id=division.id if division else None,
+            faculty_id=faculty.id if faculty else None,
+            room_id=room.id if room else None,
+            exclude=exclude,
+        )
+        if 'division' in busy:
+            self.add_error('division', f"{division} already has a lecture at this time.")
+        if 'faculty' in busy:
+            self.add_error('faculty', f"{faculty} is already teaching at this time.")
+        if 'room' in busy:
+            self.add_error('room', f"Room {room} is already booked at this time.")
+        return cleaned_data
+
     class Meta:
         model = TimetableEntry
         fields = ['day', 'timeslot', 'division', 'subject', 'faculty', 'room']
@@ -35,3 +76,81 @@ class SetupForm(forms.Form):
     slots_before_break = forms.IntegerField(label="Lectures before break", initial=2, widget=forms.NumberInput(attrs={'class': 'form-control'}))
     slots_after_break = forms.IntegerField(label="Lectures after break", initial=2, widget=forms.NumberInput(attrs={'class': 'form-control'}))
 
+    # Anything other than one break: a pattern like "2, B, 2, B15, 1" (B = break,
+    # optionally with its minutes), plus optional patterns for individual days.
+    pattern = forms.CharField(label="Lecture/break pattern (optional, e.g. 2, B, 2, B15, 1)", required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': '2, B, 2'}))
+    day_patterns = forms.CharField(label="Per-day patterns (optional, one per line, e.g. SAT: 3, B30, 1)", required=False, widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'SAT: 3, B30, 1'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        break_duration = cleaned_data.get('break_duration')
+        if break_duration is None:
+            return cleaned_data
+        try:
+            if cleaned_data.get('pattern'):
+                cleaned_data['blocks'] = parse_pattern(cleaned_data['pattern'], break_duration)
+            elif cleaned_data.get('slots_before_break') is not None and cleaned_data.get('slots_after_break') is not None:
+                cleaned_data['blocks'] = default_pattern(
+                    cleaned_data['slots_before_break'], cleaned_data['slots_after_break'], break_duration)
+        except ValueError as e:
+            self.add_error('pattern', str(e))
+        try:
+            cleaned_data['day_blocks'] = parse_day_patterns(cleaned_data.get('day_patterns', ''), break_duration)
+        except ValueError as e:
+            self.add_error('day_patterns', str(e))
+        return cleaned_data
+
+class GenerateForm(forms.Form):
+    clear_existing = forms.BooleanField(label="Clear existing entries first", required=False)
+    time_limit = forms.IntegerField(label="Search time limit (Seconds)", initial=10, min_value=1, max_value=120, widget=forms.NumberInput(attrs={'class': 'form-control'}))
+
+class RepairForm(forms.Form):
+    faculty = forms.ModelChoiceField(label="Faculty member no longer available", queryset=Faculty.objects.order_by('name'), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    days = forms.MultipleChoiceField(label="On these days", choices=TimeSlot.DAY_CHOICES, required=False, widget=forms.CheckboxSelectMultiple)
+    lectures = forms.CharField(label="Lectures (e.g. 1, 2, 5; blank for the whole day)", required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': '1, 2'}))
+    room = forms.ModelChoiceField(label="Room taken out of use", queryset=Room.objects.order_by('number'), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    mark_unavailable = forms.BooleanField(
+        label="Also mark these lectures unavailable for the faculty member in every timetable", required=False)
+    dry_run = forms.BooleanField(label="Only preview the moves", required=False)
+
+    def __init__(self, *args, **kwargs):
+        self.timetable = kwargs.pop('timetable')
+        super().__init__(*args, **kwargs)
+
+    def clean_lectures(self):
+        try:
+            return sorted({int(part) for part in self.cleaned_data['lectures'].split(',') if part.strip()})
+        except ValueError:
+            raise forms.ValidationError("Give lecture numbers separated by commas.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        faculty = cleaned_data.get('faculty')
+        if not faculty and not cleaned_data.get('room'):
+            raise forms.ValidationError("Choose a faculty member, a room or both.")
+        if faculty and not cleaned_data.get('days'):
+            self.add_error('days', "Choose the days the faculty member is away.")
+        lectures = cleaned_data.get('lectures')
+        if faculty and lectures == []:
+            lectures = sorted(set(TimeSlot.objects.filter(timetable=self.timetable, is_break=False)
+                                  .values_list('lecture_number', flat=True)))
+        cleaned_data['blocked'] = [(day, n) for day in cleaned_data.get('days', []) for n in lectures or []]
+        return cleaned_data
+
+class HistoryFilterForm(forms.Form):
+    name = forms.CharField(label="Name contains", required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Search by name'}))
+    created_from = forms.DateField(label="Created from", required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    created_to = forms.DateField(label="Created to", required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        created_from, created_to = cleaned_data.get('created_from'), cleaned_data.get('created_to')
+        if created_from and created_to and created_from > created_to:
+            self.add_error('created_to', "The end date is before the start date.")
+        return cleaned_data
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label="Exported .xlsx workbook or .csv file", widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.xlsx,.csv'}))
+    timetable = forms.ModelChoiceField(label="Import into (optional for all-timetables workbooks and CSVs naming timetables)", queryset=Timetable.objects.order_by('-created_at'), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    dry_run = forms.BooleanField(label="Only validate, do not import", required=False)
+    clear = forms.BooleanField(label="Replace existing entries", required=False)
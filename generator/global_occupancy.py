@@ -0,0 +1,129 @@
+"""
+Faculty and room bookings across every active timetable.
+
+Faculty and rooms are shared by all timetables, but each timetable only
+checks clashes within itself. ``GlobalOccupancy`` reads the bookings of all
+active timetables with one grouped query per resource type and keeps, for
+each (resource, day), a bitmask with one bit per minute of the day. As
+timetables may use different slot times, bookings are compared by the time
+they cover rather than by lecture number: whether a faculty member or room
+is free for an interval is one ``&``, and overlapping bookings from different
+timetables are reported as clashes.
+
+The index is cached per set of (active timetable, version) pairs, so it is
+rebuilt only after one of them changes.
+"""
+import datetime
+from collections import defaultdict, namedtuple
+
+from django.db.models import Count
+
+from .cache import LRUCache
+from .models import Faculty, Room, TimeSlot, Timetable, TimetableEntry, availability_bit
+
+KINDS = ('faculty', 'room')
+LABEL_FIELDS = {'faculty': 'initials', 'room': 'number'}
+
+# bookings are (timetable_id, start, end) tuples
+GlobalClash = namedtuple('GlobalClash', ['kind', 'resource_id', 'day', 'bookings'])
+
+_indexes = LRUCache(max_entries=4)
+
+
+def minute(value):
+    return value.hour * 60 + value.minute
+
+
+def interval_mask(start, end):
+    """Bits of the minutes from ``start`` up to, not including, ``end`` (datetime.time)."""
+    first, last = minute(start), minute(end)
+    return ((1 << max(last - first, 0)) - 1) << first
+
+
+class GlobalOccupancy:
+    def __init__(self, timetables):
+        self.timetables = {pk: name for pk, name, _ in timetables}
+        # {kind: {day: {resource_id: minute bitmask}}}
+        self.masks = {kind: defaultdict(lambda: defaultdict(int)) for kind in KINDS}
+        self.clashes = []
+        for kind in KINDS:
+            self._load(kind)
+
+    @classmethod
+    def current(cls):
+        """The index for the active timetables as they are now."""
+        timetables = tuple(Timetable.objects.filter(is_active=True).order_by('id').values_list('id', 'name', 'version'))
+        key = tuple((pk, version) for pk, _, version in timetables)
+        index = _indexes.get(key)
+        if index is None:
+            index = cls(timetables)
+            _indexes.set(key, index)
+        return index
+
+    def _load(self, kind):
+        # Lectures of one timetable in the same resource and time collapse
+        # into one row; clashes inside a timetable are its own clash report's job
+        rows = (
+            TimetableEntry.objects.filter(timetable_id__in=self.timetables, **{f'{kind}__isnull': False})
+            .values_list(f'{kind}_id', 'day', 'timeslot__start_time', 'timeslot__end_time', 'timetable_id')
+            .annotate(lectures=Count('id'))
+            .order_by(f'{kind}_id', 'day', 'timeslot__start_time', 'timetable_id')
+        )
+        masks = self.masks[kind]
+        group, group_key, group_end = [], None, None
+        for resource_id, day, start, end, timetable_id, _ in rows:
+            masks[day][resource_id] |= interval_mask(start, end)
+            # Sorted by start, so a booking starting before the group's latest
+            # end overlaps the group
+            if (resource_id, day) == group_key and start < group_end:
+                group.append((timetable_id, start, end))
+                group_end = max(group_end, end)
+                continue
+            self._add_clash(kind, group_key, group)
+            group, group_key, group_end = [(timetable_id, start, end)], (resource_id, day), end
+        self._add_clash(kind, group_key, group)
+
+    def _add_clash(self, kind, key, group):
+        if len({timetable_id for timetable_id, _, _ in group}) > 1:
+            self.clashes.append(GlobalClash(kind, key[0], key[1], group))
+
+    def is_free(self, kind, resource_id, day, start, end):
+        return not self.masks[kind].get(day, {}).get(resource_id, 0) & interval_mask(start, end)
+
+    def busy(self, kind, day, start, end):
+        """Ids of the ``kind`` resources booked at any time between ``start`` and ``end``."""
+        wanted = interval_mask(start, end)
+        return {resource_id for resource_id, mask in self.masks[kind].get(day, {}).items() if mask & wanted}
+
+
+def lecture_interval(timetable_id, day, lecture_number):
+    """(start, end) of a lecture of a timetable on ``day``, or None."""
+    slots = list(TimeSlot.objects.filter(timetable_id=timetable_id, lecture_number=lecture_number, is_break=False)
+                 .values_list('day', 'start_time', 'end_time'))
+    # A slot of that day wins over the one shared by every day
+    for slot_day, start, end in sorted(slots, key=lambda slot: slot[0] != day):
+        if slot_day in (day, None):
+            return start, end
+    return None
+
+
+def free_resources(index, day, start, end, lecture_number=None):
+    """
+    Faculty and rooms free between ``start`` and ``end`` on ``day`` in every
+    active timetable. With ``lecture_number``, faculty marked unavailable for
+    that lecture are left out too.
+    """
+    result = {}
+    for kind, model in (('faculty', Faculty), ('room', Room)):
+        busy = index.busy(kind, day, start, end)
+        fields = ['id', LABEL_FIELDS[kind]] + (['unavailable_slots'] if kind == 'faculty' else [])
+        rows = model.objects.order_by(LABEL_FIELDS[kind], 'id').values_list(*fields)
+        bit = availability_bit(day, lecture_number) if kind == 'faculty' and lecture_number is not None else None
+        if bit is not None:
+            rows = [row for row in rows if not (row[2] >> bit) & 1]
+        result[kind] = [{'id': row[0], 'label': row[1]} for row in rows if row[0] not in busy]
+    return result
+
+
+def parse_time(value):
+    return datetime.datetime.strptime(value, '%H:%M').time()
@@ -0,0 +1,180 @@
+from collections import namedtuple
+
+from django.utils.formats import date_format
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Division, TimeSlot, TimetableEntry, day_timeslots
+
+EMPTY_CELLS = '<td></td><td></td><td></td>'
+FILLED_CELLS = (
+    '<td><div class="cell-entry subject">{}</div></td>'
+    '<td><div class="cell-entry faculty">{}</div></td>'
+    '<td><div class="cell-entry room">{}</div></td>'
+)
+
+
+class GridCell(namedtuple('GridCell', [
+    'entry_id', 'subject_id', 'faculty_id', 'room_id',
+    'subject_code', 'faculty_initials', 'room_number',
+])):
+    """A single filled cell, holding only the ids and labels the renderers use."""
+    __slots__ = ()
+
+    def label(self, sep='\n'):
+        return sep.join((self.subject_code, self.faculty_initials, self.room_number))
+
+
+class TimetableGrid:
+    """
+    In-memory view of one timetable, shared by the HTML page and the exports.
+
+    Divisions, timeslots and entries are each fetched with a single query and
+    the entries are indexed by (day, timeslot_id, division_id), so building
+    the grid costs the same number of queries regardless of its size. Entries
+    are read as plain value rows (subject code, faculty initials and room
+    number joined in), so no model instances or lazy FK lookups are involved.
+    """
+
+    def __init__(self, timetable, divisions=None, timeslots=None, entries=None):
+        # Preloaded divisions, timeslots and entry_rows() rows come from aload()
+        self.timetable = timetable
+        self.days = TimeSlot.DAY_CHOICES
+        if divisions is None:
+            divisions = Division.objects.filter(timetable=timetable)
+        if timeslots is None:
+            timeslots = self.timeslot_queryset(timetable)
+        if entries is None:
+            entries = self.entry_rows(timetable)
+        self.divisions = list(divisions)
+        self.timeslots = list(timeslots)
+        self.day_slots = {day: day_timeslots(self.timeslots, day) for day, _ in self.days}
+
+        self.cells = {}
+        for (entry_id, day, timeslot_id, division_id, subject_id, faculty_id, room_id,
+                subject_code, faculty_initials, room_number) in entries:
+            # Keep the first entry per cell, same as the old .first() lookup
+            self.cells.setdefault((day, timeslot_id, division_id), GridCell(
+                entry_id, subject_id, faculty_id, room_id,
+                subject_code or '', faculty_initials or '', room_number or '',
+            ))
+
+    @staticmethod
+    def timeslot_queryset(timetable):
+        return TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number')
+
+    @staticmethod
+    def entry_rows(timetable):
+        return (
+            TimetableEntry.objects.filter(timetable=timetable)
+            .order_by('id')
+            .values_list(
+                'id', 'day', 'timeslot_id', 'division_id',
+                'subject_id', 'faculty_id', 'room_id',
+                'subject__code', 'faculty__initials', 'room__number',
+            )
+        )
+
+    @classmethod
+    async def aload(cls, timetable):
+        """Build the grid from async views, with the same three queries run through the async ORM."""
+        divisions = [d async for d in Division.objects.filter(timetable=timetable)]
+        timeslots = [ts async for ts in cls.timeslot_queryset(timetable)]
+        entries = [row async for row in cls.entry_rows(timetable)]
+        return cls(timetable, divisions, timeslots, entries)
+
+    def get(self, day, timeslot, division):
+        return self.cells.get((day, timeslot.id, division.id))
+
+    def rows(self):
+        """Yield (day_code, slot, cells) in display order, one cell (or None) per division."""
+        for day_code, _ in self.days:
+            for slot in self.day_slots[day_code]:
+                yield day_code, slot, [self.cells.get((day_code, slot.id, div.id)) for div in self.divisions]
+
+    def html_rows(self):
+        """
+        Rows of the HTML grid, one per (day, slot), with the division cells
+        already rendered.
+
+        The template only loops over rows; the cells of a row are joined here
+        from escaped labels, so the grid costs a few template nodes per row
+        instead of a dozen per cell.
+        """
+        escaped = {}
+
+        def esc(label):
+            if label not in escaped:
+                escaped[label] = escape(label)
+            return escaped[label]
+
+        division_ids = [div.id for div in self.divisions]
+        cells = self.cells
+        times = {}
+        rows = []
+        for day_code, _ in self.days:
+            slots = self.day_slots[day_code]
+            for i, slot in enumerate(slots):
+                html = time = None
+                if not slot.is_break:
+                    parts = []
+                    for division_id in division_ids:
+                        cell = cells.get((day_code, slot.id, division_id))
+                        if cell is None:
+                            parts.append(EMPTY_CELLS)
+                        else:
+                            parts.append(FILLED_CELLS.format(
+                                esc(cell.subject_code), esc(cell.faculty_initials), esc(cell.room_number)))
+                    html = mark_safe(''.join(parts))
+                    if slot.id not in times:
+                        # Same formatting as the |date:"g:ia" filter
+                        times[slot.id] = (f"{date_format(slot.start_time, 'g:ia')} to "
+                                          f"{date_format(slot.end_time, 'g:ia')}")
+                    time = times[slot.id]
+                rows.append({
+                    'day_code': day_code,
+                    'slot': slot,
+                    # The day cell spans the day's rows and sits in the first one
+                    'rowspan': len(slots) if i == 0 else 0,
+                    'time': time,
+                    'cells': html,
+                })
+        return rows
+
+
+ScheduleCell = namedtuple('ScheduleCell', [
+    'entry_id', 'division_name', 'subject_code', 'faculty_initials', 'room_number',
+])
+
+
+class ResourceSchedule:
+    """
+    Week of one faculty member, room or division within a timetable.
+
+    Only that resource's entries are read, in a single query answered by the
+    (timetable, faculty/room/division) indexes on TimetableEntry.
+    """
+    KINDS = ('faculty', 'room', 'division')
+
+    def __init__(self, timetable, kind, resource_id):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown schedule kind: {kind}")
+        self.timetable = timetable
+        self.kind = kind
+        self.days = TimeSlot.DAY_CHOICES
+        timeslots = list(TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number'))
+        self.day_slots = {day: day_timeslots(timeslots, day) for day, _ in self.days}
+
+        rows = (
+            TimetableEntry.objects.filter(timetable=timetable, **{f'{kind}_id': resource_id})
+            .order_by('id')
+            .values_list('id', 'day', 'timeslot_id', 'division__name', 'subject__code', 'faculty__initials', 'room__number')
+        )
+        self.cells = {}
+        for entry_id, day, timeslot_id, *labels in rows:
+            self.cells.setdefault((day, timeslot_id), ScheduleCell(entry_id, *(label or '' for label in labels)))
+
+    def rows(self):
+        """Yield (day_code, day_name, [(slot, cell or None), ...]) for each day of the week."""
+        for day_code, day_name in self.days:
+            yield day_code, day_name, [(slot, self.cells.get((day_code, slot.id))) for slot in self.day_slots[day_code]]
@@ -0,0 +1,86 @@
+"""
+Pages of the timetable history, newest first.
+
+Pages are keyset-paginated on (created_at, id): the cursor is the last
+timetable of the previous page, so every page is an index range scan on
+``timetable_created_idx`` however far back it is. Each timetable on a page
+comes with its division, weekly slot and entry counts and the timetable it
+is diffed against, all as correlated subqueries of the one page query.
+"""
+import datetime
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Division, TimeSlot, Timetable, TimetableEntry
+
+PAGE_SIZE = 20
+
+
+def _count(queryset, expression=Count('id')):
+    rows = (queryset.filter(timetable=OuterRef('pk')).order_by().values('timetable')
+            .annotate(n=expression).values('n'))
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+# A day with slots of its own uses those, every other day the shared ones
+_weekly_slots = (Count('id', filter=Q(day__isnull=False, is_break=False))
+                 + Count('id', filter=Q(day__isnull=True, is_break=False))
+                 * (len(TimeSlot.DAY_CHOICES) - Count('day', distinct=True)))
+
+
+def encode_cursor(timetable):
+    return f"{timetable.created_at.isoformat()}_{timetable.id}"
+
+
+def decode_cursor(value):
+    """(created_at, id) of a cursor; ValueError if it is not one."""
+    created_at, _, pk = value.rpartition('_')
+    return datetime.datetime.fromisoformat(created_at), int(pk)
+
+
+def _day_start(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def history_queryset(name='', created_from=None, created_to=None):
+    queryset = Timetable.objects.all()
+    if name:
+        queryset = queryset.filter(name__icontains=name)
+    # Date bounds become datetimes, so they stay ranges on created_at
+    if created_from:
+        queryset = queryset.filter(created_at__gte=_day_start(created_from))
+    if created_to:
+        queryset = queryset.filter(created_at__lt=_day_start(created_to + datetime.timedelta(days=1)))
+    return queryset
+
+
+def history_page(queryset, after=None, limit=PAGE_SIZE):
+    """
+    Up to ``limit`` timetables of ``queryset`` created before the ``after``
+    cursor, and the cursor of the next page (None on the last one).
+    """
+    if after is not None:
+        created_at, pk = after
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # Diffs compare with the timetable created just before, filtered out or not
+    previous = (Timetable.objects.filter(Q(created_at__lt=OuterRef('created_at'))
+                                         | Q(created_at=OuterRef('created_at'), id__lt=OuterRef('id')))
+                .order_by('-created_at', '-id').values('id')[:1])
+    timetables = list(
+        queryset.annotate(
+            division_count=_count(Division.objects.all()),
+            slot_count=_count(TimeSlot.objects.all(), _weekly_slots),
+            entry_count=_count(TimetableEntry.objects.all()),
+            previous_id=Subquery(previous),
+        ).order_by('-created_at', '-id')[:limit + 1]
+    )
+    next_cursor = None
+    if len(timetables) > limit:
+        timetables = timetables[:limit]
+        next_cursor = encode_cursor(timetables[-1])
+    for tt in timetables:
+        cells = tt.division_count * tt.slot_count
+        tt.fill = round(min(tt.entry_count / cells, 1) * 100) if cells else None
+    return timetables, next_cursor
@@ -0,0 +1,223 @@
+"""
+Bulk import of timetable entries.
+
+Two formats are accepted:
+
+* the workbook layout written by ``export_excel`` (Day, Slot, one column per
+  division, cells holding "SUBJECT\\nFACULTY\\nROOM"), imported into one
+  timetable, or the all-timetables export with one such sheet per timetable;
+* a flat CSV with the header ``timetable,day,lecture,division,subject,faculty,room``
+  where ``timetable`` is an id (it may be left out when a target timetable is
+  given), ``lecture`` the lecture number and subject/faculty/room their code,
+  initials and number.
+
+Files are read row by row (openpyxl read-only mode / the csv module), codes are
+resolved through lookup tables built once, and entries are written with
+batched bulk_create inside one transaction. If any row is invalid nothing is
+written.
+"""
+import csv
+import io
+from collections import namedtuple
+
+import openpyxl
+from django.db import transaction
+
+from .models import Division, Faculty, Room, Subject, TimeSlot, Timetable, TimetableEntry, day_timeslots
+from .occupancy import OccupancyIndex
+from .signals import batched_writes, bump_version
+
+DAY_CODES = [code for code, _ in TimeSlot.DAY_CHOICES]
+MAX_ERRORS = 100
+
+ImportResult = namedtuple('ImportResult', ['rows', 'created', 'errors', 'error_count', 'dry_run'])
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+class _TimetableState:
+    def __init__(self, timetable, cleared=False):
+        self.timetable = timetable
+        self.divisions = {}
+        for pk, name in Division.objects.filter(timetable=timetable).order_by('-id').values_list('id', 'name'):
+            self.divisions[name] = pk
+        timeslots = list(TimeSlot.objects.filter(timetable=timetable, is_break=False).order_by('lecture_number'))
+        self.by_lecture = {}
+        self.by_start = {}
+        for day in DAY_CODES:
+            for ts in day_timeslots(timeslots, day):
+                self.by_lecture[(day, ts.lecture_number)] = ts.id
+                self.by_start[(day, ts.start_time.strftime('%H:%M'))] = ts.id
+        self.index = OccupancyIndex(timetable, entries=[] if cleared else None)
+
+
+class EntryImporter:
+    def __init__(self, timetable=None, dry_run=False, clear=False, batch_size=1000):
+        self.timetable = timetable
+        self.dry_run = dry_run
+        self.clear = clear
+        self.batch_size = batch_size
+
+        # Codes are not unique; the oldest row wins, as it is listed first in forms
+        self.subjects = dict(Subject.objects.order_by('-id').values_list('code', 'id'))
+        self.faculty = dict(Faculty.objects.order_by('-id').values_list('initials', 'id'))
+        self.rooms = dict(Room.objects.order_by('-id').values_list('number', 'id'))
+
+        self._states = {}
+        self._batch = []
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f"Row {line}: {message}")
+
+    def state(self, timetable_id):
+        if timetable_id not in self._states:
+            timetable = Timetable.objects.filter(id=timetable_id).first()
+            if timetable is None:
+                self._states[timetable_id] = None
+            else:
+                if self.clear and not self.dry_run:
+                    TimetableEntry.objects.filter(timetable=timetable).delete()
+                self._states[timetable_id] = _TimetableState(timetable, cleared=self.clear)
+        return self._states[timetable_id]
+
+    def add(self, line, timetable_id, day, division, subject, faculty, room, lecture=None, start=None):
+        self.rows += 1
+        state = self.state(timetable_id)
+        if state is None:
+            return self.error(line, f"unknown timetable {timetable_id!r}")
+
+        day = (day or '').strip().upper()[:3]
+        if day not in DAY_CODES:
+            return self.error(line, f"unknown day {day!r}")
+        if lecture is not None:
+            timeslot_id = state.by_lecture.get((day, lecture))
+        else:
+            timeslot_id = state.by_start.get((day, start))
+        if timeslot_id is None:
+            return self.error(line, f"no lecture {lecture or start} on {day}")
+
+        division_id = state.divisions.get(division)
+        if division_id is None:
+            return self.error(line, f"unknown division {division!r}")
+        resolved = []
+        for label, table, value in (('subject', self.subjects, subject), ('faculty', self.faculty, faculty),
+                                    ('room', self.rooms, room)):
+            if not value:
+                resolved.append(None)
+            elif value in table:
+                resolved.append(table[value])
+            else:
+                return self.error(line, f"unknown {label} {value!r}")
+        subject_id, faculty_id, room_id = resolved
+
+        busy = state.index.conflicts(day, timeslot_id, division_id, faculty_id, room_id)
+        if busy:
+            return self.error(line, f"{', '.join(busy)} already booked on {day} in that lecture")
+        state.index.book(day, timeslot_id, division_id, faculty_id, room_id)
+
+        if not self.dry_run:
+            self._batch.append(TimetableEntry(
+                timetable_id=state.timetable.id,
+                day=day,
+                timeslot_id=timeslot_id,
+                division_id=division_id,
+                subject_id=subject_id,
+                faculty_id=faculty_id,
+                room_id=room_id,
+            ))
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self._batch:
+            TimetableEntry.objects.bulk_create(self._batch)
+            self.created += len(self._batch)
+            self._batch = []
+
+    def read_csv(self, fileobj):
+        if not isinstance(fileobj, io.TextIOBase):
+            fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(fileobj)
+        missing = {'day', 'lecture', 'division'} - set(reader.fieldnames or ())
+        if missing or ('timetable' not in reader.fieldnames and self.timetable is None):
+            raise ImportFormatError("CSV needs the columns timetable, day, lecture, division, subject, faculty, room.")
+        for line, row in enumerate(reader, start=2):
+            timetable_id = row.get('timetable') or (self.timetable and self.timetable.id)
+            try:
+                timetable_id = int(timetable_id)
+                lecture = int(row['lecture'])
+            except (TypeError, ValueError):
+                self.error(line, "timetable and lecture must be numbers")
+                continue
+            self.add(line, timetable_id, row['day'], (row['division'] or '').strip(),
+                     (row.get('subject') or '').strip(), (row.get('faculty') or '').strip(),
+                     (row.get('room') or '').strip(), lecture=lecture)
+
+    def read_excel(self, fileobj):
+        """
+        Import the active sheet into the target timetable or, without one, a
+        multi-timetable export sheet by sheet ('<id> <name>' titles).
+        """
+        wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            if self.timetable is not None:
+                self.read_sheet(wb.active, self.timetable.id)
+                return
+            for ws in wb.worksheets:
+                timetable_id = ws.title.split(' ', 1)[0]
+                if not timetable_id.isdigit():
+                    raise ImportFormatError("Choose the timetable to import the workbook into.")
+                self.read_sheet(ws, int(timetable_id))
+        finally:
+            wb.close()
+
+    def read_sheet(self, ws, timetable_id):
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header or [str(h).strip() for h in header[:2]] != ['Day', 'Slot']:
+            raise ImportFormatError(f"Sheet {ws.title!r} does not look like a timetable export.")
+        divisions = [str(h).strip() if h is not None else '' for h in header[2:]]
+        for line, row in enumerate(rows, start=2):
+            if not row or row[0] is None:
+                continue
+            cells = row[2:]
+            if cells and cells[0] == 'BREAK':
+                continue
+            start = str(row[1] or '').split('-')[0].strip()
+            for division, cell in zip(divisions, cells):
+                if not cell:
+                    continue
+                parts = (str(cell).split('\n') + ['', ''])[:3]
+                self.add(line, timetable_id, str(row[0]), division, *(p.strip() for p in parts), start=start)
+
+    def run(self, read, fileobj):
+        # The clear's delete() would bump each timetable once per row; it is bumped once below
+        with transaction.atomic(), batched_writes():
+            read(fileobj)
+            if self.error_count:
+                transaction.set_rollback(True)
+                self.created = 0
+                self._batch = []
+            elif not self.dry_run:
+                self.flush()
+                # bulk_create skips the post_save signal; this also covers cleared timetables
+                bump_version(*(s.timetable.id for s in self._states.values() if s))
+        return ImportResult(self.rows, self.created, self.errors, self.error_count, self.dry_run)
+
+
+def import_csv(fileobj, timetable=None, dry_run=False, clear=False):
+    importer = EntryImporter(timetable=timetable, dry_run=dry_run, clear=clear)
+    return importer.run(importer.read_csv, fileobj)
+
+
+def import_excel(fileobj, timetable=None, dry_run=False, clear=False):
+    importer = EntryImporter(timetable=timetable, dry_run=dry_run, clear=clear)
+    return importer.run(importer.read_excel, fileobj)
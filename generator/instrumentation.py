@@ -0,0 +1,202 @@
+"""
+Per-view request instrumentation.
+
+``RequestStatsMiddleware`` measures every request: number of SQL queries, time
+spent in the database, time spent rendering templates and total latency. The
+samples are kept per URL name in a bounded window, from which ``report()``
+computes rolling percentiles for the stats page.
+
+Configured through the ``REQUEST_STATS`` setting::
+
+    REQUEST_STATS = {
+        'WINDOW': 500,            # samples kept per URL name
+        'SLOW_REQUEST_MS': 1000,  # log slower requests; None disables logging
+        'TOP_QUERIES': 5,         # repeated statements included in the log line
+    }
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('total_ms', 'db_ms', 'template_ms', 'queries')
+PERCENTILES = (50, 90, 99)
+
+_current = contextvars.ContextVar('request_sample', default=None)
+
+
+def get_config():
+    config = {'WINDOW': 500, 'SLOW_REQUEST_MS': 1000, 'TOP_QUERIES': 5}
+    config.update(getattr(settings, 'REQUEST_STATS', {}))
+    return config
+
+
+class Sample:
+    __slots__ = ('queries', 'db_ms', 'template_ms', 'total_ms', 'statements')
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.total_ms = 0.0
+        self.statements = Counter() if keep_sql else None
+
+
+class RequestStats:
+    """Thread-safe rolling window of samples per URL name."""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._samples = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, sample):
+        row = tuple(getattr(sample, metric) for metric in METRICS)
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+            self._samples[name].append(row)
+            self._counts[name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+    def report(self):
+        """{url_name: {'requests': n, 'window': n, '<metric>': {'p50': .., 'p90': .., 'p99': .., 'max': ..}}}"""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+            counts = dict(self._counts)
+        report = {}
+        for name, rows in sorted(snapshot.items()):
+            entry = {'requests': counts[name], 'window': len(rows)}
+            for i, metric in enumerate(METRICS):
+                values = sorted(row[i] for row in rows)
+                entry[metric] = {f'p{p}': round(percentile(values, p), 2) for p in PERCENTILES}
+                entry[metric]['max'] = round(values[-1], 2)
+            report[name] = entry
+        return report
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(0, -(-len(values) * p // 100) - 1)
+    return values[rank]
+
+
+stats = RequestStats(get_config()['WINDOW'])
+
+
+def _record_query(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db_ms += (time.perf_counter() - start) * 1000
+        sample.queries += 1
+        if sample.statements is not None:
+            sample.statements[sql] += 1
+
+
+def _install_query_recorder(connection, **kwargs):
+    # Installed on every connection rather than per request: async views run
+    # their queries in asgiref's worker thread, on that thread's connection,
+    # and the request's sample reaches them through the context variable
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _timed_render(render):
+    def wrapper(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return render(self, context, request)
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            sample.template_ms += (time.perf_counter() - start) * 1000
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _install():
+    connection_created.connect(_install_query_recorder, dispatch_uid='request_stats')
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(connection)
+    # Includes and {% extends %} render inside the backend Template.render, so
+    # timing only this outer call counts each page or fragment once
+    if not getattr(DjangoTemplate.render, 'instrumented', False):
+        DjangoTemplate.render = _timed_render(DjangoTemplate.render)
+
+
+class RequestStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        _install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        sample = Sample(keep_sql=self.config['SLOW_REQUEST_MS'] is not None)
+        token = _current.set(sample)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, sample, start)
+        return response
+
+    async def __acall__(self, request):
+        sample = Sample(keep_sql=self.config['SLOW_REQUEST_MS'] is not None)
+        token = _current.set(sample)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, sample, start)
+        return response
+
+    def finish(self, request, sample, start):
+        sample.total_ms = (time.perf_counter() - start) * 1000
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else 'unresolved'
+        stats.add(name, sample)
+        slow_ms = self.config['SLOW_REQUEST_MS']
+        if slow_ms is not None and sample.total_ms >= slow_ms:
+            self.log_slow(request, name, sample)
+
+    def log_slow(self, request, name, sample):
+        repeated = [
+            f"{count}x {sql[:200]}"
+            for sql, count in sample.statements.most_common(self.config['TOP_QUERIES'])
+            if count > 1
+        ]
+        logger.warning(
+            "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, templates %.0f ms%s",
+            request.method, request.path, name, sample.total_ms, sample.queries, sample.db_ms,
+            sample.template_ms, ''.join(f"\n  {line}" for line in repeated),
+        )
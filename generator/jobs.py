@@ -0,0 +1,132 @@
+"""
+Background export jobs.
+
+Exports are rendered by a local thread pool (no broker needed) into files
+under ``settings.EXPORT_ROOT``. Each job records a key made of the export kind
+and the version of the timetable(s) it covers, so asking again for an
+unchanged timetable returns the job, and file, that already exists. When a
+job finishes, the files of earlier versions of the same export are deleted.
+
+``EXPORT_WORKERS = 0`` runs jobs inline in the requesting thread, which is
+handy for tests and single-process development servers.
+"""
+import datetime
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import cache as render_cache
+from .exports import render_pdf, write_division_excel, write_excel, write_timetables_excel
+from .grid import TimetableGrid
+from .models import ExportJob, Timetable
+
+EXTENSIONS = {'pdf': 'pdf', 'xlsx': 'xlsx', 'xlsx_divisions': 'xlsx', 'xlsx_all': 'xlsx'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'EXPORT_WORKERS', 2),
+                    thread_name_prefix='export',
+                )
+    return _executor
+
+
+def export_key(kind, timetable=None):
+    if timetable is not None:
+        return f"{kind}:{timetable.id}:v{timetable.version}"
+    # Covers every timetable; any added, removed or edited one changes the digest
+    digest = hashlib.sha1()
+    for pk, version in Timetable.objects.order_by('id').values_list('id', 'version'):
+        digest.update(f"{pk}:{version};".encode())
+    return f"{kind}:{digest.hexdigest()}"
+
+
+def artifact_path(job):
+    return os.path.join(settings.EXPORT_ROOT, f"{job.key.replace(':', '_')}.{EXTENSIONS[job.kind]}")
+
+
+def request_export(kind, timetable=None):
+    """Return a job producing this export, reusing one for the same content."""
+    key = export_key(kind, timetable)
+    # Jobs of a worker that died with its process never finish
+    cutoff = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'EXPORT_JOB_TIMEOUT', 600))
+    ExportJob.objects.filter(key=key, status__in=['queued', 'running'], created_at__lt=cutoff).update(
+        status='failed', error="Timed out; the export was started again.", finished_at=timezone.now())
+    job = ExportJob.objects.filter(key=key).exclude(status='failed').order_by('-id').first()
+    if job and (job.status != 'done' or os.path.exists(job.file)):
+        return job
+
+    job = ExportJob.objects.create(kind=kind, timetable=timetable, key=key)
+    if getattr(settings, 'EXPORT_WORKERS', 2):
+        transaction.on_commit(lambda: get_executor().submit(run_job, job.id))
+    else:
+        run_job(job.id)
+        job.refresh_from_db()
+    return job
+
+
+def _write(job, fileobj):
+    if job.kind == 'xlsx_all':
+        write_timetables_excel(Timetable.objects.order_by('-created_at').iterator(), fileobj)
+        return
+    timetable = job.timetable
+    if job.kind == 'pdf':
+        fileobj.write(render_cache.get_or_render(timetable, 'pdf', lambda: render_pdf(TimetableGrid(timetable))))
+    elif job.kind == 'xlsx':
+        write_excel(TimetableGrid(timetable), fileobj)
+    else:
+        write_division_excel(TimetableGrid(timetable), fileobj)
+
+
+def run_job(job_id):
+    try:
+        _run(job_id)
+    finally:
+        if getattr(settings, 'EXPORT_WORKERS', 2):
+            # Worker threads hold their own connections
+            connections.close_all()
+
+
+def _run(job_id):
+    job = ExportJob.objects.select_related('timetable').get(id=job_id)
+    ExportJob.objects.filter(id=job_id).update(status='running')
+    path = artifact_path(job)
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    partial = f"{path}.{job_id}.part"
+    try:
+        with open(partial, 'wb') as f:
+            _write(job, f)
+        os.replace(partial, path)
+    except Exception as e:
+        if os.path.exists(partial):
+            os.remove(partial)
+        ExportJob.objects.filter(id=job_id).update(
+            status='failed', error=f"{type(e).__name__}: {e}", finished_at=timezone.now())
+        return
+    ExportJob.objects.filter(id=job_id).update(status='done', file=path, finished_at=timezone.now())
+    _prune(job)
+
+
+def _prune(job):
+    """Delete the files of earlier jobs for the same export whose content has since changed."""
+    superseded = ExportJob.objects.filter(
+        kind=job.kind, timetable_id=job.timetable_id, status='done', id__lt=job.id,
+    ).exclude(key=job.key).exclude(file='')
+    for path in set(superseded.values_list('file', flat=True)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    superseded.update(file='')
@@ -0,0 +1,121 @@
+"""
+Live timetable updates over Server-Sent Events.
+
+Open timetable pages subscribe to ``/timetable/<id>/live/``. Saving or
+deleting an entry publishes a ``cell`` event with the new contents of that
+one cell, and writes that change the grid wholesale (bulk imports,
+generation, timeslot or division edits, renamed subjects) publish
+``refresh``. The page patches the cell in place, or reloads on ``refresh``.
+
+Cell events carry the timetable version they bring the page to, and the
+first event of every connection, ``hello``, the current one. A page that
+finds the server ahead of the version it rendered or last patched to has
+missed events (while it loaded, or while EventSource reconnected) and
+reloads.
+
+The broker is in-process: each subscriber is an asyncio queue on the event
+loop serving it, and publishers in worker threads hand messages over with
+``call_soon_threadsafe``. It needs no Redis, but only reaches viewers
+connected to the same process, so run a single ASGI process (e.g.
+``uvicorn timetable_project.asgi:application``) when using it.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, message):
+        # Runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind for deltas to help; have the client reload instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(format_event('refresh', {}))
+
+
+class Broker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, timetable_id):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[timetable_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, timetable_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(timetable_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[timetable_id]
+
+    def has_subscribers(self, timetable_id):
+        return timetable_id in self._subscribers
+
+    def publish(self, timetable_id, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers.get(timetable_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # Its event loop has shut down
+                self.unsubscribe(timetable_id, subscription)
+
+
+broker = Broker()
+
+
+def publish_on_commit(timetable_id, event, data):
+    """Publish once the current transaction commits, if anyone is listening."""
+    if timetable_id is not None and broker.has_subscribers(timetable_id):
+        transaction.on_commit(lambda: broker.publish(timetable_id, event, data))
+
+
+def cell_event(version, day, timeslot_id, division_id, entry=None):
+    """Contents of one grid cell as of timetable ``version``; ``entry`` None clears it."""
+    data = {'version': version, 'day': day, 'timeslot': timeslot_id, 'division': division_id, 'entry': None}
+    if entry is not None:
+        data.update(
+            entry=entry.id,
+            subject_id=entry.subject_id, faculty_id=entry.faculty_id, room_id=entry.room_id,
+            subject=entry.subject.code if entry.subject_id else '',
+            faculty=entry.faculty.initials if entry.faculty_id else '',
+            room=entry.room.number if entry.room_id else '',
+        )
+    return data
+
+
+async def event_stream(timetable_id, subscription, version):
+    try:
+        yield format_event('hello', {'timetable': timetable_id, 'version': version})
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line; keeps proxies from closing an idle connection
+                message = ": keepalive\n\n"
+            yield message
+    finally:
+        broker.unsubscribe(timetable_id, subscription)
@@ -0,0 +1,48 @@
+"""
+Weekly load totals, aggregated in the database.
+
+Lecture counts and taught hours come from COUNT/SUM over the entries of a
+timetable, with a lecture's length taken from its timeslot's start and end.
+"""
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+
+from .models import TimeSlot, TimetableEntry
+
+LABEL_FIELDS = {'faculty': 'faculty__initials', 'room': 'room__number', 'division': 'division__name'}
+
+_duration = ExpressionWrapper(F('timeslot__end_time') - F('timeslot__start_time'), output_field=DurationField())
+
+
+def _hours(duration):
+    return round(duration.total_seconds() / 3600, 2) if duration else 0
+
+
+def weekly_load(timetable, kind, resource_id):
+    """Lectures, hours and subjects of one faculty member, room or division, with lectures per day."""
+    totals = TimetableEntry.objects.filter(timetable=timetable, **{f'{kind}_id': resource_id}).aggregate(
+        lectures=Count('id'),
+        duration=Sum(_duration),
+        subjects=Count('subject', distinct=True),
+        **{code: Count('id', filter=Q(day=code)) for code, _ in TimeSlot.DAY_CHOICES},
+    )
+    return {
+        'lectures': totals['lectures'],
+        'hours': _hours(totals['duration']),
+        'subjects': totals['subjects'],
+        'per_day': [(name, totals[code]) for code, name in TimeSlot.DAY_CHOICES],
+    }
+
+
+def load_totals(timetable, kind):
+    """Lectures and hours per faculty member, room or division of a timetable, busiest first."""
+    label = LABEL_FIELDS[kind]
+    rows = (
+        TimetableEntry.objects.filter(timetable=timetable, **{f'{kind}__isnull': False})
+        .values(f'{kind}_id', label)
+        .annotate(lectures=Count('id'), duration=Sum(_duration))
+        .order_by('-lectures', label)
+    )
+    return [
+        {'id': row[f'{kind}_id'], 'label': row[label], 'lectures': row['lectures'], 'hours': _hours(row['duration'])}
+        for row in rows
+    ]
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from generator.benchmarks import build_department, environment, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Time the grid view, exports, entry creation and setup on a synthetic department. "
+            "Runs in a throwaway test database; results can be saved as JSON and compared.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--divisions', type=int, default=50)
+        parser.add_argument('--lectures', type=int, default=10, help="Lectures per day")
+        parser.add_argument('--faculty', type=int, default=200)
+        parser.add_argument('--rooms', type=int, help="Defaults to twice the divisions")
+        parser.add_argument('--subjects', type=int, default=20)
+        parser.add_argument('--fill', type=float, default=0.9, help="Share of cells booked")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Earlier results JSON to compare against")
+
+    def handle(self, *args, **options):
+        dataset = {key: options[key] for key in ('divisions', 'lectures', 'faculty', 'rooms', 'subjects', 'fill', 'seed')}
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Runs under tracemalloc are slow on purpose; keep them out of the slow request log
+        quiet = override_settings(REQUEST_STATS={'SLOW_REQUEST_MS': None})
+        quiet.enable()
+        try:
+            try:
+                timetable = build_department(**dataset)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Dataset: {timetable.entries.count()} entries in {dataset['divisions']} divisions")
+            results = run_benchmarks(timetable, runs=options['runs'])
+        finally:
+            quiet.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {'environment': environment(), 'dataset': dataset, 'results': results}
+        for name, result in results.items():
+            line = (f"{name:24} {result['wall_ms']['median']:9.1f} ms  {result['queries']:5} queries  "
+                    f"{result['peak_kib']:9.1f} KiB")
+            previous = baseline and baseline['results'].get(name)
+            if previous:
+                change = result['wall_ms']['median'] / previous['wall_ms']['median'] - 1 if previous['wall_ms']['median'] else 0
+                line += f"  ({change:+.0%} time, {result['queries'] - previous['queries']:+} queries)"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
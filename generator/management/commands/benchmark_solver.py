@@ -0,0 +1,46 @@
+import statistics
+
+from django.core.management.base import BaseCommand
+
+from generator.solver import solve, synthetic_problem
+
+
+class Command(BaseCommand):
+    help = "Time the timetable solver on synthetic departments (no database needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--divisions', type=int, default=9)
+        parser.add_argument('--days', type=int, default=6)
+        parser.add_argument('--slots-per-day', type=int, default=5)
+        parser.add_argument('--subjects', type=int, default=6)
+        parser.add_argument('--load', type=float, default=0.8, help="Share of the week each division is taught")
+        parser.add_argument('--faculty-load', type=float, default=0.7, help="Share of the week each faculty teaches")
+        parser.add_argument('--unavailable', type=float, default=0.1, help="Share of slots each faculty is unavailable")
+        parser.add_argument('--time-limit', type=float, default=10.0)
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        times, conflicts = [], []
+        for run in range(options['runs']):
+            problem = synthetic_problem(
+                divisions=options['divisions'],
+                days=options['days'],
+                slots_per_day=options['slots_per_day'],
+                subjects=options['subjects'],
+                load=options['load'],
+                faculty_load=options['faculty_load'],
+                unavailable=options['unavailable'],
+                seed=run,
+            )
+            solution = solve(problem, time_limit=options['time_limit'], seed=run)
+            times.append(solution.elapsed)
+            conflicts.append(solution.conflicts)
+            self.stdout.write(
+                f"run {run}: {problem.lesson_count} lectures, {len(problem.faculty)} faculty, "
+                f"{len(problem.rooms)} rooms -> {solution.elapsed:.3f}s, "
+                f"{solution.backtracks} backtracks, {solution.conflicts} unresolved"
+            )
+        self.stdout.write(
+            f"solve time: median {statistics.median(times):.3f}s, max {max(times):.3f}s; "
+            f"unresolved conflicts: total {sum(conflicts)}, max {max(conflicts)}"
+        )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.models import Timetable
+from generator.scheduling import generate_timetable
+
+
+class Command(BaseCommand):
+    help = "Fill a timetable's grid from its subject requirements."
+
+    def add_arguments(self, parser):
+        parser.add_argument('timetable_id', type=int, nargs='?', help="Defaults to the active timetable")
+        parser.add_argument('--clear', action='store_true', help="Delete existing entries first")
+        parser.add_argument('--time-limit', type=float, default=10.0, help="Search budget in seconds")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['timetable_id']:
+            timetable = Timetable.objects.filter(id=options['timetable_id']).first()
+        else:
+            timetable = Timetable.objects.filter(is_active=True).order_by('-created_at').first()
+        if not timetable:
+            raise CommandError("Timetable not found.")
+
+        solution = generate_timetable(
+            timetable,
+            clear=options['clear'],
+            time_limit=options['time_limit'],
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            f"{timetable}: placed {len(solution.placements)} lectures in {solution.elapsed:.2f}s "
+            f"({solution.backtracks} backtracks)"
+        )
+        if solution.conflicts:
+            self.stdout.write(self.style.WARNING(f"{solution.conflicts} lectures could not be placed without a clash"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All requirements placed."))
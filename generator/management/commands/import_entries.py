@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.importers import ImportFormatError, import_csv, import_excel
+from generator.models import Timetable
+
+
+class Command(BaseCommand):
+    help = "Import timetable entries from an exported .xlsx workbook or a flat .csv file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--timetable', type=int, help="Target timetable; workbooks exported from history and CSVs with a timetable column may omit it")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+        parser.add_argument('--clear', action='store_true', help="Replace the existing entries of each timetable")
+
+    def handle(self, *args, **options):
+        timetable = None
+        if options['timetable']:
+            timetable = Timetable.objects.filter(id=options['timetable']).first()
+            if not timetable:
+                raise CommandError("Timetable not found.")
+
+        try:
+            if options['path'].lower().endswith('.xlsx'):
+                with open(options['path'], 'rb') as f:
+                    result = import_excel(f, timetable, dry_run=options['dry_run'], clear=options['clear'])
+            else:
+                with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                    result = import_csv(f, timetable, dry_run=options['dry_run'], clear=options['clear'])
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(error)
+        if result.error_count:
+            raise CommandError(f"{result.error_count} of {result.rows} rows are invalid; nothing was imported.")
+        if result.dry_run:
+            self.stdout.write(self.style.SUCCESS(f"{result.rows} rows are valid."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {result.created} entries."))
@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from generator.benchmarks import build_department, environment, run_load_test
+
+
+class Command(BaseCommand):
+    help = ("Run concurrent grid readers and entry writers against a throwaway copy of the configured "
+            "database. On SQLite the same load is first run with Django's default settings, for comparison.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--divisions', type=int, default=20)
+        parser.add_argument('--lectures', type=int, default=8, help="Lectures per day")
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per run")
+        parser.add_argument('--no-baseline', action='store_true', help="Only run with the configured settings")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        configured = dict(connection.settings_dict['OPTIONS'])
+        runs = {}
+        if connection.vendor == 'sqlite' and not options['no_baseline']:
+            # Rollback journal, 5 s busy timeout, deferred transactions
+            runs['django defaults'] = ({}, 'DELETE')
+        runs['configured'] = (configured, None)
+
+        setup_test_environment()
+        tmpdir = None
+        if connection.vendor == 'sqlite':
+            # Worker processes need a database file they can all open, not the in-memory test database
+            tmpdir = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir.name, 'loadtest.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        quiet = override_settings(REQUEST_STATS={'SLOW_REQUEST_MS': None})
+        quiet.enable()
+        results = {}
+        try:
+            try:
+                timetable = build_department(divisions=options['divisions'], lectures=options['lectures'],
+                                             faculty=options['divisions'] * 3, fill=0.7)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Dataset: {timetable.entries.count()} entries in {options['divisions']} divisions; "
+                              f"{options['readers']} readers, {options['writers']} writers, {options['duration']}s a run")
+            for label, (db_options, journal_mode) in runs.items():
+                connections.close_all()
+                connection.settings_dict['OPTIONS'] = db_options
+                if journal_mode:
+                    # WAL is stored in the file, so switch it back explicitly
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+                results[label] = run_load_test(timetable, options['readers'], options['writers'], options['duration'])
+        finally:
+            quiet.disable()
+            connections.close_all()
+            connection.settings_dict['OPTIONS'] = configured
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if tmpdir:
+                tmpdir.cleanup()
+
+        for label, result in results.items():
+            self.stdout.write(label)
+            for kind, summary in result.items():
+                self.stdout.write(
+                    f"  {kind:6} {summary['ops_per_s']:8.1f} ops/s  p50 {summary['p50_ms'] or 0:8.1f} ms  "
+                    f"p99 {summary['p99_ms'] or 0:8.1f} ms  max {summary['max_ms'] or 0:8.1f} ms  "
+                    f"{summary['errors']} errors"
+                )
+
+        if options['output']:
+            keys = ('divisions', 'lectures', 'readers', 'writers', 'duration')
+            report = {'environment': environment(), 'load': {key: options[key] for key in keys}, 'results': results}
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
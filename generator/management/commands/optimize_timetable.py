@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.models import Timetable
+from generator.optimizer import DEFAULT_WEIGHTS, PENALTIES, optimize_timetable
+
+
+def weight(value):
+    name, _, number = value.partition('=')
+    if name not in DEFAULT_WEIGHTS:
+        raise ValueError(value)
+    return name, float(number)
+
+
+class Command(BaseCommand):
+    help = ("Reduce idle gaps, repeated subjects and crowded days of a timetable by moving and swapping "
+            "its lectures, and save the result as a new timetable.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('timetable_id', type=int, nargs='?', help="Defaults to the active timetable")
+        parser.add_argument('--time-limit', type=float, default=10.0, help="Search budget in seconds")
+        parser.add_argument('--iterations', type=int, default=None,
+                            help="Run exactly this many steps instead of until the time limit")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--weight', type=weight, action='append', default=[], metavar='NAME=VALUE',
+                            help=f"Penalty weight, repeatable; names: {', '.join(PENALTIES)}")
+        parser.add_argument('--name', help="Name of the new timetable")
+        parser.add_argument('--activate', action='store_true', help="Make the new timetable the active one")
+
+    def handle(self, *args, **options):
+        if options['timetable_id']:
+            timetable = Timetable.objects.filter(id=options['timetable_id']).first()
+        else:
+            timetable = Timetable.objects.filter(is_active=True).order_by('-created_at').first()
+        if not timetable:
+            raise CommandError("Timetable not found.")
+
+        try:
+            result = optimize_timetable(
+                timetable,
+                time_limit=options['time_limit'],
+                iterations=options['iterations'],
+                seed=options['seed'],
+                weights=dict(options['weight']),
+                name=options['name'],
+                activate=options['activate'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{timetable}: {result.iterations} steps in {result.elapsed:.2f}s, "
+                          f"{result.accepted} accepted")
+        for name in PENALTIES:
+            self.stdout.write(f"  {name:14} {result.breakdown_before[name]:6} -> {result.breakdown_after[name]}")
+        self.stdout.write(f"  {'score':14} {result.before:6} -> {result.after}")
+        if result.timetable is None:
+            self.stdout.write(self.style.WARNING("No improvement found; nothing saved."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Saved as timetable {result.timetable.id} ({result.timetable.name}), "
+                f"{result.moved} lectures moved."))
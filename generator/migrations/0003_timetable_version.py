@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0002_timetable_alter_timetableentry_unique_together_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="timetable",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
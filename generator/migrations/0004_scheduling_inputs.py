@@ -0,0 +1,73 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0003_timetable_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="division",
+            name="strength",
+            field=models.PositiveIntegerField(
+                blank=True, help_text="Number of students", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="faculty",
+            name="unavailable_slots",
+            field=models.BigIntegerField(
+                default=0,
+                help_text="Weekly bitmask of lectures this faculty cannot take",
+            ),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="capacity",
+            field=models.PositiveIntegerField(
+                blank=True, help_text="Seats; leave blank if unknown", null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="SubjectRequirement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hours_per_week", models.PositiveIntegerField(default=1)),
+                (
+                    "division",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="requirements",
+                        to="generator.division",
+                    ),
+                ),
+                (
+                    "faculty",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="generator.faculty",
+                    ),
+                ),
+                (
+                    "subject",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="generator.subject",
+                    ),
+                ),
+            ],
+        ),
+    ]
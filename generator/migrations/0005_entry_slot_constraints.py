@@ -0,0 +1,105 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:15
+
+import os
+
+from django.db import migrations, models
+
+# Lines of the double bookings listed when the migration stops
+LISTED = 20
+
+
+def resolve_double_bookings(apps, schema_editor):
+    """
+    Existing rows must satisfy the new constraints.
+
+    Double bookings stop the migration with a list of them, so they can be
+    resolved first, e.g. from the clash report. With the environment
+    variable RESOLVE_DOUBLE_BOOKINGS=1 they are resolved here instead, and
+    each change is printed: later duplicates of a division's cell (the grid
+    only ever showed the first) are deleted, and a faculty member or room
+    booked twice in a slot is kept on the first entry and cleared on the
+    others.
+    """
+    TimetableEntry = apps.get_model("generator", "TimetableEntry")
+    seen = {}
+    duplicates = []
+    cleared = []
+    rows = TimetableEntry.objects.order_by("id").values_list(
+        "id",
+        "timetable_id",
+        "day",
+        "timeslot_id",
+        "division_id",
+        "faculty_id",
+        "room_id",
+    )
+    for pk, timetable_id, day, timeslot_id, division_id, faculty_id, room_id in rows:
+        if timetable_id is None:
+            continue
+        slot = (timetable_id, day, timeslot_id)
+        first = seen.setdefault(("division", slot, division_id), pk)
+        if first != pk:
+            duplicates.append((pk, "division", first, slot))
+            continue
+        for field, value in (("faculty", faculty_id), ("room", room_id)):
+            if value is not None:
+                first = seen.setdefault((field, slot, value), pk)
+                if first != pk:
+                    cleared.append((pk, field, first, slot))
+    if not duplicates and not cleared:
+        return
+
+    changes = [
+        f"timetable {slot[0]}, {slot[1]}, timeslot {slot[2]}: entry {pk} double-books the {field} of "
+        + f"entry {first}; " + ("delete it" if field == "division" else f"clear its {field}")
+        for pk, field, first, slot in duplicates + cleared
+    ]
+    if os.environ.get("RESOLVE_DOUBLE_BOOKINGS") != "1":
+        timetables = sorted({slot[0] for _, _, _, slot in duplicates + cleared})
+        raise RuntimeError(
+            f"{len(changes)} existing entries are double-booked, which the new constraints forbid:\n  "
+            + "\n  ".join(changes[:LISTED])
+            + (f"\n  ... and {len(changes) - LISTED} more" if len(changes) > LISTED else "")
+            + "\nResolve them first; /timetable/<id>/clashes/ lists them for timetables "
+            + ", ".join(map(str, timetables))
+            + ". Or rerun with RESOLVE_DOUBLE_BOOKINGS=1 to make the changes listed."
+        )
+    for change in changes:
+        print(f"  Resolving double booking: {change}")
+    TimetableEntry.objects.filter(id__in=[pk for pk, _, _, _ in duplicates]).delete()
+    for pk, field, _, _ in cleared:
+        TimetableEntry.objects.filter(id=pk).update(**{field: None})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0004_scheduling_inputs"),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="timetableentry",
+            constraint=models.UniqueConstraint(
+                fields=("timetable", "day", "timeslot", "division"),
+                name="unique_division_per_slot",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="timetableentry",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("faculty__isnull", False)),
+                fields=("timetable", "day", "timeslot", "faculty"),
+                name="unique_faculty_per_slot",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="timetableentry",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("room__isnull", False)),
+                fields=("timetable", "day", "timeslot", "room"),
+                name="unique_room_per_slot",
+            ),
+        ),
+    ]
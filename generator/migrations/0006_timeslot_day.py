@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0005_entry_slot_constraints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="timeslot",
+            name="day",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("MON", "Monday"),
+                    ("TUE", "Tuesday"),
+                    ("WED", "Wednesday"),
+                    ("THU", "Thursday"),
+                    ("FRI", "Friday"),
+                    ("SAT", "Saturday"),
+                ],
+                help_text="Leave blank for slots shared by every day",
+                max_length=3,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0007_exportjob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="timetableentry",
+            index=models.Index(
+                fields=["timetable", "faculty"], name="entry_timetable_faculty_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timetableentry",
+            index=models.Index(
+                fields=["timetable", "room"], name="entry_timetable_room_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timetableentry",
+            index=models.Index(
+                fields=["timetable", "division"], name="entry_timetable_division_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0008_entry_resource_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="timetable",
+            name="modified_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generator", "0009_timetable_modified_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="timetable",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="timetable_created_idx"
+            ),
+        ),
+    ]
@@ -1,9 +1,22 @@
 from django.db import models
+from django.utils import timezone
+
+# Faculty availability is a weekly bitmask with this many lecture bits per day
+AVAILABILITY_SLOTS_PER_DAY = 10
 
 class Timetable(models.Model):
     name = models.CharField(max_length=100, default="My Timetable")
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    # Bumped whenever entries, timeslots or divisions change; keys the render cache
+    version = models.PositiveIntegerField(default=0, editable=False)
+    modified_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Newest-first history pages, keyed on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='timetable_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
@@ -11,6 +24,11 @@ class Timetable(models.Model):
 class Faculty(models.Model):
     name = models.CharField(max_length=100)
     initials = models.CharField(max_length=10, help_text="e.g., PKP")
+    unavailable_slots = models.BigIntegerField(default=0, help_text="Weekly bitmask of lectures this faculty cannot take")
+
+    def is_available(self, day, lecture_number):
+        bit = availability_bit(day, lecture_number)
+        return bit is None or not (self.unavailable_slots >> bit) & 1
 
     def __str__(self):
         return f"{self.name} ({self.initials})"
@@ -24,6 +42,7 @@ class Subject(models.Model):
 
 class Room(models.Model):
     number = models.CharField(max_length=20, help_text="e.g., 410-C")
+    capacity = models.PositiveIntegerField(null=True, blank=True, help_text="Seats; leave blank if unknown")
 
     def __str__(self):
         return self.number
@@ -31,6 +50,7 @@ class Room(models.Model):
 class Division(models.Model):
     timetable = models.ForeignKey(Timetable, on_delete=models.CASCADE, related_name='divisions', null=True, blank=True)
     name = models.CharField(max_length=10, help_text="e.g., D1")
+    strength = models.PositiveIntegerField(null=True, blank=True, help_text="Number of students")
 
     def __str__(self):
         return self.name
@@ -45,6 +65,7 @@ class TimeSlot(models.Model):
         ('FRI', 'Friday'),
         ('SAT', 'Saturday'),
     ]
+    day = models.CharField(max_length=3, choices=DAY_CHOICES, blank=True, null=True, help_text="Leave blank for slots shared by every day")
     lecture_number = models.IntegerField(help_text="1, 2, 3...")
     start_time = models.TimeField()
     end_time = models.TimeField()
@@ -68,8 +89,82 @@ class TimetableEntry(models.Model):
 
     class Meta:
         verbose_name_plural = "Timetable Entries"
-        # Unique constraint needs to allow multiple timetables now. 
-        # (timetable, day, timeslot, division) should be unique
+        constraints = [
+            # One lecture per division, faculty and room in any slot of a timetable
+            models.UniqueConstraint(
+                fields=['timetable', 'day', 'timeslot', 'division'],
+                name='unique_division_per_slot',
+            ),
+            models.UniqueConstraint(
+                fields=['timetable', 'day', 'timeslot', 'faculty'],
+                condition=models.Q(faculty__isnull=False),
+                name='unique_faculty_per_slot',
+            ),
+            models.UniqueConstraint(
+                fields=['timetable', 'day', 'timeslot', 'room'],
+                condition=models.Q(room__isnull=False),
+                name='unique_room_per_slot',
+            ),
+        ]
+        indexes = [
+            # Per-faculty, per-room and per-division schedules and load totals
+            models.Index(fields=['timetable', 'faculty'], name='entry_timetable_faculty_idx'),
+            models.Index(fields=['timetable', 'room'], name='entry_timetable_room_idx'),
+            models.Index(fields=['timetable', 'division'], name='entry_timetable_division_idx'),
+        ]
     
     def __str__(self):
         return f"{self.day} - {self.timeslot} - {self.division}"
+
+
+class SubjectRequirement(models.Model):
+    """How many lectures a week a division needs of a subject, and who teaches them."""
+    division = models.ForeignKey(Division, on_delete=models.CASCADE, related_name='requirements')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE)
+    hours_per_week = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.division} - {self.subject.code} ({self.faculty.initials}) x{self.hours_per_week}"
+
+
+def day_timeslots(timeslots, day):
+    """The timeslots used on ``day``: its own if it has any, otherwise the shared ones."""
+    own = [ts for ts in timeslots if ts.day == day]
+    return own or [ts for ts in timeslots if not ts.day]
+
+
+def availability_bit(day, lecture_number):
+    """Bit of (day, lecture_number) in Faculty.unavailable_slots, or None if it has none."""
+    day_index = [code for code, _ in TimeSlot.DAY_CHOICES].index(day)
+    if not 1 <= lecture_number <= AVAILABILITY_SLOTS_PER_DAY:
+        return None
+    return day_index * AVAILABILITY_SLOTS_PER_DAY + lecture_number - 1
+
+
+class ExportJob(models.Model):
+    """A PDF/Excel export rendered in the background and kept on disk."""
+    KIND_CHOICES = [
+        ('pdf', 'PDF'),
+        ('xlsx', 'Excel'),
+        ('xlsx_divisions', 'Excel by division'),
+        ('xlsx_all', 'Excel, all timetables'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    timetable = models.ForeignKey(Timetable, on_delete=models.CASCADE, related_name='export_jobs', null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Identifies the exported content (kind + timetable version); equal keys share one artifact
+    key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} export #{self.id} ({self.status})"
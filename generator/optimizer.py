@@ -0,0 +1,360 @@
+"""
+Soft-constraint optimisation of a clash-free timetable.
+
+A timetable without clashes can still be a poor one. The score is a
+weighted sum of penalties:
+
+* ``faculty_gaps`` / ``division_gaps``: free lectures between the first
+  and last lecture of a faculty member's or division's day;
+* ``repeats``: lectures of a subject beyond the first on one day of a
+  division;
+* ``crowding``: lectures of a faculty member or division on one day beyond
+  their even share of the week (their weekly lectures over the days that
+  have teaching slots, rounded up).
+
+Simulated annealing lowers it. Each step takes a random lecture and a
+random slot of the week. The lecture moves there if its division is free,
+or swaps slots with its division's lecture there. Hard constraints hold
+throughout: no double bookings, faculty unavailable slots, and room
+capacities. A lecture keeps its room when the room is free at the new
+slot, else it takes the smallest free room that seats the division.
+
+Every penalty belongs to one (faculty member, day), (division, day) or
+(division, subject, day), and busy slots are bitmasks as in
+``generator.solver``. So a step's score change is the sum over the few
+terms of the days it touches, computed before and after the move, not a
+rescoring of the whole grid.
+"""
+import math
+import random
+import time
+from collections import defaultdict
+
+from .models import Division, Faculty, Room, TimeSlot, TimetableEntry, availability_bit, day_timeslots
+from .occupancy import OccupancyIndex
+from .services import clone_timetable
+
+DEFAULT_WEIGHTS = {'faculty_gaps': 3, 'division_gaps': 2, 'repeats': 4, 'crowding': 1}
+PENALTIES = tuple(DEFAULT_WEIGHTS)
+
+# Temperature falls from the initial one to this share of it over the run
+FINAL_TEMPERATURE = 0.002
+
+
+def _gaps(mask):
+    if not mask:
+        return 0
+    return mask.bit_length() - (mask & -mask).bit_length() + 1 - mask.bit_count()
+
+
+class Schedule:
+    """
+    Lectures on plain values, like ``generator.solver.Problem``.
+
+    slot_days: day key of each teaching slot, in week order; a day's slots are
+               contiguous and in lecture order
+    lessons:   (key, slot index, division, subject, faculty, room) tuples;
+               subject, faculty and room may be None
+    divisions: {division: strength or None}
+    faculty:   {faculty: bitmask of unavailable slot indexes}
+    rooms:     {room: capacity or None}
+    """
+
+    def __init__(self, slot_days, lessons, divisions, faculty, rooms, weights=None):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.slot_count = len(slot_days)
+        day_keys = list(dict.fromkeys(slot_days))
+        self.day_of = [day_keys.index(day) for day in slot_days]
+        self.day_shift = [self.day_of.index(d) for d in range(len(day_keys))]
+        self.day_mask = [(1 << self.day_of.count(d)) - 1 for d in range(len(day_keys))]
+
+        lessons = list(lessons)
+        self.keys = [lesson[0] for lesson in lessons]
+        self.slot = [lesson[1] for lesson in lessons]
+        self.division = [lesson[2] for lesson in lessons]
+        self.subject = [lesson[3] for lesson in lessons]
+        self.faculty = [lesson[4] for lesson in lessons]
+        self.room = [lesson[5] for lesson in lessons]
+
+        self.strength = dict(divisions)
+        self.capacity = dict(rooms)
+        self.unavailable = defaultdict(int, faculty)
+        # Smallest rooms first, so big rooms stay free for big divisions
+        self.rooms_by_size = sorted(self.capacity, key=lambda room: (self.capacity[room] is None, self.capacity[room] or 0))
+
+        self.busy = {'division': defaultdict(int), 'faculty': defaultdict(int), 'room': defaultdict(int)}
+        self.subject_days = defaultdict(int)
+        self.occupant = {}
+        for i in range(len(self.keys)):
+            self._book(i, self.slot[i], self.room[i])
+
+        # Even share of the week for each faculty member and division
+        weekly = defaultdict(int)
+        for i in range(len(self.keys)):
+            weekly[('division', self.division[i])] += 1
+            if self.faculty[i] is not None:
+                weekly[('faculty', self.faculty[i])] += 1
+        days = max(len(day_keys), 1)
+        self.share = {key: -(-count // days) for key, count in weekly.items()}
+
+    def _book(self, i, s, room):
+        bit = 1 << s
+        self.busy['division'][self.division[i]] |= bit
+        if self.faculty[i] is not None:
+            self.busy['faculty'][self.faculty[i]] |= bit
+        if room is not None:
+            self.busy['room'][room] |= bit
+        if self.subject[i] is not None:
+            self.subject_days[(self.division[i], self.subject[i], self.day_of[s])] += 1
+        self.occupant[(s, self.division[i])] = i
+        self.slot[i], self.room[i] = s, room
+
+    def _release(self, i):
+        s, room = self.slot[i], self.room[i]
+        bit = ~(1 << s)
+        self.busy['division'][self.division[i]] &= bit
+        if self.faculty[i] is not None:
+            self.busy['faculty'][self.faculty[i]] &= bit
+        if room is not None:
+            self.busy['room'][room] &= bit
+        if self.subject[i] is not None:
+            self.subject_days[(self.division[i], self.subject[i], self.day_of[s])] -= 1
+        del self.occupant[(s, self.division[i])]
+        return s, room
+
+    def _room_at(self, i, s, current):
+        """``current`` if it is free at ``s``, else the smallest free room seating the division; False if none."""
+        if current is None:
+            return None
+        bit = 1 << s
+        if not self.busy['room'][current] & bit:
+            return current
+        strength = self.strength.get(self.division[i])
+        for room in self.rooms_by_size:
+            capacity = self.capacity[room]
+            if not self.busy['room'][room] & bit and (strength is None or capacity is None or capacity >= strength):
+                return room
+        return False
+
+    def _fits(self, i, s):
+        bit = 1 << s
+        if self.busy['division'][self.division[i]] & bit:
+            return False
+        faculty = self.faculty[i]
+        return faculty is None or not (self.busy['faculty'][faculty] | self.unavailable[faculty]) & bit
+
+    def relocate(self, moves):
+        """
+        Put lecture i in slot s for each (i, s) in ``moves``, or change
+        nothing if that breaks a hard constraint. Returns the previous
+        (i, slot, room) of each lecture, or None.
+        """
+        previous = [(i, *self._release(i)) for i, _ in moves]
+        placed = []
+        for (i, s), (_, _, room) in zip(moves, previous):
+            new_room = self._room_at(i, s, room) if self._fits(i, s) else False
+            if new_room is False:
+                for j in placed:
+                    self._release(j)
+                for j, old_s, old_room in previous:
+                    self._book(j, old_s, old_room)
+                return None
+            self._book(i, s, new_room)
+            placed.append(i)
+        return previous
+
+    def restore(self, previous):
+        for i, _, _ in previous:
+            self._release(i)
+        for i, s, room in previous:
+            self._book(i, s, room)
+
+    def terms(self, lessons, days):
+        """Keys of the penalty terms the lectures have on any of the day indexes."""
+        keys = set()
+        for i in lessons:
+            for d in days:
+                keys.add(('division', self.division[i], d))
+                if self.faculty[i] is not None:
+                    keys.add(('faculty', self.faculty[i], d))
+                if self.subject[i] is not None:
+                    keys.add(('subject', (self.division[i], self.subject[i]), d))
+        return keys
+
+    def penalties(self, key):
+        """{penalty: count} of one term."""
+        kind, resource, d = key
+        if kind == 'subject':
+            return {'repeats': max(self.subject_days[(*resource, d)] - 1, 0)}
+        mask = (self.busy[kind][resource] >> self.day_shift[d]) & self.day_mask[d]
+        return {f'{kind}_gaps': _gaps(mask), 'crowding': max(mask.bit_count() - self.share[(kind, resource)], 0)}
+
+    def cost(self, keys):
+        weights = self.weights
+        return sum(weights[name] * count for key in keys for name, count in self.penalties(key).items())
+
+    def all_terms(self):
+        return self.terms(range(len(self.keys)), range(len(self.day_mask)))
+
+    def breakdown(self):
+        totals = dict.fromkeys(PENALTIES, 0)
+        for key in self.all_terms():
+            for name, count in self.penalties(key).items():
+                totals[name] += count
+        return totals
+
+    def score(self):
+        return self.cost(self.all_terms())
+
+    def step(self, rng):
+        """(term keys, moves) of a random move or swap, or None; relocate() checks the hard constraints."""
+        i = rng.randrange(len(self.keys))
+        s, t = self.slot[i], rng.randrange(self.slot_count)
+        if s == t:
+            return None
+        moves = [(i, t)]
+        j = self.occupant.get((t, self.division[i]))
+        if j is not None:
+            moves.append((j, s))
+        keys = self.terms([i] if j is None else [i, j], {self.day_of[s], self.day_of[t]})
+        return keys, moves
+
+
+class Optimization:
+    def __init__(self, before, after, breakdown_before, breakdown_after, iterations, accepted, moved, elapsed):
+        self.before = before
+        self.after = after
+        self.breakdown_before = breakdown_before
+        self.breakdown_after = breakdown_after
+        self.iterations = iterations
+        self.accepted = accepted
+        # Lectures whose slot or room differs from the start
+        self.moved = moved
+        self.elapsed = elapsed
+        self.timetable = None
+
+    def __repr__(self):
+        return (f"<Optimization score={self.before}->{self.after} moved={self.moved} "
+                f"iterations={self.iterations} elapsed={self.elapsed:.3f}s>")
+
+
+def anneal(schedule, time_limit=10.0, iterations=None, seed=None):
+    """
+    Lower the schedule's score by simulated annealing, leaving it at the best
+    assignment found. Runs for ``time_limit`` seconds, or exactly
+    ``iterations`` steps when given.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    start = list(zip(schedule.slot, schedule.room))
+    score = best = before = schedule.score()
+    breakdown_before = schedule.breakdown()
+    best_state = list(start)
+
+    # Start hot enough to take a typical worsening step about half the time
+    rises = []
+    for _ in range(200 if schedule.keys else 0):
+        proposal = schedule.step(rng)
+        if proposal is None:
+            continue
+        keys, moves = proposal
+        cost = schedule.cost(keys)
+        previous = schedule.relocate(moves)
+        if previous is None:
+            continue
+        delta = schedule.cost(keys) - cost
+        schedule.restore(previous)
+        if delta > 0:
+            rises.append(delta)
+    initial = (sum(rises) / len(rises)) / math.log(2) if rises else 1.0
+
+    done = accepted = 0
+    temperature = initial
+    while schedule.keys and done != iterations:
+        if done & 255 == 0:
+            progress = done / iterations if iterations else (time.perf_counter() - started) / time_limit
+            if progress >= 1:
+                break
+            temperature = initial * FINAL_TEMPERATURE ** progress
+        done += 1
+        proposal = schedule.step(rng)
+        if proposal is None:
+            continue
+        keys, moves = proposal
+        cost = schedule.cost(keys)
+        previous = schedule.relocate(moves)
+        if previous is None:
+            continue
+        delta = schedule.cost(keys) - cost
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            accepted += 1
+            score += delta
+            if score < best:
+                best = score
+                best_state = list(zip(schedule.slot, schedule.room))
+        else:
+            schedule.restore(previous)
+
+    # Back to the best assignment seen
+    for i in range(len(schedule.keys)):
+        schedule._release(i)
+    for i, (s, room) in enumerate(best_state):
+        schedule._book(i, s, room)
+    moved = sum(1 for old, new in zip(start, best_state) if old != new)
+    return Optimization(before, best, breakdown_before, schedule.breakdown(), done, accepted, moved,
+                        time.perf_counter() - started)
+
+
+def build_schedule(timetable, weights=None):
+    """The timetable's entries as a Schedule, and its (day, timeslot_id) slots."""
+    timeslots = list(TimeSlot.objects.filter(timetable=timetable, is_break=False).order_by('lecture_number'))
+    slots = [(day, ts.id) for day, _ in TimeSlot.DAY_CHOICES for ts in day_timeslots(timeslots, day)]
+    slot_index = {slot: i for i, slot in enumerate(slots)}
+    lecture_numbers = {ts.id: ts.lecture_number for ts in timeslots}
+
+    rows = TimetableEntry.objects.filter(timetable=timetable).order_by('id').values_list(
+        'id', 'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id')
+    lessons, fixed = [], []
+    for pk, day, timeslot_id, division_id, subject_id, faculty_id, room_id in rows:
+        s = slot_index.get((day, timeslot_id))
+        if s is None:
+            # Not in a teaching slot of its day; copied as it is
+            fixed.append((day, timeslot_id, division_id, subject_id, faculty_id, room_id))
+        else:
+            lessons.append((pk, s, division_id, subject_id, faculty_id, room_id))
+
+    faculty = {}
+    for pk, unavailable in Faculty.objects.filter(id__in={lesson[4] for lesson in lessons}).values_list(
+            'id', 'unavailable_slots'):
+        mask = 0
+        for i, (day, timeslot_id) in enumerate(slots):
+            bit = availability_bit(day, lecture_numbers[timeslot_id])
+            if bit is not None and (unavailable >> bit) & 1:
+                mask |= 1 << i
+        faculty[pk] = mask
+    divisions = dict(Division.objects.filter(timetable=timetable).values_list('id', 'strength'))
+    rooms = dict(Room.objects.values_list('id', 'capacity'))
+    schedule = Schedule([day for day, _ in slots], lessons, divisions, faculty, rooms, weights)
+    return schedule, slots, fixed
+
+
+def optimize_timetable(timetable, time_limit=10.0, iterations=None, seed=None, weights=None, name=None,
+                       activate=False):
+    """
+    Anneal a copy of the timetable's grid and, if it scores better, save it
+    as a new timetable. Timetables with clashes are refused with ValueError,
+    as the penalties assume every slot holds one lecture per resource.
+    """
+    if OccupancyIndex(timetable).clashes():
+        raise ValueError("The timetable has clashes; repair them before optimising it.")
+    schedule, slots, fixed = build_schedule(timetable, weights)
+    result = anneal(schedule, time_limit=time_limit, iterations=iterations, seed=seed)
+    if result.after >= result.before:
+        return result
+    entries = fixed + [
+        (*slots[s], schedule.division[i], schedule.subject[i], schedule.faculty[i], schedule.room[i])
+        for i, s in enumerate(schedule.slot)
+    ]
+    result.timetable = clone_timetable(timetable, name=name or f"{timetable.name} (optimised)",
+                                       activate=activate, entries=entries)
+    return result
@@ -0,0 +1,236 @@
+"""
+Repairing a timetable after a faculty member or room drops out.
+
+Only the entries the change affects are touched. They are taken out of the
+occupancy bitmaps (one bit per teaching slot, as in ``generator.solver``)
+and put back one at a time, the entry with the fewest options first, each
+with the cheapest fix available:
+
+1. ``room``: same slot, another free room that seats the division;
+2. ``move``: another slot free for the division and faculty member, on the
+   same day and close to the old slot if possible;
+3. ``swap``: trade slots with another lecture of the same division whose
+   faculty member is free at the old slot.
+
+Entries none of these can fix are left in place and reported. Everything is
+planned in memory from five queries and applied in one transaction.
+"""
+import time
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import (Division, Faculty, Room, TimeSlot, TimetableEntry, availability_bit,
+                     day_timeslots)
+from .signals import batched_writes
+
+# old and new are (day, timeslot_id, room_id)
+RepairMove = namedtuple('RepairMove', ['entry_id', 'kind', 'division_id', 'old', 'new'])
+
+
+class Repair:
+    def __init__(self, moves, unresolved, affected, elapsed, applied):
+        self.moves = moves
+        # Entry ids that could not be moved without a clash
+        self.unresolved = unresolved
+        self.affected = affected
+        self.elapsed = elapsed
+        self.applied = applied
+
+    @property
+    def changed_entries(self):
+        return len({move.entry_id for move in self.moves})
+
+    def __repr__(self):
+        return (f"<Repair affected={self.affected} moves={len(self.moves)} "
+                f"unresolved={len(self.unresolved)} elapsed={self.elapsed:.3f}s>")
+
+
+class _Planner:
+    def __init__(self, timetable, faculty_id, blocked, room_id):
+        timeslots = list(TimeSlot.objects.filter(timetable=timetable, is_break=False).order_by('lecture_number'))
+        self.slots = [(day, ts.id) for day, _ in TimeSlot.DAY_CHOICES for ts in day_timeslots(timeslots, day)]
+        self.slot_index = {slot: i for i, slot in enumerate(self.slots)}
+        lecture_numbers = {ts.id: ts.lecture_number for ts in timeslots}
+        self.all_slots = (1 << len(self.slots)) - 1
+        self.removed_room = room_id
+
+        self.entries = {
+            row[0]: row for row in TimetableEntry.objects.filter(timetable=timetable).values_list(
+                'id', 'day', 'timeslot_id', 'division_id', 'faculty_id', 'room_id')
+            if (row[1], row[2]) in self.slot_index
+        }
+        self.strength = dict(Division.objects.filter(timetable=timetable).values_list('id', 'strength'))
+        # Smallest rooms first, so big rooms stay free for big divisions
+        self.rooms = sorted(
+            ((pk, capacity) for pk, capacity in Room.objects.order_by('id').values_list('id', 'capacity')
+             if pk != room_id),
+            key=lambda room: (room[1] is None, room[1] or 0),
+        )
+
+        # Slots each faculty member cannot take, including the new ones
+        faculty_ids = {row[4] for row in self.entries.values() if row[4] is not None}
+        self.unavailable = {}
+        for pk, mask in Faculty.objects.filter(id__in=faculty_ids).values_list('id', 'unavailable_slots'):
+            bits = 0
+            for i, (day, timeslot_id) in enumerate(self.slots):
+                bit = availability_bit(day, lecture_numbers[timeslot_id])
+                if bit is not None and (mask >> bit) & 1:
+                    bits |= 1 << i
+            self.unavailable[pk] = bits
+        if faculty_id is not None:
+            for i, (day, timeslot_id) in enumerate(self.slots):
+                if (day, lecture_numbers[timeslot_id]) in blocked:
+                    self.unavailable[faculty_id] = self.unavailable.get(faculty_id, 0) | 1 << i
+
+        self.busy = {'division': {}, 'faculty': {}, 'room': {}}
+        self.occupant = {}
+        self.position = {}
+        for row in self.entries.values():
+            self.book(row[0], self.slot_index[(row[1], row[2])], row[5])
+
+    def book(self, entry_id, s, room_id):
+        _, _, _, division_id, faculty_id, _ = self.entries[entry_id]
+        bit = 1 << s
+        for kind, resource in (('division', division_id), ('faculty', faculty_id), ('room', room_id)):
+            if resource is not None:
+                self.busy[kind][resource] = self.busy[kind].get(resource, 0) | bit
+        self.occupant[(s, division_id)] = entry_id
+        self.position[entry_id] = (s, room_id)
+
+    def release(self, entry_id):
+        _, _, _, division_id, faculty_id, _ = self.entries[entry_id]
+        s, room_id = self.position.pop(entry_id)
+        bit = ~(1 << s)
+        for kind, resource in (('division', division_id), ('faculty', faculty_id), ('room', room_id)):
+            if resource is not None:
+                self.busy[kind][resource] &= bit
+        self.occupant.pop((s, division_id), None)
+        return s, room_id
+
+    def free_slots(self, entry_id):
+        """Slots the entry's division and faculty member are both free in."""
+        _, _, _, division_id, faculty_id, _ = self.entries[entry_id]
+        mask = self.all_slots & ~self.busy['division'].get(division_id, 0)
+        if faculty_id is not None:
+            mask &= ~self.busy['faculty'].get(faculty_id, 0) & ~self.unavailable.get(faculty_id, 0)
+        return mask
+
+    def room_for(self, entry_id, s, current):
+        """``current`` if it is still usable and free at ``s``, else the smallest free room that fits; False if none."""
+        if current is None:
+            return None
+        bit = 1 << s
+        if current != self.removed_room and not self.busy['room'].get(current, 0) & bit:
+            return current
+        strength = self.strength.get(self.entries[entry_id][3])
+        for pk, capacity in self.rooms:
+            if not self.busy['room'].get(pk, 0) & bit and (strength is None or capacity is None or capacity >= strength):
+                return pk
+        return False
+
+    def nearby(self, mask, s0):
+        """Slot indexes in ``mask``, same day first, then by distance from ``s0``."""
+        day = self.slots[s0][0]
+        found = []
+        while mask:
+            low = mask & -mask
+            s = low.bit_length() - 1
+            mask ^= low
+            found.append((self.slots[s][0] != day, abs(s - s0), s))
+        return [s for _, _, s in sorted(found)]
+
+    def fix(self, entry_id, s0, room0):
+        """Book the entry somewhere valid; returns the moves made, or None."""
+        free = self.free_slots(entry_id)
+        division_id = self.entries[entry_id][3]
+        if free & (1 << s0):
+            room = self.room_for(entry_id, s0, room0)
+            if room is not False:
+                self.book(entry_id, s0, room)
+                return [('room', entry_id, s0, room0, s0, room)]
+        for s in self.nearby(free, s0):
+            room = self.room_for(entry_id, s, room0)
+            if room is not False:
+                self.book(entry_id, s, room)
+                return [('move', entry_id, s0, room0, s, room)]
+        for s in self.nearby(self.all_slots & ~(1 << s0), s0):
+            other = self.occupant.get((s, division_id))
+            if other is None or other in self.moved:
+                continue
+            s2, room2 = self.release(other)
+            room = self.room_for(entry_id, s2, room0) if self.free_slots(entry_id) & (1 << s2) else False
+            if room is not False:
+                self.book(entry_id, s2, room)
+                other_room = self.room_for(other, s0, room2) if self.free_slots(other) & (1 << s0) else False
+                if other_room is not False:
+                    self.book(other, s0, other_room)
+                    return [('swap', entry_id, s0, room0, s2, room), ('swap', other, s2, room2, s0, other_room)]
+                self.release(entry_id)
+            self.book(other, s2, room2)
+        return None
+
+    def plan(self, faculty_id, room_id):
+        affected = []
+        for entry_id, (_, day, timeslot_id, _, entry_faculty, entry_room) in self.entries.items():
+            s = self.slot_index[(day, timeslot_id)]
+            if (entry_faculty is not None and entry_faculty == faculty_id
+                    and self.unavailable.get(faculty_id, 0) >> s & 1) or (entry_room is not None and entry_room == room_id):
+                affected.append(entry_id)
+        pending = {entry_id: self.release(entry_id) for entry_id in affected}
+
+        self.moved = set()
+        moves, unresolved = [], []
+        while pending:
+            # Fewest free slots first; those are the ones to run out of options
+            entry_id = min(pending, key=lambda pk: (self.free_slots(pk).bit_count(), pk))
+            s0, room0 = pending.pop(entry_id)
+            made = self.fix(entry_id, s0, room0)
+            if made is None:
+                self.book(entry_id, s0, room0)
+                unresolved.append(entry_id)
+                continue
+            for kind, pk, old_s, old_room, new_s, new_room in made:
+                self.moved.add(pk)
+                moves.append(RepairMove(pk, kind, self.entries[pk][3],
+                                        (*self.slots[old_s], old_room), (*self.slots[new_s], new_room)))
+        return affected, moves, unresolved
+
+
+def repair_timetable(timetable, faculty_id=None, blocked=(), room_id=None, dry_run=False, mark_unavailable=False):
+    """
+    Move the entries affected by ``faculty_id`` becoming unavailable in the
+    ``blocked`` (day, lecture_number) slots and/or by ``room_id`` being taken
+    out of use, with as few changes as possible.
+
+    Unless ``dry_run``, the moves are saved in one transaction. The blocked
+    lectures only apply to this repair; ``mark_unavailable`` also adds them to
+    the faculty member's unavailable_slots, which every timetable shares.
+    """
+    started = time.perf_counter()
+    blocked = set(blocked)
+    with transaction.atomic():
+        planner = _Planner(timetable, faculty_id, blocked, room_id)
+        affected, moves, unresolved = planner.plan(faculty_id, room_id)
+        if not dry_run:
+            # Where each moved entry ends up
+            final = {move.entry_id: move.new for move in moves}
+            if final:
+                entries = {entry.id: entry for entry in TimetableEntry.objects.filter(id__in=final)}
+                for entry_id, (day, timeslot_id, room_id_) in final.items():
+                    entry = entries[entry_id]
+                    entry.day, entry.timeslot_id, entry.room_id = day, timeslot_id, room_id_
+                # Swaps pass through states the unique constraints reject, so the
+                # moved rows are deleted and inserted again with the same ids
+                with batched_writes(timetable.id):
+                    TimetableEntry.objects.filter(id__in=final).delete()
+                    TimetableEntry.objects.bulk_create(entries.values())
+            mask = 0
+            for day, lecture_number in blocked:
+                bit = availability_bit(day, lecture_number)
+                if bit is not None:
+                    mask |= 1 << bit
+            if mark_unavailable and faculty_id is not None and mask:
+                Faculty.objects.filter(id=faculty_id).update(unavailable_slots=F('unavailable_slots').bitor(mask))
+    return Repair(moves, unresolved, len(affected), time.perf_counter() - started, not dry_run)
@@ -0,0 +1,82 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .models import (Division, Faculty, Room, SubjectRequirement, TimeSlot, TimetableEntry,
+                     availability_bit, day_timeslots)
+from .signals import batched_writes
+from .solver import Problem, solve
+
+
+def build_problem(timetable, keep_existing=True):
+    """
+    Translate a timetable's requirements into a solver Problem.
+
+    Slots are (day, timeslot_id) pairs of the non-break timeslots. With
+    ``keep_existing`` the entries already in the grid stay where they are and
+    count towards the requirement they match.
+    """
+    timeslots = list(TimeSlot.objects.filter(timetable=timetable, is_break=False).order_by('lecture_number'))
+    slots = [(day, ts.id) for day, _ in TimeSlot.DAY_CHOICES for ts in day_timeslots(timeslots, day)]
+    slot_days = [day for day, _ in slots]
+    lecture_numbers = {ts.id: ts.lecture_number for ts in timeslots}
+
+    divisions = dict(Division.objects.filter(timetable=timetable).values_list('id', 'strength'))
+    requirements = list(
+        SubjectRequirement.objects.filter(division__timetable=timetable)
+        .values_list('id', 'division_id', 'subject_id', 'faculty_id', 'hours_per_week')
+    )
+
+    fixed = []
+    covered = Counter()
+    if keep_existing:
+        entries = TimetableEntry.objects.filter(timetable=timetable).values_list(
+            'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id')
+        for day, timeslot_id, division_id, subject_id, faculty_id, room_id in entries:
+            fixed.append(((day, timeslot_id), division_id, faculty_id, room_id))
+            covered[(division_id, subject_id, faculty_id)] += 1
+
+    adjusted = []
+    for pk, division_id, subject_id, faculty_id, hours in requirements:
+        key = (division_id, subject_id, faculty_id)
+        taken = min(hours, covered[key])
+        covered[key] -= taken
+        adjusted.append((pk, division_id, subject_id, faculty_id, hours - taken))
+
+    faculty = {}
+    masks = Faculty.objects.filter(id__in={r[3] for r in requirements}).values_list('id', 'unavailable_slots')
+    for faculty_id, unavailable in masks:
+        mask = 0
+        for i, (day, timeslot_id) in enumerate(slots):
+            bit = availability_bit(day, lecture_numbers[timeslot_id])
+            if bit is not None and (unavailable >> bit) & 1:
+                mask |= 1 << i
+        faculty[faculty_id] = mask
+
+    rooms = dict(Room.objects.values_list('id', 'capacity'))
+    return Problem(slots, slot_days, divisions, faculty, rooms, adjusted, fixed)
+
+
+def generate_timetable(timetable, clear=False, time_limit=10.0, seed=None):
+    """Fill the timetable from its SubjectRequirements and save the new entries."""
+    # One version bump and one refresh for the clear and the new entries together
+    with transaction.atomic(), batched_writes(timetable.id):
+        if clear:
+            TimetableEntry.objects.filter(timetable=timetable).delete()
+        problem = build_problem(timetable)
+        solution = solve(problem, time_limit=time_limit, seed=seed)
+
+        requirements = {r.key: r for r in problem.requirements}
+        TimetableEntry.objects.bulk_create([
+            TimetableEntry(
+                timetable=timetable,
+                day=p.slot[0],
+                timeslot_id=p.slot[1],
+                division_id=requirements[p.requirement].division,
+                subject_id=requirements[p.requirement].subject,
+                faculty_id=requirements[p.requirement].faculty,
+                room_id=p.room,
+            )
+            for p in solution.placements
+        ], batch_size=500)
+    return solution
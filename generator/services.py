@@ -0,0 +1,162 @@
+import datetime
+
+from django.db import transaction
+
+from .models import Division, SubjectRequirement, TimeSlot, Timetable, TimetableEntry
+
+DAY_CODES = [code for code, _ in TimeSlot.DAY_CHOICES]
+
+
+def parse_pattern(text, break_duration):
+    """
+    Parse a day pattern such as ``"2, B, 2, B15, 1"``.
+
+    Numbers are runs of lectures and ``B`` is a break, optionally followed by
+    its length in minutes (``break_duration`` otherwise). Returns a list of
+    ('lecture', count) and ('break', minutes) blocks; raises ValueError.
+    """
+    blocks = []
+    for token in text.replace(' ', '').upper().split(','):
+        if not token:
+            continue
+        try:
+            if token.startswith('B'):
+                minutes = int(token[1:]) if token[1:] else break_duration
+                count = None
+            else:
+                count = int(token)
+        except ValueError:
+            raise ValueError(f"Not a lecture count or break: {token}")
+        if count is None:
+            if minutes <= 0:
+                raise ValueError(f"Break length must be positive: {token}")
+            blocks.append(('break', minutes))
+        else:
+            if count < 0:
+                raise ValueError(f"Lecture count cannot be negative: {token}")
+            blocks.append(('lecture', count))
+    if not any(kind == 'lecture' and n for kind, n in blocks):
+        raise ValueError("A pattern needs at least one lecture.")
+    return blocks
+
+
+def parse_day_patterns(text, break_duration):
+    """Parse lines like ``SAT: 2, B30, 2`` into {day_code: blocks}; raises ValueError."""
+    day_blocks = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        day, sep, pattern = line.partition(':')
+        day = day.strip().upper()[:3]
+        if not sep or day not in DAY_CODES:
+            raise ValueError(f"Expected 'DAY: pattern', got: {line.strip()}")
+        day_blocks[day] = parse_pattern(pattern, break_duration)
+    return day_blocks
+
+
+def default_pattern(slots_before_break, slots_after_break, break_duration):
+    return [('lecture', slots_before_break), ('break', break_duration), ('lecture', slots_after_break)]
+
+
+def build_timeslots(timetable, start_time, slot_duration, blocks, day=None):
+    """Unsaved TimeSlots for one day pattern, starting at start_time."""
+    current_time = datetime.datetime.combine(datetime.date.today(), start_time)
+    lecture_num = 1
+    slots = []
+    for kind, value in blocks:
+        if kind == 'break':
+            end_time = current_time + datetime.timedelta(minutes=value)
+            # A break shares its number with the lecture after it
+            slots.append(TimeSlot(
+                timetable=timetable,
+                day=day,
+                lecture_number=lecture_num,
+                start_time=current_time.time(),
+                end_time=end_time.time(),
+                is_break=True
+            ))
+            current_time = end_time
+            continue
+        for _ in range(value):
+            end_time = current_time + datetime.timedelta(minutes=slot_duration)
+            slots.append(TimeSlot(
+                timetable=timetable,
+                day=day,
+                lecture_number=lecture_num,
+                start_time=current_time.time(),
+                end_time=end_time.time()
+            ))
+            current_time = end_time
+            lecture_num += 1
+    return slots
+
+
+def create_timetable_structure(division_names, start_time, slot_duration, blocks, day_blocks=None, name=None):
+    """
+    Create a new active timetable with its divisions and timeslots.
+
+    ``blocks`` is the pattern shared by every day (see parse_pattern), and
+    ``day_blocks`` optionally maps day codes to their own pattern. All rows
+    are built in memory and written with bulk_create in one transaction.
+    """
+    with transaction.atomic():
+        Timetable.objects.filter(is_active=True).update(is_active=False)
+        timetable = Timetable.objects.create(
+            name=name or f"Timetable {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
+
+        Division.objects.bulk_create([Division(name=n, timetable=timetable) for n in division_names])
+
+        slots = build_timeslots(timetable, start_time, slot_duration, blocks)
+        for day, day_pattern in (day_blocks or {}).items():
+            slots.extend(build_timeslots(timetable, start_time, slot_duration, day_pattern, day=day))
+        TimeSlot.objects.bulk_create(slots)
+    return timetable
+
+
+def clone_timetable(timetable, name=None, activate=True, entries=None):
+    """
+    Copy a timetable with its divisions, timeslots, subject requirements and
+    entries. Each table is copied with one bulk_create, and foreign keys are
+    remapped through the old-to-new id maps.
+
+    ``entries`` replaces the timetable's own entries with (day, timeslot_id,
+    division_id, subject_id, faculty_id, room_id) rows in its ids.
+    """
+    with transaction.atomic():
+        if activate:
+            Timetable.objects.filter(is_active=True).update(is_active=False)
+        clone = Timetable.objects.create(name=name or f"{timetable.name} (copy)", is_active=activate)
+
+        divisions = list(Division.objects.filter(timetable=timetable).order_by('id'))
+        copies = Division.objects.bulk_create(
+            [Division(timetable=clone, name=d.name, strength=d.strength) for d in divisions])
+        division_map = {old.id: new.id for old, new in zip(divisions, copies)}
+
+        timeslots = list(TimeSlot.objects.filter(timetable=timetable).order_by('id'))
+        copies = TimeSlot.objects.bulk_create([
+            TimeSlot(timetable=clone, day=ts.day, lecture_number=ts.lecture_number,
+                     start_time=ts.start_time, end_time=ts.end_time, is_break=ts.is_break)
+            for ts in timeslots
+        ])
+        timeslot_map = {old.id: new.id for old, new in zip(timeslots, copies)}
+
+        SubjectRequirement.objects.bulk_create([
+            SubjectRequirement(division_id=division_map[division_id], subject_id=subject_id,
+                               faculty_id=faculty_id, hours_per_week=hours)
+            for division_id, subject_id, faculty_id, hours in SubjectRequirement.objects.filter(
+                division__timetable=timetable).values_list('division_id', 'subject_id', 'faculty_id', 'hours_per_week')
+        ])
+
+        rows = entries
+        if rows is None:
+            rows = TimetableEntry.objects.filter(timetable=timetable).values_list(
+                'day', 'timeslot_id', 'division_id', 'subject_id', 'faculty_id', 'room_id').iterator()
+        TimetableEntry.objects.bulk_create([
+            TimetableEntry(timetable=clone, day=day, timeslot_id=timeslot_map[timeslot_id],
+                           division_id=division_map[division_id], subject_id=subject_id,
+                           faculty_id=faculty_id, room_id=room_id)
+            for day, timeslot_id, division_id, subject_id, faculty_id, room_id in rows
+            # Rows pointing at another timetable's slots or divisions cannot be remapped
+            if timeslot_id in timeslot_map and division_id in division_map
+        ], batch_size=1000)
+    return clone
@@ -0,0 +1,104 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import live
+from .models import Division, Faculty, Room, Subject, TimeSlot, Timetable, TimetableEntry
+
+
+def _bump(timetable_ids):
+    ids = {pk for pk in timetable_ids if pk is not None}
+    if ids:
+        Timetable.objects.filter(pk__in=ids).update(version=F('version') + 1, modified_at=timezone.now())
+    return ids
+
+
+def bump_version(*timetable_ids):
+    """
+    Invalidate cached renders of the given timetables, mark them modified and
+    tell live viewers to reload. Call it after bulk writes, which skip signals.
+    """
+    for pk in _bump(timetable_ids):
+        live.publish_on_commit(pk, 'refresh', {})
+
+
+_batched = contextvars.ContextVar('entry_signals_batched', default=False)
+
+
+@contextmanager
+def batched_writes(*timetable_ids):
+    """
+    Skip the per-entry version bumps and live cell events of the deletes and
+    saves inside the block, and bump the timetables once when it succeeds.
+    """
+    token = _batched.set(True)
+    try:
+        yield
+    finally:
+        _batched.reset(token)
+    bump_version(*timetable_ids)
+
+
+def _version(timetable_id):
+    # Read inside the write's transaction, so it is the version the write made
+    return Timetable.objects.filter(pk=timetable_id).values_list('version', flat=True).first()
+
+
+@receiver(pre_save, sender=TimetableEntry)
+def entry_moving(sender, instance, **kwargs):
+    if _batched.get():
+        return
+    # Live viewers need to clear the cell an edited entry moves out of
+    if instance.pk and live.broker.has_subscribers(instance.timetable_id):
+        instance._live_previous = TimetableEntry.objects.filter(pk=instance.pk).values_list(
+            'day', 'timeslot_id', 'division_id').first()
+
+
+@receiver(post_save, sender=TimetableEntry)
+def entry_saved(sender, instance, **kwargs):
+    if _batched.get():
+        return
+    _bump([instance.timetable_id])
+    if not live.broker.has_subscribers(instance.timetable_id):
+        return
+    version = _version(instance.timetable_id)
+    previous = getattr(instance, '_live_previous', None)
+    if previous and previous != (instance.day, instance.timeslot_id, instance.division_id):
+        live.publish_on_commit(instance.timetable_id, 'cell', live.cell_event(version, *previous))
+    live.publish_on_commit(instance.timetable_id, 'cell', live.cell_event(
+        version, instance.day, instance.timeslot_id, instance.division_id, instance))
+
+
+@receiver(post_delete, sender=TimetableEntry)
+def entry_deleted(sender, instance, **kwargs):
+    if _batched.get():
+        return
+    _bump([instance.timetable_id])
+    if not live.broker.has_subscribers(instance.timetable_id):
+        return
+    live.publish_on_commit(instance.timetable_id, 'cell', live.cell_event(
+        _version(instance.timetable_id), instance.day, instance.timeslot_id, instance.division_id))
+
+
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+@receiver(post_save, sender=Division)
+@receiver(post_delete, sender=Division)
+def grid_changed(sender, instance, **kwargs):
+    bump_version(instance.timetable_id)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Faculty)
+@receiver(post_save, sender=Room)
+def label_changed(sender, instance, created, **kwargs):
+    # Codes, initials and room numbers are rendered into every cell using them
+    if created:
+        return
+    field = sender._meta.model_name
+    ids = TimetableEntry.objects.filter(**{field: instance}).values_list('timetable_id', flat=True).distinct()
+    bump_version(*ids)
@@ -0,0 +1,315 @@
+"""
+Constraint-based timetable solver.
+
+The solver works on plain Python values so it can be run and benchmarked
+without a database; ``generator.scheduling`` translates timetables to and
+from a :class:`Problem`.
+
+Every teaching slot of the week gets one bit, so the busy slots of a
+division, faculty member or room are single ints and the slots a lesson can
+still go into are one ``&`` of those ints. The search places one lesson at a
+time, always for the requirement with the fewest remaining options (MRV),
+and backtracks on dead ends, restarting with a new tie-break order when it
+gets stuck. If the time budget runs out, the rest is placed greedily, and
+whatever still cannot be placed without a clash is reported as unplaced.
+
+Hard constraints: a division, faculty member or room is used at most once per
+slot, faculty are never placed in their unavailable slots, and rooms must
+seat the division (when both capacity and strength are known). Break slots
+are simply not part of the problem.
+"""
+import random
+import time
+from collections import namedtuple
+
+Requirement = namedtuple('Requirement', ['key', 'division', 'subject', 'faculty', 'hours'])
+Placement = namedtuple('Placement', ['requirement', 'slot', 'room'])
+
+SOLVED, INFEASIBLE, BUDGET = 'solved', 'infeasible', 'budget'
+
+
+class Problem:
+    """
+    slots:        ordered slot keys, e.g. (day, timeslot_id); the order defines the bits
+    slot_days:    day key of each slot, used to spread a subject over the week
+    divisions:    {division_key: strength or None}
+    faculty:      {faculty_key: bitmask of unavailable slot indexes}
+    rooms:        {room_key: capacity or None}
+    requirements: iterable of Requirement
+    fixed:        (slot, division, faculty, room) tuples already in the grid; faculty/room may be None
+    """
+
+    def __init__(self, slots, slot_days, divisions, faculty, rooms, requirements, fixed=()):
+        self.slots = list(slots)
+        self.slot_days = list(slot_days)
+        self.divisions = dict(divisions)
+        self.faculty = dict(faculty)
+        self.rooms = dict(rooms)
+        self.requirements = [Requirement(*r) for r in requirements]
+        self.fixed = list(fixed)
+
+    @property
+    def lesson_count(self):
+        return sum(r.hours for r in self.requirements)
+
+
+class Solution:
+    def __init__(self, placements, unplaced, elapsed, backtracks, exhaustive):
+        self.placements = placements
+        # {requirement_key: hours that could not be placed}
+        self.unplaced = unplaced
+        self.elapsed = elapsed
+        self.backtracks = backtracks
+        # True when the backtracking search placed everything
+        self.exhaustive = exhaustive
+
+    @property
+    def conflicts(self):
+        return sum(self.unplaced.values())
+
+    def __repr__(self):
+        return (f"<Solution placed={len(self.placements)} unplaced={self.conflicts} "
+                f"elapsed={self.elapsed:.3f}s backtracks={self.backtracks}>")
+
+
+class _Search:
+    def __init__(self, problem, rng):
+        self.problem = problem
+        self.rng = rng
+        n = len(problem.slots)
+        self.all_slots = (1 << n) - 1
+
+        day_keys = list(dict.fromkeys(problem.slot_days))
+        day_index = {d: i for i, d in enumerate(day_keys)}
+        self.slot_day = [day_index[d] for d in problem.slot_days]
+        slot_index = {s: i for i, s in enumerate(problem.slots)}
+
+        self.div_keys = list(problem.divisions)
+        self.fac_keys = list(problem.faculty)
+        self.room_keys = list(problem.rooms)
+        div_index = {k: i for i, k in enumerate(self.div_keys)}
+        fac_index = {k: i for i, k in enumerate(self.fac_keys)}
+        room_index = {k: i for i, k in enumerate(self.room_keys)}
+
+        self.div_busy = [0] * len(self.div_keys)
+        self.fac_busy = [problem.faculty[k] & self.all_slots for k in self.fac_keys]
+        self.room_busy = [0] * len(self.room_keys)
+
+        # Rooms that seat each division, smallest first so big rooms stay free
+        by_size = sorted(range(len(self.room_keys)),
+                         key=lambda r: (problem.rooms[self.room_keys[r]] is None, problem.rooms[self.room_keys[r]] or 0))
+        self.fits = []
+        for key in self.div_keys:
+            strength = problem.divisions[key]
+            self.fits.append([
+                r for r in by_size
+                if strength is None or problem.rooms[self.room_keys[r]] is None
+                or problem.rooms[self.room_keys[r]] >= strength
+            ])
+
+        for slot, division, faculty, room in problem.fixed:
+            s = slot_index.get(slot)
+            if s is None:
+                continue
+            bit = 1 << s
+            if division in div_index:
+                self.div_busy[div_index[division]] |= bit
+            if faculty in fac_index:
+                self.fac_busy[fac_index[faculty]] |= bit
+            if room in room_index:
+                self.room_busy[room_index[room]] |= bit
+
+        self.groups = []
+        self.remaining = []
+        for req in problem.requirements:
+            if req.hours <= 0:
+                continue
+            self.groups.append((req, div_index[req.division], fac_index[req.faculty]))
+            self.remaining.append(req.hours)
+        count = len(self.groups)
+        self.placed = [[] for _ in range(count)]
+        self.last = [-1] * count
+        self.days_used = [0] * count
+        self.active = set(range(count))
+        # Lessons of one requirement are interchangeable, so during the
+        # exhaustive search they are placed in increasing slot order only
+        self.ordered = True
+
+    def domain(self, g):
+        _, d, f = self.groups[g]
+        mask = self.all_slots & ~self.div_busy[d] & ~self.fac_busy[f]
+        if self.ordered:
+            mask &= ~((1 << (self.last[g] + 1)) - 1)
+        if not mask:
+            return 0
+        room_full = self.all_slots
+        for r in self.fits[d]:
+            room_full &= self.room_busy[r]
+            if not room_full:
+                break
+        return mask & ~room_full
+
+    def select(self):
+        best, best_key = None, None
+        for g in self.active:
+            size = self.domain(g).bit_count()
+            key = (size, -self.remaining[g])
+            if best is None or key < best_key:
+                best, best_key = g, key
+                if size == 0:
+                    break
+        return best
+
+    def candidates(self, g):
+        _, d, _ = self.groups[g]
+        mask = self.domain(g)
+        used = self.days_used[g]
+        options = []
+        while mask:
+            low = mask & -mask
+            s = low.bit_length() - 1
+            mask ^= low
+            for r in self.fits[d]:
+                if not self.room_busy[r] & low:
+                    options.append(((used >> self.slot_day[s]) & 1, self.rng.random(), s, r))
+                    break
+        options.sort()
+        return [(s, r) for _, _, s, r in options]
+
+    def place(self, g, s, r):
+        _, d, f = self.groups[g]
+        bit = 1 << s
+        self.div_busy[d] |= bit
+        self.fac_busy[f] |= bit
+        self.room_busy[r] |= bit
+        self.placed[g].append((s, r, self.last[g], self.days_used[g]))
+        self.last[g] = s
+        self.days_used[g] |= 1 << self.slot_day[s]
+        self.remaining[g] -= 1
+        if not self.remaining[g]:
+            self.active.discard(g)
+
+    def unplace(self, g):
+        _, d, f = self.groups[g]
+        s, r, last, days = self.placed[g].pop()
+        bit = ~(1 << s)
+        self.div_busy[d] &= bit
+        self.fac_busy[f] &= bit
+        self.room_busy[r] &= bit
+        self.last[g] = last
+        self.days_used[g] = days
+        self.remaining[g] += 1
+        self.active.add(g)
+
+    def backtrack(self, deadline, max_backtracks):
+        """
+        Depth-first search with an explicit stack.
+
+        Returns (status, backtracks) where status is SOLVED, INFEASIBLE (the
+        whole tree was searched; everything is undone again) or BUDGET.
+        """
+        frames = []
+        backtracks = 0
+        while True:
+            g = self.select()
+            if g is None:
+                return SOLVED, backtracks
+            frames.append([g, self.candidates(g), 0])
+            while frames:
+                frame = frames[-1]
+                g, options, pos = frame
+                if pos:
+                    self.unplace(g)
+                if pos < len(options):
+                    frame[2] = pos + 1
+                    self.place(g, *options[pos])
+                    break
+                frames.pop()
+                backtracks += 1
+            else:
+                return INFEASIBLE, backtracks
+            if backtracks >= max_backtracks or (backtracks & 63 == 0 and time.perf_counter() > deadline):
+                return BUDGET, backtracks
+
+    def greedy(self):
+        self.ordered = False
+        unplaced = {}
+        while self.active:
+            g = self.select()
+            options = self.candidates(g)
+            if options:
+                self.place(g, *options[0])
+            else:
+                req = self.groups[g][0]
+                unplaced[req.key] = self.remaining[g]
+                self.active.discard(g)
+        return unplaced
+
+    def placements(self):
+        result = []
+        for g, placed in enumerate(self.placed):
+            req = self.groups[g][0]
+            for s, r, _, _ in placed:
+                result.append(Placement(req.key, self.problem.slots[s], self.room_keys[r]))
+        return result
+
+
+def solve(problem, time_limit=10.0, restart_backtracks=None, seed=None):
+    """
+    Place every requirement's lessons; see the module docstring.
+
+    Dead ends in timetabling tend to come from early choices, so the search
+    restarts with a fresh random tie-break order whenever it has backtracked
+    ``restart_backtracks`` times (ten per lesson by default), doubling that
+    budget on every restart.
+    """
+    started = time.perf_counter()
+    deadline = started + time_limit
+    rng = random.Random(seed)
+    budget = restart_backtracks or max(1000, 10 * problem.lesson_count)
+    total = 0
+    while True:
+        search = _Search(problem, rng)
+        status, backtracks = search.backtrack(deadline, budget)
+        total += backtracks
+        if status != BUDGET or time.perf_counter() > deadline:
+            break
+        budget *= 2
+    unplaced = {} if status == SOLVED else search.greedy()
+    return Solution(search.placements(), unplaced, time.perf_counter() - started, total, status == SOLVED)
+
+
+def synthetic_problem(divisions=9, days=6, slots_per_day=5, subjects=6, load=0.8,
+                      faculty_load=0.7, unavailable=0.1, seed=0):
+    """
+    Random department-sized problem for benchmarking.
+
+    Each division is taught ``load`` of the week across ``subjects`` subjects,
+    and faculty are hired so that each teaches about ``faculty_load`` of the week.
+    """
+    rng = random.Random(seed)
+    slot_count = days * slots_per_day
+    slots = [(day, n) for day in range(days) for n in range(slots_per_day)]
+    slot_days = [day for day, _ in slots]
+
+    hours = round(slot_count * load)
+    faculty_count = max(1, -(-divisions * hours // round(slot_count * faculty_load)))
+    faculty = {}
+    for f in range(faculty_count):
+        mask = 0
+        for s in range(slot_count):
+            if rng.random() < unavailable:
+                mask |= 1 << s
+        faculty[f] = mask
+
+    division_map = {d: rng.randint(40, 70) for d in range(divisions)}
+    rooms = {r: rng.choice((60, 70, 80)) for r in range(divisions + divisions // 3 + 1)}
+
+    requirements = []
+    teacher = 0
+    for d in range(divisions):
+        split = [hours // subjects + (1 if i < hours % subjects else 0) for i in range(subjects)]
+        for subject, h in enumerate(split):
+            requirements.append(((d, subject), d, subject, teacher % faculty_count, h))
+            teacher += 1
+    return Problem(slots, slot_days, division_map, faculty, rooms, requirements)
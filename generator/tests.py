@@ -1,3 +1,820 @@
+import csv
+import datetime
+import io
+import random
+from collections import Counter
+from unittest import mock
+
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from . import global_occupancy, occupancy
+from .batch import apply_changeset
+from .cache import get_render_cache
+from .diff import TimetableDiff
+from .exports import render_excel, write_timetables_excel
+from .forms import TimetableEntryForm
+from .global_occupancy import GlobalOccupancy, free_resources, lecture_interval
+from .grid import TimetableGrid
+from .history import decode_cursor, history_page, history_queryset
+from .importers import import_csv, import_excel
+from .models import Division, Faculty, Room, Subject, SubjectRequirement, TimeSlot, Timetable, TimetableEntry, availability_bit
+from .occupancy import OccupancyIndex
+from .optimizer import Schedule, anneal, optimize_timetable
+from .repair import repair_timetable
+from .scheduling import generate_timetable
+from .services import clone_timetable, create_timetable_structure
+from .solver import Problem, solve, synthetic_problem
+
+
+def make_department(divisions=2, lectures=4, faculty=3, rooms=3, subjects=3):
+    """An active timetable with ``lectures`` slots on every day, and the faculty, rooms and subjects to fill it."""
+    timetable = create_timetable_structure(
+        [f"D{i + 1}" for i in range(divisions)], datetime.time(9), 60,
+        [('lecture', lectures)], name="Test")
+    return (
+        timetable,
+        list(timetable.divisions.order_by('id')),
+        [Faculty.objects.create(name=f"Faculty {i}", initials=f"F{i}") for i in range(faculty)],
+        [Room.objects.create(number=f"R{i}", capacity=60) for i in range(rooms)],
+        [Subject.objects.create(name=f"Subject {i}", code=f"S{i}") for i in range(subjects)],
+    )
+
+
+def add_entry(timetable, day, lecture, division, subject=None, faculty=None, room=None):
+    return TimetableEntry.objects.create(
+        timetable=timetable, day=day, timeslot=timetable.timeslots.get(lecture_number=lecture, is_break=False),
+        division=division, subject=subject, faculty=faculty, room=room)
+
+
+def cells(timetable):
+    """{entry id: (day, lecture number, room id)} of the timetable's entries."""
+    return {
+        pk: (day, lecture, room_id)
+        for pk, day, lecture, room_id in TimetableEntry.objects.filter(timetable=timetable).values_list(
+            'id', 'day', 'timeslot__lecture_number', 'room_id')
+    }
+
+
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        # Ids repeat between tests, so renders of another test's timetable could match
+        get_render_cache().clear()
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department()
+        self.entry = add_entry(self.timetable, 'MON', 1, self.divisions[0], self.subjects[0], self.faculty[0],
+                               self.rooms[0])
+
+    def render(self):
+        version = Timetable.objects.get(id=self.timetable.id).version
+        page = self.client.get(f'/timetable/{self.timetable.id}/').content.decode()
+        # The grid, without the page's CSRF token
+        return version, page[page.index('<div class="table-container">'):page.index('</table>')]
+
+    def assert_rerendered(self, change, text):
+        version, page = self.render()
+        self.assertEqual(self.render(), (version, page))
+        self.assertNotIn(text, page)
+        change()
+        new_version, new_page = self.render()
+        self.assertGreater(new_version, version)
+        self.assertIn(text, new_page)
+
+    def test_entry_changes(self):
+        def move():
+            self.entry.room = self.rooms[1]
+            self.entry.save()
+        self.assert_rerendered(move, '>R1<')
+        self.assert_rerendered(self.entry.delete, f'data-version="{self.render()[0] + 1}"')
+        self.assertNotIn('>S0<', self.render()[1])
+
+    def test_timeslot_changes(self):
+        def shorten():
+            timeslot = TimeSlot.objects.get(timetable=self.timetable, lecture_number=1)
+            timeslot.end_time = datetime.time(9, 50)
+            timeslot.save()
+        self.assert_rerendered(shorten, '9:50a.m.')
+
+    def test_division_changes(self):
+        def rename():
+            self.divisions[1].name = 'Renamed'
+            self.divisions[1].save()
+        self.assert_rerendered(rename, 'Renamed')
+
+    def test_label_changes(self):
+        for resource, field, value in ((self.subjects[0], 'code', 'NEWSUB'), (self.faculty[0], 'initials', 'NEWFAC'),
+                                       (self.rooms[0], 'number', 'NEWROOM')):
+            with self.subTest(model=type(resource).__name__):
+                def rename():
+                    setattr(resource, field, value)
+                    resource.save()
+                self.assert_rerendered(rename, value)
+
+
+class SolverTests(TestCase):
+    def assert_valid(self, problem, solution):
+        """Every hard constraint holds and each requirement got its hours, less the unplaced ones."""
+        requirements = {r.key: r for r in problem.requirements}
+        slot_index = {slot: i for i, slot in enumerate(problem.slots)}
+        used = Counter()
+        for slot, division, faculty, room in problem.fixed:
+            used[('division', slot, division)] += 1
+            used[('faculty', slot, faculty)] += faculty is not None
+            used[('room', slot, room)] += room is not None
+        hours = Counter()
+        for placement in solution.placements:
+            requirement = requirements[placement.requirement]
+            hours[placement.requirement] += 1
+            used[('division', placement.slot, requirement.division)] += 1
+            used[('faculty', placement.slot, requirement.faculty)] += 1
+            used[('room', placement.slot, placement.room)] += 1
+            self.assertFalse(problem.faculty[requirement.faculty] >> slot_index[placement.slot] & 1)
+            capacity, strength = problem.rooms[placement.room], problem.divisions[requirement.division]
+            if capacity is not None and strength is not None:
+                self.assertGreaterEqual(capacity, strength)
+        self.assertLessEqual(max(used.values(), default=0), 1)
+        for key, requirement in requirements.items():
+            self.assertEqual(hours[key] + solution.unplaced.get(key, 0), requirement.hours)
+
+    def test_synthetic_problem_is_solved(self):
+        problem = synthetic_problem(divisions=6, seed=3)
+        solution = solve(problem, time_limit=5, seed=1)
+        self.assertTrue(solution.exhaustive)
+        self.assertEqual(solution.conflicts, 0)
+        self.assertEqual(len(solution.placements), problem.lesson_count)
+        self.assert_valid(problem, solution)
+
+    def test_fixed_entries_and_unavailable_slots_are_kept_free(self):
+        slots = [(day, n) for day in range(2) for n in range(3)]
+        problem = Problem(
+            slots, [day for day, _ in slots], {'A': 30, 'B': 30}, {'f': 0b000011, 'g': 0}, {'r1': 30, 'r2': 30},
+            [('a', 'A', 'math', 'f', 3), ('b', 'B', 'art', 'g', 4)],
+            fixed=[((1, 0), 'A', 'g', 'r1'), ((1, 1), 'B', None, 'r2')],
+        )
+        solution = solve(problem, time_limit=5, seed=1)
+        self.assertEqual(solution.conflicts, 0)
+        self.assert_valid(problem, solution)
+
+    def test_impossible_lessons_are_reported_unplaced(self):
+        slots = [(0, n) for n in range(3)]
+        problem = Problem(slots, [0, 0, 0], {'A': 50}, {'f': 0b010}, {'small': 30, 'big': 60},
+                          [('a', 'A', 'math', 'f', 3)])
+        solution = solve(problem, time_limit=1, seed=1)
+        self.assertEqual(solution.unplaced, {'a': 1})
+        self.assert_valid(problem, solution)
+        self.assertEqual({p.room for p in solution.placements}, {'big'})
+
+    def test_generate_timetable_saves_a_clash_free_grid(self):
+        timetable, divisions, faculty, rooms, subjects = make_department()
+        faculty[0].unavailable_slots = 1 << availability_bit('MON', 1) | 1 << availability_bit('TUE', 2)
+        faculty[0].save()
+        for i, division in enumerate(divisions):
+            for j, subject in enumerate(subjects):
+                SubjectRequirement.objects.create(division=division, subject=subject,
+                                                  faculty=faculty[(i + j) % len(faculty)], hours_per_week=4)
+        solution = generate_timetable(timetable, time_limit=5, seed=1)
+        self.assertEqual(solution.conflicts, 0)
+        self.assertEqual(TimetableEntry.objects.filter(timetable=timetable).count(), 2 * 3 * 4)
+        self.assertEqual(OccupancyIndex(timetable).clashes(), [])
+        taught = TimetableEntry.objects.filter(timetable=timetable, faculty=faculty[0])
+        self.assertFalse(taught.filter(day='MON', timeslot__lecture_number=1).exists())
+        self.assertFalse(taught.filter(day='TUE', timeslot__lecture_number=2).exists())
+
+
+class ClashTests(TestCase):
+    def setUp(self):
+        # Cached indexes are keyed by (id, version), which repeat between tests
+        occupancy._indexes.clear()
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department()
+        self.entry = add_entry(self.timetable, 'MON', 1, self.divisions[0], self.subjects[0], self.faculty[0],
+                               self.rooms[0])
+        self.timeslot = self.entry.timeslot
+
+    def form(self, division, faculty, room, instance=None):
+        return TimetableEntryForm({
+            'day': 'MON', 'timeslot': self.timeslot.id, 'division': division.id, 'subject': self.subjects[1].id,
+            'faculty': faculty.id, 'room': room.id,
+        }, instance=instance, timetable=Timetable.objects.get(id=self.timetable.id))
+
+    def test_form_rejects_double_bookings(self):
+        d0, d1 = self.divisions
+        for division, faculty, room, field in ((d0, self.faculty[1], self.rooms[1], 'division'),
+                                               (d1, self.faculty[0], self.rooms[1], 'faculty'),
+                                               (d1, self.faculty[1], self.rooms[0], 'room')):
+            with self.subTest(field):
+                form = self.form(division, faculty, room)
+                self.assertFalse(form.is_valid())
+                self.assertEqual(list(form.errors), [field])
+        self.assertTrue(self.form(d1, self.faculty[1], self.rooms[1]).is_valid())
+        # Editing the entry does not clash with itself
+        self.assertTrue(self.form(d0, self.faculty[0], self.rooms[0], instance=self.entry).is_valid())
+
+    def test_database_rejects_double_bookings(self):
+        d0, d1 = self.divisions
+        for division, faculty, room, constraint in ((d0, self.faculty[1], self.rooms[1], 'division'),
+                                                    (d1, self.faculty[0], self.rooms[1], 'faculty'),
+                                                    (d1, self.faculty[1], self.rooms[0], 'room')):
+            with self.subTest(constraint), self.assertRaises(IntegrityError), transaction.atomic():
+                add_entry(self.timetable, 'MON', 1, division, self.subjects[1], faculty, room)
+        # Entries without a faculty member or room do not count as booking one
+        add_entry(self.timetable, 'MON', 1, d1)
+        self.assertEqual(TimetableEntry.objects.filter(timetable=self.timetable).count(), 2)
+
+    def test_clashes_are_found_and_reported(self):
+        # The constraints keep clashes out of the database, so seed the index with rows
+        d0, d1 = self.divisions
+        f0, f1 = self.faculty[0].id, self.faculty[1].id
+        r0, r1 = self.rooms[0].id, self.rooms[1].id
+        lecture2 = self.timetable.timeslots.get(lecture_number=2, is_break=False).id
+        index = OccupancyIndex(self.timetable, entries=[
+            (self.entry.id, 'MON', self.timeslot.id, d0.id, f0, r0),
+            (900, 'MON', self.timeslot.id, d1.id, f0, r1),
+            (901, 'MON', lecture2, d0.id, f1, r1),
+            (902, 'MON', lecture2, d1.id, f0, r1),
+            (903, 'TUE', self.timeslot.id, d0.id, f0, r0),
+        ])
+        self.assertEqual(sorted(index.clashes()), [
+            ('faculty', f0, 'MON', self.timeslot.id, [self.entry.id, 900]),
+            ('room', r1, 'MON', lecture2, [901, 902]),
+        ])
+        self.assertEqual(OccupancyIndex(self.timetable).clashes(), [])
+
+        with mock.patch.object(OccupancyIndex, 'for_timetable', return_value=index):
+            page = self.client.get(f'/timetable/{self.timetable.id}/clashes/').content.decode()
+        self.assertIn('Faculty F0', page)
+        self.assertIn('Room R1', page)
+        self.assertIn('Booked for D1, D2', page)
+        self.assertNotIn('No clashes found', page)
+        self.assertContains(self.client.get(f'/timetable/{self.timetable.id}/clashes/'), 'No clashes found')
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department()
+        d0, d1 = self.divisions
+        add_entry(self.timetable, 'MON', 1, d0, self.subjects[0], self.faculty[0], self.rooms[0])
+        add_entry(self.timetable, 'MON', 1, d1, self.subjects[1], self.faculty[1], self.rooms[1])
+        add_entry(self.timetable, 'WED', 3, d1, self.subjects[2], self.faculty[0], self.rooms[2])
+        add_entry(self.timetable, 'FRI', 4, d0, self.subjects[0], None, None)
+        self.grid = self.lessons()
+
+    def lessons(self):
+        return sorted(TimetableEntry.objects.filter(timetable=self.timetable).values_list(
+            'day', 'timeslot__lecture_number', 'division__name', 'subject__code', 'faculty__initials', 'room__number'))
+
+    def csv_file(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['timetable', 'day', 'lecture', 'division', 'subject', 'faculty', 'room'])
+        for row in rows:
+            writer.writerow([self.timetable.id, *(value or '' for value in row)])
+        return io.BytesIO(buffer.getvalue().encode())
+
+    def version(self):
+        return Timetable.objects.get(id=self.timetable.id).version
+
+    def test_csv_round_trip(self):
+        version = self.version()
+        result = import_csv(self.csv_file(self.grid), clear=True)
+        self.assertEqual((result.rows, result.created, result.errors), (4, 4, []))
+        self.assertEqual(self.lessons(), self.grid)
+        self.assertEqual(self.version(), version + 1)
+
+    def test_excel_round_trip(self):
+        content = render_excel(TimetableGrid(self.timetable))
+        result = import_excel(io.BytesIO(content), timetable=self.timetable, clear=True)
+        self.assertEqual((result.created, result.errors), (4, []))
+        self.assertEqual(self.lessons(), self.grid)
+
+        # The all-timetables export finds its timetable by sheet title
+        buffer = io.BytesIO()
+        write_timetables_excel([self.timetable], buffer)
+        buffer.seek(0)
+        self.assertEqual(import_excel(buffer, clear=True).created, 4)
+        self.assertEqual(self.lessons(), self.grid)
+
+    def test_dry_run_writes_nothing(self):
+        version = self.version()
+        result = import_csv(self.csv_file(self.grid), dry_run=True, clear=True)
+        self.assertEqual((result.rows, result.created, result.errors, result.dry_run), (4, 0, [], True))
+        self.assertEqual(self.lessons(), self.grid)
+        self.assertEqual(self.version(), version)
+        # Without clear the same rows clash with the entries already there
+        result = import_csv(self.csv_file(self.grid[:1]), dry_run=True)
+        self.assertEqual(result.error_count, 1)
+
+    def test_bad_row_rolls_back_the_whole_import(self):
+        version = self.version()
+        rows = [('TUE', 1, 'D1', 'S0', 'F2', 'R2'), ('TUE', 2, 'D1', 'XX', 'F2', 'R2'), ('TUE', 9, 'D2', '', '', '')]
+        result = import_csv(self.csv_file(rows), clear=True)
+        self.assertEqual(result.created, 0)
+        self.assertEqual(result.errors, ["Row 3: unknown subject 'XX'", "Row 4: no lecture 9 on TUE"])
+        # The clear was rolled back too
+        self.assertEqual(self.lessons(), self.grid)
+        self.assertEqual(self.version(), version)
+
+
+class CloneDiffTests(TestCase):
+    def setUp(self):
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department()
+        d0, d1 = self.divisions
+        add_entry(self.timetable, 'MON', 1, d0, self.subjects[0], self.faculty[0], self.rooms[0])
+        add_entry(self.timetable, 'MON', 2, d1, self.subjects[1], self.faculty[1], self.rooms[1])
+        add_entry(self.timetable, 'TUE', 3, d0, self.subjects[2], self.faculty[2], self.rooms[2])
+        SubjectRequirement.objects.create(division=d0, subject=self.subjects[0], faculty=self.faculty[0],
+                                          hours_per_week=2)
+
+    def lessons(self, timetable):
+        return sorted(TimetableEntry.objects.filter(timetable=timetable).values_list(
+            'day', 'timeslot__lecture_number', 'division__name', 'subject_id', 'faculty_id', 'room_id'))
+
+    def test_clone_copies_entries_into_its_own_rows(self):
+        clone = clone_timetable(self.timetable, name="Copy")
+        self.assertTrue(clone.is_active)
+        self.assertFalse(Timetable.objects.get(id=self.timetable.id).is_active)
+        self.assertEqual(self.lessons(clone), self.lessons(self.timetable))
+
+        entries = TimetableEntry.objects.filter(timetable=clone)
+        timeslots = set(TimeSlot.objects.filter(timetable=clone).values_list('id', flat=True))
+        divisions = set(Division.objects.filter(timetable=clone).values_list('id', flat=True))
+        self.assertTrue(set(entries.values_list('timeslot_id', flat=True)) <= timeslots)
+        self.assertTrue(set(entries.values_list('division_id', flat=True)) <= divisions)
+        self.assertEqual(TimeSlot.objects.filter(timetable=clone).count(), self.timetable.timeslots.count())
+        self.assertEqual(list(SubjectRequirement.objects.filter(division__timetable=clone).values_list(
+            'division__name', 'subject_id', 'faculty_id', 'hours_per_week')), [('D1', self.subjects[0].id,
+                                                                               self.faculty[0].id, 2)])
+        self.assertEqual(TimetableDiff(self.timetable, clone).changes, [])
+
+    def test_diff_reports_cells_by_day_lecture_and_division(self):
+        clone = clone_timetable(self.timetable, activate=False)
+        d0, d1 = clone.divisions.order_by('id')
+        TimetableEntry.objects.filter(timetable=clone, day='MON', division=d1).delete()
+        TimetableEntry.objects.filter(timetable=clone, day='TUE').update(room=self.rooms[0])
+        add_entry(clone, 'WED', 1, d1, self.subjects[1], self.faculty[1], self.rooms[1])
+
+        diff = TimetableDiff(self.timetable, clone)
+        self.assertEqual(diff.counts(), {'added': 1, 'removed': 1, 'changed': 1})
+        self.assertEqual([(c.status, c.day, c.lecture_number, c.division) for c in diff.changes], [
+            ('removed', 'MON', 2, 'D2'),
+            ('changed', 'TUE', 3, 'D1'),
+            ('added', 'WED', 1, 'D2'),
+        ])
+        changed = diff.changes[1]
+        self.assertEqual((changed.old.room_number, changed.new.room_number), ('R2', 'R0'))
+        self.assertEqual(diff.changes[2].new.label, 'S1 / F1 / R1')
+        self.assertEqual((diff.divisions_added, diff.divisions_removed), ([], []))
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        get_render_cache().clear()
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department(rooms=7)
+        self.entry = add_entry(self.timetable, 'MON', 1, self.divisions[0], self.subjects[0], self.faculty[0],
+                               self.rooms[0])
+
+    def pages(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+        return ids
+
+    def test_keyset_pages_follow_the_id_order(self):
+        rooms = [room.id for room in self.rooms]
+        self.assertEqual(self.pages('/api/rooms/?limit=3'), rooms)
+        data = self.client.get(f'/api/rooms/?after={rooms[1]}&limit=2').json()
+        self.assertEqual([row['id'] for row in data['results']], rooms[2:4])
+        self.assertEqual(data['next'], f'/api/rooms/?after={rooms[3]}&limit=2')
+        # Exactly one full page has no next link
+        self.assertIsNone(self.client.get(f'/api/rooms/?after={rooms[1]}&limit=5').json()['next'])
+
+        timetables = [self.timetable.id] + [
+            create_timetable_structure(["D1"], datetime.time(9), 60, [('lecture', 1)], name=f"T{i}").id
+            for i in range(4)]
+        self.assertEqual(self.pages('/api/timetables/?limit=2'), sorted(timetables, reverse=True))
+        self.assertEqual(self.client.get('/api/rooms/?limit=x').status_code, 400)
+
+    def test_conditional_get_until_the_version_changes(self):
+        for kind in ('grid', 'entries'):
+            with self.subTest(kind):
+                url = f'/api/timetables/{self.timetable.id}/{kind}/'
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+                self.entry.room = self.rooms[1] if self.entry.room == self.rooms[0] else self.rooms[0]
+                self.entry.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                room_ids = response.json()['entries']['room'] if kind == 'grid' else [
+                    row['room_id'] for row in response.json()['results']]
+                self.assertEqual(room_ids, [self.entry.room_id])
+
+
+class HistoryTests(TestCase):
+    def test_pages_through_timetables_sharing_a_created_at(self):
+        timetables = [
+            create_timetable_structure(["D1"], datetime.time(9), 60, [('lecture', 2)], name=f"T{i}")
+            for i in range(23)]
+        ids = [tt.id for tt in timetables]
+        # Two groups of timestamp ties, each straddling page boundaries
+        tied = timezone.now().replace(microsecond=0)
+        Timetable.objects.filter(id__in=ids[:4]).update(created_at=tied)
+        Timetable.objects.filter(id__in=ids[4:]).update(created_at=tied + datetime.timedelta(seconds=1))
+
+        seen, after = [], None
+        while True:
+            page, cursor = history_page(history_queryset(), after, limit=3)
+            self.assertLessEqual(len(page), 3)
+            seen.extend(tt.id for tt in page)
+            if cursor is None:
+                break
+            after = decode_cursor(cursor)
+        expected = ids[4:][::-1] + ids[:4][::-1]
+        self.assertEqual(seen, expected)
+
+        # The page's next link carries the same cursor, across the 20-per-page boundary
+        response = self.client.get('/history/')
+        seen = [tt.id for tt in response.context['timetables']]
+        response = self.client.get(response.context['next_url'])
+        seen.extend(tt.id for tt in response.context['timetables'])
+        self.assertIsNone(response.context['next_url'])
+        self.assertEqual(seen, expected)
+        # Each timetable is diffed against the one listed after it
+        page, _ = history_page(history_queryset(), limit=len(ids))
+        self.assertEqual([tt.previous_id for tt in page], expected[1:] + [None])
+        self.assertEqual({(tt.division_count, tt.slot_count, tt.entry_count, tt.fill) for tt in page},
+                         {(1, 12, 0, 0)})
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        occupancy._indexes.clear()
+        global_occupancy._indexes.clear()
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department()
+        self.entry = add_entry(self.timetable, 'MON', 1, self.divisions[0], self.subjects[0], self.faculty[0],
+                               self.rooms[0])
+        self.timeslot = self.entry.timeslot
+
+    def available(self, **params):
+        response = self.client.get(f'/api/timetables/{self.timetable.id}/available/', params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['label'] for row in data['faculty']], [row['label'] for row in data['rooms']]
+
+    def test_available_lists_free_faculty_and_rooms(self):
+        self.assertEqual(self.available(day='MON', timeslot=self.timeslot.id), (['F1', 'F2'], ['R1', 'R2']))
+        self.assertEqual(self.available(day='TUE', timeslot=self.timeslot.id), (['F0', 'F1', 'F2'], ['R0', 'R1', 'R2']))
+        # Editing the entry, its own faculty member and room are free to keep
+        self.assertEqual(self.available(day='MON', timeslot=self.timeslot.id, entry=self.entry.id),
+                         (['F0', 'F1', 'F2'], ['R0', 'R1', 'R2']))
+        # Faculty marked unavailable are left out
+        self.faculty[2].unavailable_slots = 1 << availability_bit('MON', 1)
+        self.faculty[2].save()
+        self.assertEqual(self.available(day='MON', timeslot=self.timeslot.id)[0], ['F1'])
+
+        url = f'/api/timetables/{self.timetable.id}/available/'
+        self.assertEqual(self.client.get(url, {'day': 'XXX', 'timeslot': self.timeslot.id}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'day': 'MON', 'timeslot': 0}).status_code, 400)
+
+    def test_global_clashes_are_grouped_by_overlapping_time(self):
+        # The second timetable's lectures start half an hour later
+        other = create_timetable_structure(["E1", "E2"], datetime.time(9, 30), 60, [('lecture', 4)], name="Other")
+        Timetable.objects.filter(id=self.timetable.id).update(is_active=True)
+        e1, e2 = other.divisions.order_by('id')
+        f0, f1, f2 = self.faculty
+        r0, r1, r2 = self.rooms
+        add_entry(self.timetable, 'MON', 2, self.divisions[0], room=r1, faculty=f2)
+        add_entry(other, 'MON', 1, e1, faculty=f0, room=r1)
+        add_entry(other, 'MON', 2, e2, faculty=f1, room=r2)
+        add_entry(self.timetable, 'TUE', 1, self.divisions[1], faculty=f1)
+
+        index = GlobalOccupancy.current()
+        t, o = self.timetable.id, other.id
+        self.assertEqual(sorted(index.clashes), [
+            ('faculty', f0.id, 'MON', [(t, datetime.time(9), datetime.time(10)),
+                                       (o, datetime.time(9, 30), datetime.time(10, 30))]),
+            ('room', r1.id, 'MON', [(o, datetime.time(9, 30), datetime.time(10, 30)),
+                                    (t, datetime.time(10), datetime.time(11))]),
+        ])
+        self.assertIs(GlobalOccupancy.current(), index)
+
+        start, end = lecture_interval(o, 'MON', 3)
+        self.assertEqual((start, end), (datetime.time(11, 30), datetime.time(12, 30)))
+        # A booking ending at 11:00 leaves the resource free from 11:00
+        free = free_resources(index, 'MON', datetime.time(11), datetime.time(11, 30))
+        self.assertEqual([row['label'] for row in free['faculty']], ['F0', 'F2'])
+        self.assertEqual([row['label'] for row in free['room']], ['R0', 'R1'])
+
+        # The page takes a lecture's time from the chosen timetable
+        response = self.client.get('/resources/', {'day': 'MON', 'lecture': 1, 'timetable': o})
+        self.assertEqual([row['label'] for row in response.context['free']['faculty']], ['F1'])
+        self.assertEqual(len(response.context['clashes']), 2)
+        # A new booking changes the version, so the index is rebuilt
+        add_entry(other, 'MON', 4, e1, faculty=f0)
+        self.assertIsNot(GlobalOccupancy.current(), index)
+
+
+class RepairTests(TestCase):
+    def setUp(self):
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department(lectures=2)
+        self.d1, self.d2 = self.divisions
+        self.f0, self.f1, self.f2 = self.faculty
+
+    def test_faculty_absence_moves_only_the_affected_lectures(self):
+        absent = add_entry(self.timetable, 'MON', 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+        other = add_entry(self.timetable, 'MON', 1, self.d2, self.subjects[1], self.f1, self.rooms[1])
+        later = add_entry(self.timetable, 'MON', 2, self.d1, self.subjects[1], self.f1, self.rooms[1])
+        before = cells(self.timetable)
+
+        repair = repair_timetable(self.timetable, faculty_id=self.f0.id, blocked=[('MON', 1)])
+        after = cells(self.timetable)
+        self.assertEqual(repair.affected, 1)
+        self.assertEqual(repair.unresolved, [])
+        self.assertEqual([move.entry_id for move in repair.moves], [absent.id])
+        self.assertEqual(repair.moves[0].kind, 'move')
+        # D1 has no other free lecture on Monday, so the nearest one after it
+        self.assertEqual(after[absent.id][:2], ('TUE', 1))
+        self.assertEqual((after[other.id], after[later.id]), (before[other.id], before[later.id]))
+        self.assertEqual(OccupancyIndex(self.timetable).clashes(), [])
+        # The absence is this timetable's; other timetables still see F0 available
+        self.f0.refresh_from_db()
+        self.assertTrue(self.f0.is_available('MON', 1))
+
+    def test_mark_unavailable_records_the_blocked_lectures(self):
+        add_entry(self.timetable, 'MON', 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+        repair_timetable(self.timetable, faculty_id=self.f0.id, blocked=[('MON', 1), ('TUE', 2)], mark_unavailable=True)
+        self.f0.refresh_from_db()
+        self.assertFalse(self.f0.is_available('MON', 1))
+        self.assertFalse(self.f0.is_available('TUE', 2))
+        self.assertTrue(self.f0.is_available('MON', 2))
+
+    def test_repair_bumps_the_version_once(self):
+        for day in ('MON', 'TUE', 'WED'):
+            add_entry(self.timetable, day, 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+        version = Timetable.objects.get(id=self.timetable.id).version
+        repair = repair_timetable(self.timetable, faculty_id=self.f0.id, blocked=[('MON', 1), ('TUE', 1), ('WED', 1)])
+        self.assertEqual(len(repair.moves), 3)
+        self.assertEqual(Timetable.objects.get(id=self.timetable.id).version, version + 1)
+
+    def test_dry_run_saves_nothing(self):
+        add_entry(self.timetable, 'MON', 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+        before = cells(self.timetable)
+        repair = repair_timetable(self.timetable, faculty_id=self.f0.id, blocked=[('MON', 1)], dry_run=True)
+        self.assertEqual(len(repair.moves), 1)
+        self.assertFalse(repair.applied)
+        self.assertEqual(cells(self.timetable), before)
+        self.f0.refresh_from_db()
+        self.assertTrue(self.f0.is_available('MON', 1))
+
+    def test_removed_room_is_replaced_in_the_same_slot(self):
+        entries = [add_entry(self.timetable, day, 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+                   for day in ('MON', 'TUE')]
+        add_entry(self.timetable, 'MON', 1, self.d2, self.subjects[1], self.f1, self.rooms[1])
+        before = cells(self.timetable)
+
+        repair = repair_timetable(self.timetable, room_id=self.rooms[0].id)
+        after = cells(self.timetable)
+        self.assertEqual({move.kind for move in repair.moves}, {'room'})
+        for entry in entries:
+            self.assertEqual(after[entry.id][:2], before[entry.id][:2])
+        # Room 1 is taken on Monday by D2
+        self.assertEqual(after[entries[0].id][2], self.rooms[2].id)
+        self.assertFalse(TimetableEntry.objects.filter(room=self.rooms[0]).exists())
+
+    def test_full_division_swaps_with_a_lecture_the_faculty_can_take(self):
+        # D1 has no free lecture, so the only fix is a swap
+        grid = {}
+        for day, _ in TimeSlot.DAY_CHOICES:
+            for lecture in (1, 2):
+                faculty = self.f0 if (day, lecture) == ('MON', 1) else self.f1
+                grid[(day, lecture)] = add_entry(self.timetable, day, lecture, self.d1, self.subjects[0], faculty)
+
+        repair = repair_timetable(self.timetable, faculty_id=self.f0.id, blocked=[('MON', 1)])
+        after = cells(self.timetable)
+        self.assertEqual(repair.unresolved, [])
+        self.assertEqual([move.kind for move in repair.moves], ['swap', 'swap'])
+        # With the nearest lecture of the division
+        self.assertEqual(repair.moves[1].entry_id, grid[('MON', 2)].id)
+        self.assertEqual(after[grid[('MON', 1)].id][:2], ('MON', 2))
+        self.assertEqual(after[grid[('MON', 2)].id][:2], ('MON', 1))
+        self.assertEqual(len(after), 12)
+        self.assertEqual(OccupancyIndex(self.timetable).clashes(), [])
+
+    def test_lectures_without_a_fix_are_left_and_reported(self):
+        entry = add_entry(self.timetable, 'MON', 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+        everywhere = [(day, lecture) for day, _ in TimeSlot.DAY_CHOICES for lecture in (1, 2)]
+        repair = repair_timetable(self.timetable, faculty_id=self.f0.id, blocked=everywhere)
+        self.assertEqual(repair.moves, [])
+        self.assertEqual(repair.unresolved, [entry.id])
+        self.assertEqual(cells(self.timetable)[entry.id], ('MON', 1, self.rooms[0].id))
+
+
+class ChangesetTests(TestCase):
+    def setUp(self):
+        self.timetable, self.divisions, self.faculty, self.rooms, self.subjects = make_department()
+        self.d1, self.d2 = self.divisions
+        self.f0, self.f1, self.f2 = self.faculty
+        self.a = add_entry(self.timetable, 'MON', 1, self.d1, self.subjects[0], self.f0, self.rooms[0])
+        self.b = add_entry(self.timetable, 'MON', 1, self.d2, self.subjects[1], self.f1, self.rooms[1])
+
+    def cell(self, division, day='MON', lecture=1, subject=None, faculty=None, room=None):
+        return {
+            'day': day, 'timeslot': self.timetable.timeslots.get(lecture_number=lecture).id, 'division': division.id,
+            'subject': subject and subject.id, 'faculty': faculty and faculty.id, 'room': room and room.id,
+        }
+
+    def version(self):
+        return Timetable.objects.get(id=self.timetable.id).version
+
+    def test_swap_between_two_cells_of_a_slot(self):
+        version = self.version()
+        result = apply_changeset(self.timetable, [
+            self.cell(self.d1, subject=self.subjects[0], faculty=self.f1, room=self.rooms[1]),
+            self.cell(self.d2, subject=self.subjects[1], faculty=self.f0, room=self.rooms[0]),
+        ])
+        self.assertEqual(result.errors, [])
+        self.assertEqual((result.created, result.updated, result.deleted), (0, 2, 0))
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.faculty, self.a.room), (self.f1, self.rooms[1]))
+        self.assertEqual((self.b.faculty, self.b.room), (self.f0, self.rooms[0]))
+        self.assertEqual(self.version(), version + 1)
+
+    def test_clash_within_the_changeset_saves_nothing(self):
+        before = cells(self.timetable)
+        result = apply_changeset(self.timetable, [
+            self.cell(self.d1, lecture=2, subject=self.subjects[0], faculty=self.f2, room=self.rooms[2]),
+            self.cell(self.d2, lecture=2, subject=self.subjects[1], faculty=self.f2, room=self.rooms[2]),
+        ])
+        self.assertEqual([(e['cell'], e['field']) for e in result.errors], [(1, 'faculty'), (1, 'room')])
+        self.assertEqual(cells(self.timetable), before)
+
+    def test_clash_with_an_untouched_entry(self):
+        result = apply_changeset(self.timetable, [self.cell(self.d1, faculty=self.f1)])
+        self.assertEqual([(e['cell'], e['field']) for e in result.errors], [(0, 'faculty')])
+
+    def test_bad_input_is_rejected_cell_by_cell(self):
+        other, _, _, _, _ = make_department(divisions=1)
+        before = cells(self.timetable)
+        break_free = self.cell(self.d1, lecture=2)
+        result = apply_changeset(self.timetable, [
+            'MON',
+            dict(break_free, day='SUN'),
+            dict(break_free, division=None),
+            dict(break_free, faculty=True),
+            dict(break_free, timeslot=other.timeslots.first().id),
+            dict(break_free, division=other.divisions.get().id),
+            dict(self.cell(self.d2, lecture=2), subject=0),
+            break_free,
+            break_free,
+        ])
+        self.assertEqual([(e['cell'], e['field']) for e in result.errors], [
+            (0, None), (1, None), (2, None), (3, None), (4, 'timeslot'), (5, 'division'), (6, 'subject'), (8, None),
+        ])
+        self.assertEqual(cells(self.timetable), before)
+
+    def test_unavailable_faculty_is_rejected(self):
+        self.f2.unavailable_slots = 1 << availability_bit('TUE', 3)
+        self.f2.save()
+        result = apply_changeset(self.timetable, [self.cell(self.d1, day='TUE', lecture=3, faculty=self.f2)])
+        self.assertEqual([(e['cell'], e['field']) for e in result.errors], [(0, 'faculty')])
+
+    def test_create_empty_and_dry_run(self):
+        changes = [
+            self.cell(self.d1),
+            self.cell(self.d1, day='WED', lecture=4, subject=self.subjects[2], faculty=self.f2),
+            self.cell(self.d2, subject=self.subjects[1], faculty=self.f1, room=self.rooms[1]),
+        ]
+        before = cells(self.timetable)
+        dry = apply_changeset(self.timetable, changes, dry_run=True)
+        self.assertEqual(cells(self.timetable), before)
+
+        result = apply_changeset(self.timetable, changes)
+        # The unchanged D2 cell is neither rewritten nor counted
+        self.assertEqual(result, dry)
+        self.assertEqual((result.created, result.updated, result.deleted), (1, 0, 1))
+        after = cells(self.timetable)
+        self.assertNotIn(self.a.id, after)
+        self.assertEqual(after[self.b.id], before[self.b.id])
+        self.assertIn(('WED', 4, None), after.values())
+
+
+def random_schedule(seed=0, days=5, slots_per_day=6, divisions=4, faculty=6, rooms=5, subjects=4, load=0.7):
+    """A clash-free Schedule on plain values, with some unavailable faculty slots and small rooms."""
+    rng = random.Random(seed)
+    slot_count = days * slots_per_day
+    unavailable = {f: sum(1 << s for s in range(slot_count) if rng.random() < 0.1) for f in range(faculty)}
+    capacity = {r: rng.choice((None, 40, 60, 80)) for r in range(rooms)}
+    strength = {d: rng.choice((None, 50, 70)) for d in range(divisions)}
+    lessons = []
+    for s in range(slot_count):
+        free_faculty = [f for f in range(faculty) if not unavailable[f] >> s & 1]
+        free_rooms = list(capacity)
+        for d in range(divisions):
+            if rng.random() > load or not free_faculty:
+                continue
+            seats = [r for r in free_rooms if None in (capacity[r], strength[d]) or capacity[r] >= strength[d]]
+            if not seats:
+                continue
+            f, r = rng.choice(free_faculty), rng.choice(seats)
+            free_faculty.remove(f)
+            free_rooms.remove(r)
+            lessons.append((len(lessons), s, d, rng.randrange(subjects), f, r))
+    return Schedule([s // slots_per_day for s in range(slot_count)], lessons, strength, unavailable, capacity)
+
+
+class OptimizerTests(TestCase):
+    def assert_hard_constraints(self, schedule):
+        used = Counter()
+        for i, s in enumerate(schedule.slot):
+            used[('division', s, schedule.division[i])] += 1
+            used[('faculty', s, schedule.faculty[i])] += 1
+            used[('room', s, schedule.room[i])] += 1
+            self.assertFalse(schedule.unavailable[schedule.faculty[i]] >> s & 1)
+            capacity, strength = schedule.capacity[schedule.room[i]], schedule.strength[schedule.division[i]]
+            if capacity is not None and strength is not None:
+                self.assertGreaterEqual(capacity, strength)
+        self.assertEqual(max(used.values()), 1)
+
+    def test_running_score_matches_full_rescore(self):
+        schedule = random_schedule(seed=1)
+        rng = random.Random(2)
+        score = schedule.score()
+        kept = 0
+        for step in range(5000):
+            proposal = schedule.step(rng)
+            if proposal is None:
+                continue
+            keys, moves = proposal
+            cost = schedule.cost(keys)
+            previous = schedule.relocate(moves)
+            if previous is None:
+                continue
+            if rng.random() < 0.5:
+                score += schedule.cost(keys) - cost
+                kept += 1
+            else:
+                schedule.restore(previous)
+            if step % 250 == 0:
+                self.assertEqual(score, schedule.score())
+                self.assert_hard_constraints(schedule)
+        self.assertGreater(kept, 100)
+        self.assertEqual(score, schedule.score())
+        self.assert_hard_constraints(schedule)
+
+    def test_anneal_leaves_the_best_schedule_it_reports(self):
+        schedule = random_schedule(seed=3)
+        before = schedule.score()
+        lessons = Counter(zip(schedule.division, schedule.subject, schedule.faculty))
+        result = anneal(schedule, iterations=5000, seed=4)
+        self.assertEqual(result.iterations, 5000)
+        self.assertEqual(result.before, before)
+        self.assertEqual(result.after, schedule.score())
+        self.assertLess(result.after, result.before)
+        self.assertEqual(sum(result.breakdown_after[name] * weight for name, weight in schedule.weights.items()),
+                         result.after)
+        self.assertEqual(Counter(zip(schedule.division, schedule.subject, schedule.faculty)), lessons)
+        self.assert_hard_constraints(schedule)
+
+    def test_optimized_timetable_is_saved_as_a_clash_free_copy(self):
+        timetable, divisions, faculty, rooms, subjects = make_department(lectures=4)
+        faculty[0].unavailable_slots = 1 << availability_bit('MON', 2) | 1 << availability_bit('TUE', 2)
+        faculty[0].save()
+        # Gaps on both days, and the same subject twice on Monday
+        for day, lecture, division, subject, teacher in [
+                ('MON', 1, 0, 0, 0), ('MON', 4, 0, 0, 0), ('MON', 1, 1, 1, 1), ('MON', 3, 1, 2, 2),
+                ('TUE', 1, 0, 1, 1), ('TUE', 4, 0, 2, 0), ('TUE', 1, 1, 0, 0), ('TUE', 4, 1, 1, 1)]:
+            add_entry(timetable, day, lecture, divisions[division], subjects[subject], faculty[teacher],
+                      rooms[(lecture + division) % len(rooms)])
+        before = cells(timetable)
+        count = Timetable.objects.count()
+
+        result = optimize_timetable(timetable, iterations=3000, seed=1)
+        self.assertLess(result.after, result.before)
+        self.assertIsNotNone(result.timetable)
+        self.assertEqual(Timetable.objects.count(), count + 1)
+        self.assertFalse(result.timetable.is_active)
+        self.assertEqual(cells(timetable), before)
+
+        def lessons(tt):
+            return Counter(TimetableEntry.objects.filter(timetable=tt).values_list(
+                'division__name', 'subject_id', 'faculty_id'))
+        self.assertEqual(lessons(result.timetable), lessons(timetable))
+        self.assertEqual(OccupancyIndex(result.timetable).clashes(), [])
+        taught = TimetableEntry.objects.filter(timetable=result.timetable, faculty=faculty[0])
+        self.assertFalse(taught.filter(day__in=['MON', 'TUE'], timeslot__lecture_number=2).exists())
 
-# Create your tests here.
+    def test_no_improvement_saves_nothing(self):
+        timetable, divisions, faculty, rooms, subjects = make_department()
+        add_entry(timetable, 'MON', 1, divisions[0], subjects[0], faculty[0], rooms[0])
+        count = Timetable.objects.count()
+        result = optimize_timetable(timetable, iterations=500, seed=1)
+        self.assertEqual((result.before, result.after), (0, 0))
+        self.assertIsNone(result.timetable)
+        result = optimize_timetable(timetable, iterations=0)
+        self.assertIsNone(result.timetable)
+        self.assertEqual(Timetable.objects.count(), count)
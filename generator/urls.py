@@ -1,13 +1,44 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('timetable/', views.timetable_view, name='timetable'),
     path('timetable/<int:timetable_id>/', views.timetable_view, name='timetable'),
+    path('timetable/<int:timetable_id>/clashes/', views.clash_report, name='clash_report'),
+    path('timetable/<int:timetable_id>/live/', views.live_updates, name='live_updates'),
+    path('timetable/<int:timetable_id>/repair/', views.repair_view, name='repair_timetable'),
+    path('timetable/<int:timetable_id>/batch/', views.batch_edit, name='batch_edit'),
+    path('timetable/<int:timetable_id>/clone/', views.clone_view, name='clone_timetable'),
+    path('diff/<int:old_id>/<int:new_id>/', views.diff_view, name='diff_timetables'),
     path('history/', views.history, name='history'),
+    path('resources/', views.global_resources, name='global_resources'),
+    path('timetable/<int:timetable_id>/loads/', views.load_view, name='loads'),
+    path('timetable/<int:timetable_id>/analytics/', views.analytics_view, name='analytics'),
+    path('faculty/<int:resource_id>/', views.resource_view, {'kind': 'faculty'}, name='faculty_timetable'),
+    path('room/<int:resource_id>/', views.resource_view, {'kind': 'room'}, name='room_timetable'),
+    path('division/<int:resource_id>/', views.resource_view, {'kind': 'division'}, name='division_timetable'),
+    path('faculty/<int:resource_id>/excel/', views.export_resource_excel, {'kind': 'faculty'}, name='export_faculty_excel'),
+    path('room/<int:resource_id>/excel/', views.export_resource_excel, {'kind': 'room'}, name='export_room_excel'),
+    path('division/<int:resource_id>/excel/', views.export_resource_excel, {'kind': 'division'}, name='export_division_excel'),
     path('add/', views.add_entry, name='add_entry'),
     path('setup/', views.setup_view, name='setup'),
+    path('import/', views.import_view, name='import_entries'),
+    path('generate/<int:timetable_id>/', views.generate_view, name='generate'),
     path('export/excel/<int:timetable_id>/', views.export_excel, name='export_excel'),
+    path('export/excel/all/', views.export_excel_all, name='export_excel_all'),
+    path('exports/new/<str:kind>/', views.export_job_create, name='export_job_create'),
+    path('exports/new/<str:kind>/<int:timetable_id>/', views.export_job_create, name='export_job_create'),
+    path('exports/<int:job_id>/', views.export_job_status, name='export_job'),
+    path('exports/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
     path('export/pdf/<int:timetable_id>/', views.export_pdf, name='export_pdf'),
+    path('stats/', views.stats_view, name='request_stats'),
+    path('api/timetables/', api.timetables, name='api_timetables'),
+    path('api/timetables/<int:timetable_id>/', api.timetable_detail, name='api_timetable'),
+    path('api/timetables/<int:timetable_id>/grid/', api.timetable_grid, name='api_timetable_grid'),
+    path('api/timetables/<int:timetable_id>/entries/', api.timetable_entries, name='api_timetable_entries'),
+    path('api/timetables/<int:timetable_id>/available/', api.available_resources, name='api_available'),
+    path('api/faculty/', api.faculty_list, name='api_faculty'),
+    path('api/rooms/', api.room_list, name='api_rooms'),
+    path('api/divisions/', api.division_list, name='api_divisions'),
 ]
@@ -1,79 +1,186 @@
-from django.shortcuts import render, get_object_or_404
-from .models import TimetableEntry, Division, TimeSlot, Faculty, Subject, Room, Timetable
-from .forms import TimetableEntryForm, SetupForm
+from django.shortcuts import aget_object_or_404, render, get_object_or_404
+from asgiref.sync import sync_to_async
+from .models import TimetableEntry, Division, TimeSlot, Faculty, Subject, Room, Timetable, SubjectRequirement, ExportJob
+from .forms import TimetableEntryForm, SetupForm, GenerateForm, ImportForm, RepairForm, HistoryFilterForm
+from .grid import ResourceSchedule, TimetableGrid
+from .exports import (EXCEL_CONTENT_TYPE, PDF_CONTENT_TYPE, render_excel, render_pdf,
+                      write_division_excel, write_schedule_excel, write_timetables_excel)
+from . import cache as render_cache
+from .scheduling import generate_timetable
+from .occupancy import OccupancyIndex
+from .services import clone_timetable, create_timetable_structure
+from .diff import TimetableDiff
+from .history import decode_cursor, history_page, history_queryset
+from .repair import repair_timetable
+from .batch import MAX_CHANGES, apply_changeset
+from .api import columns
+from .global_occupancy import GlobalOccupancy, free_resources, lecture_interval, parse_time
+from . import live
+from .importers import ImportFormatError, import_csv, import_excel
+from .jobs import EXTENSIONS, request_export
+from .loads import load_totals, weekly_load
+from .analytics import TimetableArrays
+from .instrumentation import METRICS, PERCENTILES, stats as request_stats
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import redirect, render
 from django.contrib import messages
-from django.http import HttpResponse
-import datetime
-import openpyxl
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import landscape, letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+from django.core.exceptions import BadRequest
+from django.db import IntegrityError, transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+import json
+import tempfile
 
 def dashboard(request):
     return render(request, 'dashboard.html')
 
-def history(request):
-    timetables = Timetable.objects.all().order_by('-created_at')
-    return render(request, 'history.html', {'timetables': timetables})
+# Templates, openpyxl and reportlab are CPU-bound; async views run them in a
+# worker thread so the event loop keeps serving other requests meanwhile.
+# Pages go through sync_to_async(render) as sessions and messages use the sync ORM.
+def offload(func):
+    return sync_to_async(func, thread_sensitive=False)
 
-def timetable_view(request, timetable_id=None):
+async def history(request):
+    form = HistoryFilterForm(request.GET)
+    filters = form.cleaned_data if form.is_valid() else {}
+    after = request.GET.get('after')
+    if after:
+        try:
+            after = decode_cursor(after)
+        except ValueError:
+            raise BadRequest("Invalid page cursor.")
+    timetables, next_cursor = await sync_to_async(history_page)(history_queryset(**filters), after or None)
+    params = request.GET.copy()
+    params.pop('after', None)
+    next_url = None
+    if next_cursor:
+        params['after'] = next_cursor
+        next_url = f"{request.path}?{params.urlencode()}"
+        params.pop('after')
+    context = {
+        'timetables': timetables,
+        'form': form,
+        'filtered': any(filters.values()),
+        'next_url': next_url,
+        'first_url': f"{request.path}?{params.urlencode()}" if after else None,
+    }
+    return await sync_to_async(render)(request, 'history.html', context)
+
+async def timetable_view(request, timetable_id=None):
     if timetable_id:
-        timetable = get_object_or_404(Timetable, id=timetable_id)
+        timetable = await aget_object_or_404(Timetable, id=timetable_id)
     else:
-        timetable = Timetable.objects.filter(is_active=True).first()
+        timetable = await Timetable.objects.filter(is_active=True).afirst()
         if not timetable:
             # If no active timetable, maybe redirect to setup or show empty
             return redirect('dashboard') # Or render empty
             
-    divisions = Division.objects.filter(timetable=timetable)
-    timeslots = TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number')
-
-    
-    # We want to display days in a specific order:
-    days = [
-        ('MON', 'Monday'),
-        ('TUE', 'Tuesday'),
-        ('WED', 'Wednesday'),
-        ('THU', 'Thursday'),
-        ('FRI', 'Friday'),
-        ('SAT', 'Saturday'),
-    ]
-
-    timetable_data = []
-
-    for day_code, day_name in days:
-        day_slots = []
-        for slot in timeslots:
-            # For each slot, get entries for all divisions
-            slot_entries = {}
-            for div in divisions:
-                entry = TimetableEntry.objects.filter(
-                    timetable=timetable,
-                    day=day_code,
-                    timeslot=slot,
-                    division=div
-                ).first()
-                slot_entries[div.id] = entry
-            
-            day_slots.append({
-                'slot': slot,
-                'entries': slot_entries
-            })
-        
-        timetable_data.append({
-            'day_code': day_code,
-            'day_name': day_name,
-            'slots': day_slots
-        })
+    # Repeat views of an unchanged timetable are served from the render cache;
+    # otherwise one query each for divisions, timeslots and entries
+    grid_html = await render_cache.aget_or_render(timetable, 'html', lambda: arender_grid_html(timetable))
 
     context = {
-        'divisions': divisions,
-        'timetable_data': timetable_data,
+        'grid_html': grid_html,
         'current_timetable': timetable,
     }
-    return render(request, 'timetable.html', context)
+    return await sync_to_async(render)(request, 'timetable.html', context)
+
+RESOURCE_MODELS = {'faculty': Faculty, 'room': Room, 'division': Division}
+
+def resource_timetable(request, kind, resource_id):
+    """Get the resource and the timetable to show it in: its own for a division, else ?timetable= or the active one."""
+    resource = get_object_or_404(RESOURCE_MODELS[kind], id=resource_id)
+    if kind == 'division' and resource.timetable_id:
+        return resource, resource.timetable
+    timetable_id = request.GET.get('timetable', '')
+    if timetable_id.isdigit():
+        return resource, get_object_or_404(Timetable, id=timetable_id)
+    timetable = Timetable.objects.filter(is_active=True).order_by('-created_at').first()
+    if not timetable:
+        raise Http404("No active timetable.")
+    return resource, timetable
+
+def resource_label(kind, resource):
+    return resource.number if kind == 'room' else str(resource)
+
+def resource_view(request, kind, resource_id):
+    resource, timetable = resource_timetable(request, kind, resource_id)
+    return render(request, 'resource_timetable.html', {
+        'kind': kind,
+        'resource': resource,
+        'title': resource_label(kind, resource),
+        'current_timetable': timetable,
+        'schedule': ResourceSchedule(timetable, kind, resource.id),
+        'load': weekly_load(timetable, kind, resource.id),
+    })
+
+def export_resource_excel(request, kind, resource_id):
+    resource, timetable = resource_timetable(request, kind, resource_id)
+    schedule = ResourceSchedule(timetable, kind, resource.id)
+    title = resource_label(kind, resource)
+    # FileResponse keeps only what follows the last slash of a filename
+    filename = f"{timetable.name} - {title}.xlsx".replace('/', '_')
+    return excel_file_response(lambda f: write_schedule_excel(schedule, f, title), filename)
+
+def load_view(request, timetable_id):
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    return render(request, 'loads.html', {
+        'current_timetable': timetable,
+        'tables': [
+            ('Faculty', 'faculty_timetable', load_totals(timetable, 'faculty')),
+            ('Rooms', 'room_timetable', load_totals(timetable, 'room')),
+            ('Divisions', 'division_timetable', load_totals(timetable, 'division')),
+        ],
+    })
+
+def analytics_view(request, timetable_id):
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    report = TimetableArrays(timetable).report()
+    if request.GET.get('format') == 'json':
+        return JsonResponse(report)
+    balance = report['balance']
+    return render(request, 'analytics.html', {
+        'current_timetable': timetable,
+        'report': report,
+        'balance': [
+            ('Faculty hours a week', balance['faculty_hours']),
+            ('Faculty idle gaps a week', balance['faculty_gaps']),
+            ('Division lectures a day', balance['division_lectures_per_day']),
+        ],
+    })
+
+async def live_updates(request, timetable_id):
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held for as long as the page stays open;
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    # Subscribe first: writes committed before the version is read are in it,
+    # later ones arrive as events
+    subscription = live.broker.subscribe(timetable_id)
+    version = await Timetable.objects.filter(id=timetable_id).values_list('version', flat=True).afirst()
+    if version is None:
+        live.broker.unsubscribe(timetable_id, subscription)
+        raise Http404("No such timetable.")
+    response = StreamingHttpResponse(live.event_stream(timetable_id, subscription, version),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def render_grid_html(grid):
+    return mark_safe(render_to_string('timetable_grid.html', {
+        'divisions': grid.divisions,
+        'rows': grid.html_rows(),
+        'version': grid.timetable.version,
+    }).strip())
+
+async def arender_grid_html(timetable):
+    grid = await TimetableGrid.aload(timetable)
+    return await offload(render_grid_html)(grid)
 
 def add_entry(request):
     active_tt = Timetable.objects.filter(is_active=True).order_by('-created_at').first()
@@ -87,74 +194,63 @@ def add_entry(request):
         if form.is_valid():
             entry = form.save(commit=False)
             entry.timetable = active_tt
-            entry.save()
-            messages.success(request, "Entry added successfully!")
-            return redirect('timetable')
+            try:
+                with transaction.atomic():
+                    entry.save()
+            except IntegrityError:
+                # Another request booked the slot after the form checked it
+                form.add_error(None, "The timetable changed while saving: this lecture is now taken. Check it and try again.")
+            else:
+                messages.success(request, "Entry added successfully!")
+                return redirect('timetable')
     else:
         form = TimetableEntryForm(timetable=active_tt)
     
     return render(request, 'entry_form.html', {'form': form})
 
+def batch_edit(request, timetable_id):
+    """GET: the subjects, faculty and rooms to choose from. POST: save a changeset of grid cells."""
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    if request.method != 'POST':
+        return JsonResponse({
+            'subjects': columns(Subject.objects.order_by('code', 'id').values_list('id', 'code'), ('id', 'code')),
+            'faculty': columns(Faculty.objects.order_by('initials', 'id').values_list('id', 'initials'), ('id', 'initials')),
+            'rooms': columns(Room.objects.order_by('number', 'id').values_list('id', 'number'), ('id', 'number')),
+        })
+    try:
+        changes = json.loads(request.body)['changes']
+    except (ValueError, KeyError, TypeError):
+        raise BadRequest("Send a JSON object with a list of changes.")
+    if not isinstance(changes, list) or len(changes) > MAX_CHANGES:
+        raise BadRequest(f"changes must be a list of at most {MAX_CHANGES} cells.")
+    try:
+        result = apply_changeset(timetable, changes)
+    except IntegrityError:
+        # Another request booked one of the slots after the changeset was checked
+        return JsonResponse({'errors': [{'cell': None, 'field': None, 'message':
+                             "The timetable changed while saving. Reload it and try again."}]}, status=409)
+    if result.errors:
+        return JsonResponse({'errors': result.errors}, status=400)
+    timetable.refresh_from_db(fields=['version'])
+    return JsonResponse({
+        'created': result.created, 'updated': result.updated, 'deleted': result.deleted,
+        'version': timetable.version,
+    })
+
 def setup_view(request):
     if request.method == 'POST':
         form = SetupForm(request.POST)
         if form.is_valid():
-            # Create NEW Timetable
-            # Deactivate others? Maybe.
-            Timetable.objects.filter(is_active=True).update(is_active=False)
-            
-            new_tt = Timetable.objects.create(name=f"Timetable {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
-            
-            # Process Divisions
+            # Deactivates the others and writes every row in one transaction
             div_names = [d.strip() for d in form.cleaned_data['divisions'].split(',') if d.strip()]
-            for name in div_names:
-                Division.objects.create(name=name, timetable=new_tt)
-            
-            # Process TimeSlots
-            start_time = form.cleaned_data['start_time']
-            slot_duration = form.cleaned_data['slot_duration']
-            break_duration = form.cleaned_data['break_duration']
-            slots_before = form.cleaned_data['slots_before_break']
-            slots_after = form.cleaned_data['slots_after_break']
-            
-            current_time = datetime.datetime.combine(datetime.date.today(), start_time)
-            lecture_num = 1
-            
-            # First batch of lectures
-            for _ in range(slots_before):
-                end_time = current_time + datetime.timedelta(minutes=slot_duration)
-                TimeSlot.objects.create(
-                    timetable=new_tt,
-                    lecture_number=lecture_num,
-                    start_time=current_time.time(),
-                    end_time=end_time.time()
-                )
-                current_time = end_time
-                lecture_num += 1
-            
-            # Break
-            break_end = current_time + datetime.timedelta(minutes=break_duration)
-            TimeSlot.objects.create(
-                timetable=new_tt,
-                lecture_number=lecture_num, 
-                start_time=current_time.time(),
-                end_time=break_end.time(),
-                is_break=True
+            new_tt = create_timetable_structure(
+                div_names,
+                form.cleaned_data['start_time'],
+                form.cleaned_data['slot_duration'],
+                form.cleaned_data['blocks'],
+                form.cleaned_data['day_blocks'],
             )
-            current_time = break_end
-            
-            # Second batch
-            for _ in range(slots_after):
-                end_time = current_time + datetime.timedelta(minutes=slot_duration)
-                TimeSlot.objects.create(
-                    timetable=new_tt,
-                    lecture_number=lecture_num,
-                    start_time=current_time.time(),
-                    end_time=end_time.time()
-                )
-                current_time = end_time
-                lecture_num += 1
-            
+
             messages.success(request, "New Timetable Structure Generated Successfully!")
             # Redirect to the timetable view with the new ID
             return redirect('timetable', timetable_id=new_tt.id)
@@ -164,89 +260,304 @@ def setup_view(request):
     
     return render(request, 'setup.html', {'form': form})
 
-def export_excel(request, timetable_id):
+@require_POST
+def clone_view(request, timetable_id):
     timetable = get_object_or_404(Timetable, id=timetable_id)
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="{timetable.name}.xlsx"'
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Timetable"
-    
-    # Headers
-    divisions = Division.objects.filter(timetable=timetable)
-    headers = ["Day", "Slot"] + [d.name for d in divisions]
-    ws.append(headers)
-    
-    # Data
-    days = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
-    timeslots = TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number')
-    
-    for day in days:
-        for slot in timeslots:
-            row = [day, f"{slot.start_time.strftime('%H:%M')} - {slot.end_time.strftime('%H:%M')}"]
-            if slot.is_break:
-                row.append("BREAK")
-                # Merge? simplistic for now
+    clone = clone_timetable(timetable)
+    messages.success(request, f"Copied {timetable.name} with its entries.")
+    return redirect('timetable', timetable_id=clone.id)
+
+def diff_view(request, old_id, new_id):
+    diff = TimetableDiff(get_object_or_404(Timetable, id=old_id), get_object_or_404(Timetable, id=new_id))
+    if request.GET.get('format') == 'json':
+        return JsonResponse(diff.as_dict())
+    return render(request, 'diff.html', {'diff': diff, 'counts': diff.counts()})
+
+def import_view(request):
+    result = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            timetable = form.cleaned_data['timetable']
+            options = {'dry_run': form.cleaned_data['dry_run'], 'clear': form.cleaned_data['clear']}
+            try:
+                if upload.name.lower().endswith('.xlsx'):
+                    result = import_excel(upload, timetable, **options)
+                else:
+                    result = import_csv(upload.file, timetable, **options)
+            except ImportFormatError as e:
+                form.add_error('file', str(e))
             else:
-                for div in divisions:
-                    entry = TimetableEntry.objects.filter(timetable=timetable, day=day, timeslot=slot, division=div).first()
-                    if entry:
-                        cell_val = f"{entry.subject.code}\n{entry.faculty.initials}\n{entry.room.number}"
-                    else:
-                        cell_val = ""
-                    row.append(cell_val)
-            ws.append(row)
-            
-    wb.save(response)
-    return response
+                if not result.error_count and not result.dry_run:
+                    messages.success(request, f"Imported {result.created} entries.")
+                    return redirect('timetable', timetable_id=timetable.id) if timetable else redirect('history')
+    else:
+        form = ImportForm()
+
+    return render(request, 'import.html', {'form': form, 'result': result})
 
-def export_pdf(request, timetable_id):
+def generate_view(request, timetable_id):
     timetable = get_object_or_404(Timetable, id=timetable_id)
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{timetable.name}.pdf"'
-    
-    doc = SimpleDocTemplate(response, pagesize=landscape(letter))
-    elements = []
-    
-    data = []
-    # Headers
-    divisions = list(Division.objects.filter(timetable=timetable))
-    headers = ["Day", "Time"] + [d.name for d in divisions]
-    data.append(headers)
-    
-    # Data
-    days = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
-    timeslots = TimeSlot.objects.filter(timetable=timetable).order_by('lecture_number')
-    
-    for day in days:
-        for slot in timeslots:
-            row = [day, f"{slot.start_time.strftime('%H:%M')}-{slot.end_time.strftime('%H:%M')}"]
-            if slot.is_break:
-                row.extend(["BREAK"] * len(divisions))
+    requirements = SubjectRequirement.objects.filter(division__timetable=timetable)
+
+    if request.method == 'POST':
+        form = GenerateForm(request.POST)
+        if form.is_valid():
+            solution = generate_timetable(
+                timetable,
+                clear=form.cleaned_data['clear_existing'],
+                time_limit=form.cleaned_data['time_limit'],
+            )
+            if solution.conflicts:
+                messages.warning(request, f"Placed {len(solution.placements)} lectures; {solution.conflicts} could not be placed without a clash.")
             else:
-                for div in divisions:
-                    entry = TimetableEntry.objects.filter(timetable=timetable, day=day, timeslot=slot, division=div).first()
-                    if entry:
-                        row.append(f"{entry.subject.code}\n{entry.faculty.initials}\n{entry.room.number}")
-                    else:
-                        row.append("-")
-            data.append(row)
-            
-    # Table Styling
-    t = Table(data)
-    style = TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.grey),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0,0), (-1,0), 12),
-        ('BACKGROUND', (0,1), (-1,-1), colors.beige),
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-        ('FONTSIZE', (0,0), (-1,-1), 8),
-    ])
-    t.setStyle(style)
-    elements.append(t)
-    doc.build(elements)
-    
+                messages.success(request, f"Placed {len(solution.placements)} lectures in {solution.elapsed:.1f}s.")
+            return redirect('timetable', timetable_id=timetable.id)
+    else:
+        form = GenerateForm()
+
+    return render(request, 'generate.html', {
+        'form': form,
+        'current_timetable': timetable,
+        'requirement_count': requirements.count(),
+    })
+
+def repair_view(request, timetable_id):
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    result = None
+    if request.method == 'POST':
+        form = RepairForm(request.POST, timetable=timetable)
+        if form.is_valid():
+            faculty, room = form.cleaned_data['faculty'], form.cleaned_data['room']
+            result = repair_timetable(
+                timetable,
+                faculty_id=faculty.id if faculty else None,
+                blocked=form.cleaned_data['blocked'],
+                room_id=room.id if room else None,
+                dry_run=form.cleaned_data['dry_run'],
+                mark_unavailable=form.cleaned_data['mark_unavailable'],
+            )
+            if result.applied:
+                if result.unresolved:
+                    messages.warning(request, f"Moved {result.changed_entries} lectures; {len(result.unresolved)} could not be moved without a clash.")
+                else:
+                    messages.success(request, f"Moved {result.changed_entries} lectures in {result.elapsed * 1000:.0f} ms.")
+    else:
+        form = RepairForm(timetable=timetable)
+
+    rows = []
+    if result and (result.moves or result.unresolved):
+        entry_ids = {move.entry_id for move in result.moves} | set(result.unresolved)
+        entries = TimetableEntry.objects.filter(id__in=entry_ids).select_related('subject', 'faculty', 'division')
+        labels = {e.id: (e.division.name, e.subject.code if e.subject_id else '', e.faculty.initials if e.faculty_id else '')
+                  for e in entries}
+        lectures = dict(TimeSlot.objects.filter(timetable=timetable).values_list('id', 'lecture_number'))
+        rooms = dict(Room.objects.filter(id__in={m.old[2] for m in result.moves} | {m.new[2] for m in result.moves})
+                     .values_list('id', 'number'))
+
+        def place(day, timeslot_id, room_id):
+            return f"{day} L{lectures.get(timeslot_id, '?')}" + (f", {rooms[room_id]}" if room_id else '')
+
+        for move in result.moves:
+            rows.append({'kind': move.kind, 'entry': labels.get(move.entry_id),
+                         'old': place(*move.old), 'new': place(*move.new)})
+        for entry_id in result.unresolved:
+            rows.append({'kind': 'unresolved', 'entry': labels.get(entry_id), 'old': '', 'new': ''})
+
+    return render(request, 'repair.html', {
+        'form': form,
+        'current_timetable': timetable,
+        'result': result,
+        'rows': rows,
+    })
+
+def global_resources(request):
+    index = GlobalOccupancy.current()
+    day = request.GET.get('day', 'MON')
+    if day not in dict(TimeSlot.DAY_CHOICES):
+        raise BadRequest("Unknown day.")
+    query = None
+    try:
+        lecture = int(request.GET['lecture']) if request.GET.get('lecture') else None
+        if lecture is not None:
+            # A lecture number means that lecture's time in the chosen timetable
+            timetable_id = int(request.GET.get('timetable') or next(iter(index.timetables), 0))
+            interval = lecture_interval(timetable_id, day, lecture)
+            if interval is None:
+                raise BadRequest("No such lecture in that timetable.")
+            query = (day, *interval, lecture)
+        elif request.GET.get('start') and request.GET.get('end'):
+            query = (day, parse_time(request.GET['start']), parse_time(request.GET['end']), None)
+    except ValueError:
+        raise BadRequest("Give a lecture number or start and end times as HH:MM.")
+    # An empty interval would clash with nothing and report everyone free
+    if query and query[2] <= query[1]:
+        raise BadRequest("The end time must be after the start time.")
+    free = free_resources(index, *query) if query else None
+
+    clashes = []
+    if index.clashes:
+        labels = {
+            'faculty': dict(Faculty.objects.filter(id__in={c.resource_id for c in index.clashes if c.kind == 'faculty'}).values_list('id', 'initials')),
+            'room': dict(Room.objects.filter(id__in={c.resource_id for c in index.clashes if c.kind == 'room'}).values_list('id', 'number')),
+        }
+        for clash in index.clashes:
+            clashes.append({
+                'kind': clash.kind, 'id': clash.resource_id, 'label': labels[clash.kind].get(clash.resource_id),
+                'day': clash.day,
+                'bookings': [
+                    {'timetable': timetable_id, 'name': index.timetables.get(timetable_id),
+                     'start': start.strftime('%H:%M'), 'end': end.strftime('%H:%M')}
+                    for timetable_id, start, end in clash.bookings
+                ],
+            })
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'timetables': [{'id': pk, 'name': name} for pk, name in index.timetables.items()],
+            'query': query and {'day': query[0], 'start': query[1].strftime('%H:%M'), 'end': query[2].strftime('%H:%M')},
+            'free': free,
+            'clashes': clashes,
+        })
+    return render(request, 'global_resources.html', {
+        'timetables': index.timetables,
+        'days': TimeSlot.DAY_CHOICES,
+        'params': request.GET,
+        'query': query,
+        'free': free,
+        'clashes': clashes,
+    })
+
+def clash_report(request, timetable_id):
+    timetable = get_object_or_404(Timetable, id=timetable_id)
+    index = OccupancyIndex.for_timetable(timetable)
+    clashes = index.clashes()
+
+    rows = []
+    if clashes:
+        names = {
+            'division': dict(Division.objects.filter(timetable=timetable).values_list('id', 'name')),
+            'faculty': dict(Faculty.objects.filter(id__in={c.resource_id for c in clashes if c.kind == 'faculty'}).values_list('id', 'initials')),
+            'room': dict(Room.objects.filter(id__in={c.resource_id for c in clashes if c.kind == 'room'}).values_list('id', 'number')),
+        }
+        lectures = dict(TimeSlot.objects.filter(timetable=timetable).values_list('id', 'lecture_number'))
+        days = dict(TimeSlot.DAY_CHOICES)
+        entry_divisions = {row[0]: row[3] for row in index.rows}
+        for clash in clashes:
+            rows.append({
+                'kind': clash.kind,
+                'resource': names[clash.kind].get(clash.resource_id),
+                'day': days[clash.day],
+                'lecture_number': lectures.get(clash.timeslot_id),
+                'divisions': [names['division'].get(entry_divisions[pk]) for pk in clash.entry_ids],
+            })
+
+    return render(request, 'clashes.html', {'current_timetable': timetable, 'clashes': rows})
+
+def excel_file_response(write, filename):
+    # Build the workbook in a temporary file and stream it out in chunks;
+    # the file is deleted when the response closes it.
+    f = tempfile.TemporaryFile()
+    write(f)
+    f.seek(0)
+    return FileResponse(f, as_attachment=True, filename=filename, content_type=EXCEL_CONTENT_TYPE)
+
+async def afile_chunks(f, chunk_size=FileResponse.block_size):
+    # Under ASGI, FileResponse would read a plain file in one go
+    read = offload(f.read)
+    while chunk := await read(chunk_size):
+        yield chunk
+
+async def aexcel_file_response(request, write, filename, run=offload):
+    f = tempfile.TemporaryFile()
+    await run(write)(f)
+    f.seek(0)
+    response = FileResponse(f, as_attachment=True, filename=filename, content_type=EXCEL_CONTENT_TYPE)
+    if isinstance(request, ASGIRequest):
+        response.streaming_content = afile_chunks(f)
+    return response
+
+async def export_excel(request, timetable_id):
+    timetable = await aget_object_or_404(Timetable, id=timetable_id)
+    if request.GET.get('layout') == 'divisions':
+        grid = await TimetableGrid.aload(timetable)
+        return await aexcel_file_response(request, lambda f: write_division_excel(grid, f), f"{timetable.name} - divisions.xlsx")
+
+    async def render_xlsx():
+        return await offload(render_excel)(await TimetableGrid.aload(timetable))
+    content = await render_cache.aget_or_render(timetable, 'xlsx', render_xlsx)
+    response = HttpResponse(content, content_type=EXCEL_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{timetable.name}.xlsx"'
     return response
+
+async def export_excel_all(request):
+    timetables = Timetable.objects.order_by('-created_at')
+    # The writer loads one grid at a time itself, so it runs in this
+    # request's sync thread, where its ORM queries belong
+    return await aexcel_file_response(request, lambda f: write_timetables_excel(timetables.iterator(), f),
+                                      "All Timetables.xlsx", run=sync_to_async)
+
+async def export_pdf(request, timetable_id):
+    timetable = await aget_object_or_404(Timetable, id=timetable_id)
+
+    async def render_pdf_bytes():
+        return await offload(render_pdf)(await TimetableGrid.aload(timetable))
+    content = await render_cache.aget_or_render(timetable, 'pdf', render_pdf_bytes)
+    response = HttpResponse(content, content_type=PDF_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{timetable.name}.pdf"'
+    return response
+
+@require_POST
+def export_job_create(request, kind, timetable_id=None):
+    if kind not in EXTENSIONS or (kind == 'xlsx_all') != (timetable_id is None):
+        raise Http404("Unknown export.")
+    timetable = get_object_or_404(Timetable, id=timetable_id) if timetable_id else None
+    job = request_export(kind, timetable)
+    if request.headers.get('Accept', '').startswith('application/json'):
+        return JsonResponse(export_job_payload(job), status=202)
+    return redirect('export_job', job_id=job.id)
+
+def export_job_payload(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': reverse('export_job_download', args=[job.id]) if job.status == 'done' else None,
+    }
+
+def export_job_status(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(export_job_payload(job))
+    return render(request, 'export_job.html', {'job': job})
+
+def export_job_download(request, job_id):
+    job = get_object_or_404(ExportJob.objects.select_related('timetable'), id=job_id, status='done')
+    try:
+        f = open(job.file, 'rb')
+    except FileNotFoundError:
+        raise Http404("Export file is no longer available.")
+    name = job.timetable.name if job.timetable else "All Timetables"
+    if job.kind == 'xlsx_divisions':
+        name = f"{name} - divisions"
+    content_type = PDF_CONTENT_TYPE if job.kind == 'pdf' else EXCEL_CONTENT_TYPE
+    return FileResponse(f, as_attachment=True, filename=f"{name}.{EXTENSIONS[job.kind]}", content_type=content_type)
+
+@staff_member_required
+def stats_view(request):
+    report = request_stats.report()
+    if request.GET.get('format') == 'json':
+        return JsonResponse(report)
+    rows = [
+        {'name': name, 'requests': entry['requests'], 'metrics': [entry[metric] for metric in METRICS]}
+        for name, entry in report.items()
+    ]
+    return render(request, 'stats.html', {
+        'rows': rows,
+        'metrics': METRICS,
+        'percentiles': [f"p{p}" for p in PERCENTILES] + ['max'],
+    })
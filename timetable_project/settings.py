@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "generator.instrumentation.RequestStatsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -73,12 +77,54 @@ WSGI_APPLICATION = "timetable_project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Chosen by DATABASE_ENGINE: "sqlite" (the default) or "postgresql".
+# `python manage.py loadtest` measures concurrent reads and writes against it.
+
+DATABASE_ENGINE = os.environ.get("DATABASE_ENGINE", "sqlite")
+
+if DATABASE_ENGINE == "sqlite":
+    # WAL lets readers keep going while an entry is written, and IMMEDIATE
+    # transactions take the write lock up front, so concurrent writers wait
+    # out the busy timeout (seconds) instead of failing with "database is locked".
+    # Connections close after each request: the async views and the live
+    # update stream run under ASGI, where Django advises against persistent
+    # connections. Set DATABASE_CONN_MAX_AGE for WSGI-only deployments.
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DATABASE_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": int(os.environ.get("DATABASE_CONN_MAX_AGE", 0)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "timeout": int(os.environ.get("DATABASE_BUSY_TIMEOUT", 20)),
+                "transaction_mode": "IMMEDIATE",
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL",
+            },
+        }
     }
-}
+elif DATABASE_ENGINE == "postgresql":
+    # Needs psycopg 3 with its pool: pip install "psycopg[binary,pool]".
+    # The pool keeps connections open, so CONN_MAX_AGE must stay 0.
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DATABASE_NAME", "edusync"),
+            "USER": os.environ.get("DATABASE_USER", ""),
+            "PASSWORD": os.environ.get("DATABASE_PASSWORD", ""),
+            "HOST": os.environ.get("DATABASE_HOST", ""),
+            "PORT": os.environ.get("DATABASE_PORT", ""),
+            "CONN_MAX_AGE": 0,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.environ.get("DATABASE_POOL_MIN_SIZE", 2)),
+                    "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", 10)),
+                    "timeout": 10,
+                },
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DATABASE_ENGINE {DATABASE_ENGINE!r}; use 'sqlite' or 'postgresql'.")
 
 
 # Password validation
@@ -117,3 +163,32 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
+
+
+# Rendered timetable grids and exports, keyed by timetable version.
+# Use {'BACKEND': 'django', 'ALIAS': 'default'} to store them in CACHES instead.
+
+TIMETABLE_RENDER_CACHE = {
+    "BACKEND": "lru",
+    "MAX_ENTRIES": 128,
+}
+
+
+# Background exports (generator.jobs): rendered files and worker threads.
+# EXPORT_WORKERS = 0 renders in the request thread instead. Jobs still queued
+# or running after EXPORT_JOB_TIMEOUT seconds count as lost (e.g. the process
+# restarted) and are started again on the next request.
+
+EXPORT_ROOT = BASE_DIR / "exports"
+EXPORT_WORKERS = 2
+EXPORT_JOB_TIMEOUT = 600
+
+
+# Per-view query/latency stats (generator.instrumentation), shown at /stats/.
+# Requests slower than SLOW_REQUEST_MS are logged with their repeated queries.
+
+REQUEST_STATS = {
+    "WINDOW": 500,
+    "SLOW_REQUEST_MS": 1000,
+    "TOP_QUERIES": 5,
+}